@@ -21,9 +21,29 @@ UltraSonicDistanceSensor backSensor(BACKSENSORTRIG,BACKSENSORECHO);
 
 
 
+/*
+Protocol v2: the camera writes a mask of the fields it reads (bit 0 front,
+bit 1 back, bits 2 to 5 the line sensors), then reads the answer with a
+repeated start. The answer is VERSION, the mask, the number of measures of
+the distances, the age (ms) of the oldest distance of the mask, the fields
+of the mask, then the CRC-8 of all that (big-endian). A read without a mask
+before it is answered the six fields of the protocol v1.
+*/
+#define VERSION 0x82
+#define FIELDS 6
+#define HEADER 6
+
+volatile int frontDistance = 0;
+volatile int backDistance = 0;
+volatile unsigned long frontTime = 0;  // millis() of the last measures
+volatile unsigned long backTime = 0;
+volatile unsigned int measures = 0;
+volatile int mask = -1;  // the fields of the next answer, -1 for the v1
+
 void setup()
 {
     Wire.begin(THISADRESS);
+    Wire.onReceive(ReceiveMask); //when a mask is written, it is kept for the next request
     Wire.onRequest(SendData); //when a request is received, We call SendData
 
     Serial.begin(9600);
@@ -32,28 +52,100 @@ void setup()
     digitalWrite(8,HIGH); //pin through which the ultrasonic sensors are powered (5V)
 }
 
+/*
+The ultrasonic sensors take up to 30 ms each to measure: they are measured
+here, one after the other, and the last distances are answered. The line
+sensors are read on each request, the camera samples them every 4 ms.
+*/
 void loop()
 {   
-    PrintSensorsData(); 
-    delay(3000);
+    int front = frontSensor.measureDistanceCm();
+    noInterrupts();
+    frontDistance = front;
+    frontTime = millis();
+    measures++;
+    interrupts();
+
+    int back = backSensor.measureDistanceCm();
+    noInterrupts();
+    backDistance = back;
+    backTime = millis();
+    measures++;
+    interrupts();
+}
+
+
+void ReceiveMask(int count)
+{
+    while(Wire.available() > 1)
+    {
+        Wire.read();
+    }
+    mask = Wire.available() ? Wire.read() : -1;
 }
 
 
 void SendData()
 {
-    SendInt(frontSensor.measureDistanceCm());
-    SendInt(backSensor.measureDistanceCm());
+    byte buffer[HEADER + 2 * FIELDS + 1];
+    int size = 0;
 
-    for(int i = 0; i < 4 ; i++)
+    if(mask < 0) // protocol v1
+    {
+        PutInt(buffer, 0, frontDistance);
+        PutInt(buffer, 2, backDistance);
+        for(int i = 0; i < 4 ; i++)
+        {
+            PutInt(buffer, 4 + 2 * i, analogRead(i));
+        }
+        Wire.write(buffer, 2 * FIELDS); // a single write, answered at once
+        return;
+    }
+    unsigned long now = millis();
+    unsigned long age = 0;
+    if(mask & 0x01)
     {
-        SendInt(analogRead(i));
+        age = now - frontTime;
     }
+    if((mask & 0x02) && now - backTime > age)
+    {
+        age = now - backTime;
+    }
+    buffer[0] = VERSION;
+    buffer[1] = (byte)mask;
+    PutInt(buffer, 2, measures);
+    PutInt(buffer, 4, age > 0xFFFF ? 0xFFFF : age);
+    size = HEADER;
+    for(int i = 0; i < FIELDS; i++)
+    {
+        if(mask & (1 << i))
+        {
+            // Only the lines of the mask are converted, 0.1 ms each
+            PutInt(buffer, size, i == 0 ? frontDistance : i == 1 ? backDistance : analogRead(i - 2));
+            size += 2;
+        }
+    }
+    buffer[size] = Crc8(buffer, size);
+    Wire.write(buffer, size + 1);
+    mask = -1;
+}
 
-    Serial.println("On request\n");
+byte Crc8(byte *buffer, int size)
+{
+    byte crc = 0;
+    for(int i = 0; i < size; i++)
+    {
+        crc ^= buffer[i];
+        for(int bit = 0; bit < 8; bit++)
+        {
+            crc = crc & 0x80 ? (crc << 1) ^ 0x07 : crc << 1;
+        }
+    }
+    return crc;
 }
 
-void SendInt(int i)
+void PutInt(byte *buffer, int offset, int i)
 {
-    Wire.write((byte)highByte(i));
-    Wire.write((byte)lowByte(i));
+    buffer[offset] = (byte)highByte(i);
+    buffer[offset + 1] = (byte)lowByte(i);
 }
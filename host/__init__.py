@@ -0,0 +1,10 @@
+"""Host-side (CPython) tools to run, benchmark and analyse the firmware.
+
+Importing this package makes the firmware (``openmv_cam``) and the
+stand-in modules for ``pyb``, ``sensor``, ``image``, ``uasyncio``,
+``ustruct`` and ``utime`` (``host/stubs``) importable.
+"""
+
+from host.harness import install
+
+install()
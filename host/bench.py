@@ -0,0 +1,238 @@
+"""Benchmarks the control loop of the firmware on the host.
+
+Runs ``robot.main()`` on a simulated board for a number of frames and
+reports the latency of each iteration (time between two snapshots) and the
+number of memory blocks allocated during each iteration.
+
+Usage:
+    python -m host.bench [--frames 250] [--recording PATH] [--size 320x240]
+                         [--latency-scale 1.0] [--seed 0] [--debug] [--trace]
+                         [--json]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+
+from host.harness import Board
+from host.sources import RecordedSource, SyntheticSource
+
+
+def percentile(values: list, q: float) -> float:
+    """Returns the q-th percentile (nearest rank) of values."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class FrameProbe:
+    """A sensor frame hook that times the control loop, frame by frame.
+
+    Attributes:
+        latencies: duration (ms) of each iteration
+        allocations: net number of memory blocks allocated by each iteration
+        done: set once the number of frames has been measured
+    """
+
+    def __init__(self, frames: int):
+        self.frames = frames
+        self.latencies = []
+        self.allocations = []
+        self.done = asyncio.Event()
+        self._last = None
+
+    def __call__(self, img) -> None:
+        now, blocks = time.perf_counter(), sys.getallocatedblocks()
+        if self._last is not None and not self.done.is_set():
+            self.latencies.append((now - self._last[0]) * 1000)
+            self.allocations.append(blocks - self._last[1])
+            if len(self.latencies) >= self.frames:
+                self.done.set()
+        self._last = (now, blocks)
+
+
+async def _until_done(main, probe: FrameProbe) -> None:
+    task = asyncio.create_task(main())
+    waiter = asyncio.create_task(probe.done.wait())
+    await asyncio.wait((task, waiter), return_when=asyncio.FIRST_COMPLETED)
+    for pending in (task, waiter):
+        pending.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def summarize(values: list) -> dict:
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def run(frames: int = 250, board: Board = None, main=None, trace: bool = False) -> dict:
+    """Runs the main loop (robot.main by default) for a number of frames.
+
+    Args:
+        trace: enables the firmware's tracing probes, reported as spans
+
+    Returns:
+        A report with latency (ms) and allocation statistics per frame.
+    """
+    import bus
+    import pyb
+    import sensor
+    import utils
+    from tracing import tracer
+
+    board = board if board is not None else Board()
+    camera = None
+    if main is None:
+        import robot
+
+        bot = robot.Robot()
+        camera = bot.camera
+
+        def main():
+            return robot.main(bot)
+
+    tracer.enabled = trace
+    tracer.reset()
+    probe = FrameProbe(frames)
+    sensor.frame_hooks.append(probe)
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    try:
+        asyncio.run(_until_done(main, probe))
+    finally:
+        sensor.frame_hooks.remove(probe)
+    if not probe.latencies:
+        raise RuntimeError("The main loop did not take any snapshot")
+    transfers = sum(len(wire.traffic) for wire in pyb.Bus.BUSES.values())
+    motors = bus.I2CBus(4)
+    report = {
+        "frames": len(probe.latencies),
+        "fps": 1000 * len(probe.latencies) / sum(probe.latencies),
+        "latency_ms": summarize(probe.latencies),
+        "alloc_blocks": summarize(probe.allocations),
+        "gc_collections": sum(stat["collections"] for stat in gc.get_stats())
+        - collections,
+        "i2c_transfers_per_frame": transfers / len(probe.latencies),
+        "motor_errors": board.motors.errors,
+        "motor_dropped": board.motors.dropped,
+        "motor_frames": motors.sent,
+        "motor_coalesced": motors.coalesced,
+        "motor_latency_us": {
+            "mean": motors.latency_mean_us(),
+            "max": motors.latency_max_us,
+        },
+    }
+    timers = utils.TimerService()
+    report["timers"] = {
+        "fired": timers.fired,
+        "live": timers.live,
+        "latency_mean_ms": timers.latency_mean_ms(),
+        "latency_max_ms": timers.latency_max_ms,
+    }
+    if trace:
+        report["spans"] = {
+            name: {
+                "calls": tracer.calls(span),
+                "mean_us": tracer.mean_us(span),
+                "max_us": tracer.max_us(span),
+            }
+            for span, name in enumerate(tracer.spans)
+        }
+    if camera is not None:
+        report["ball_search"] = {
+            "hits": camera.hits,
+            "misses": camera.misses,
+            "fallbacks": camera.fallbacks,
+            "frame_size_switches": camera.switches,
+            "detect_us_max": camera.detect_us_max,
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print("frames: {frames}  ({fps:.1f} FPS)".format(**report))
+    for key, unit in (("latency_ms", "ms"), ("alloc_blocks", "blocks")):
+        stats = report[key]
+        print(
+            "{:<14} mean {:8.2f}  p50 {:8.2f}  p90 {:8.2f}  p99 {:8.2f}  max {:8.2f} {}".format(
+                key,
+                stats["mean"],
+                stats["p50"],
+                stats["p90"],
+                stats["p99"],
+                stats["max"],
+                unit,
+            )
+        )
+    print("gc collections: {gc_collections}".format(**report))
+    print("i2c transfers/frame: {i2c_transfers_per_frame:.2f}".format(**report))
+    print(
+        "motor frames: {motor_frames} sent, {motor_coalesced} coalesced, "
+        "{motor_errors} invalid, {motor_dropped} dropped".format(**report)
+    )
+    print(
+        "motor command-to-wire latency: mean {mean:.0f} us, max {max} us".format(
+            **report["motor_latency_us"]
+        )
+    )
+    print(
+        "timers: {fired} fired, {live} live, latency mean {latency_mean_ms:.1f} ms, "
+        "max {latency_max_ms} ms".format(**report["timers"])
+    )
+    if "ball_search" in report:
+        print(
+            "ball search in ROI: {hits} hits, {misses} misses, {fallbacks} "
+            "fallbacks, longest {detect_us_max} us, {frame_size_switches} frame "
+            "size switches".format(**report["ball_search"])
+        )
+    for name, span in report.get("spans", {}).items():
+        print(
+            "span {:<12} {calls:6d} calls  mean {mean_us:6d} us  max {max_us:6d} us".format(
+                name, **span
+            )
+        )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=250)
+    parser.add_argument("--recording", help="PPM directory or raw RGB565 file")
+    parser.add_argument("--size", default="320x240", help="size of raw frames")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--debug", action="store_true", help="emulate OpenMV IDE")
+    parser.add_argument("--trace", action="store_true", help="enable the probes")
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    if args.recording:
+        width, height = (int(value) for value in args.size.split("x"))
+        source = RecordedSource(args.recording, (width, height))
+    else:
+        source = SyntheticSource(args.seed)
+    board = Board(source, latency_scale=args.latency_scale, debug=args.debug)
+    if args.debug:
+        import ulogging as logging
+
+        root = logging.Logger("root")
+        root.add_handler(logging.StreamHandler())
+        root.set_level("DEBUG")
+    report = run(args.frames, board, trace=args.trace)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmarks the startup of the firmware: the time to the first decision.
+
+Each run starts like the camera after a reset: the firmware is imported
+again, after a ``BootTimer`` is created as in boot.py, then ``robot.main()``
+runs on a new simulated board until it logs the boot report, after its
+first decision. The Arduino only answers ``--arduino-boot`` ms after the
+board is powered (its bootloader and setup()).
+
+The runs are done with the I2C devices probed while the camera settles
+(``Robot.PARALLEL_BOOT``), then one step after the other. The report has
+the time to the first decision and the duration of each phase (ms).
+
+The imports are timed on CPython: on the camera they are longer, the
+sources are compiled unless they are precompiled (see ``host.freeze``).
+
+Usage:
+    python -m host.bench_boot [--runs 5] [--arduino-boot 300]
+                              [--latency-scale 1.0] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from host.bench import summarize
+from host.harness import FIRMWARE, Board
+
+MODULES = sorted(path.stem for path in FIRMWARE.glob("*.py"))
+
+
+async def _boot(parallel: bool, arduino_boot: float):
+    import pyb
+
+    # The Arduino is powered with the board, but answers later
+    wire = pyb.Bus(2)
+    arduino = wire.devices.pop(0x10)
+    asyncio.get_running_loop().call_later(
+        arduino_boot / 1000, wire.attach, 0x10, arduino
+    )
+    for name in MODULES:
+        sys.modules.pop(name, None)
+    from startup import BootTimer
+
+    boot = BootTimer()
+    import robot
+
+    boot.mark("imports")
+    robot.Robot.PARALLEL_BOOT = parallel
+    main = asyncio.create_task(robot.main(boot=boot))
+    try:
+        while not boot.finished and not main.done():
+            await asyncio.sleep(0.001)
+    finally:
+        main.cancel()
+        try:
+            await main
+        except asyncio.CancelledError:
+            pass
+    return boot
+
+
+def boot_once(
+    parallel: bool = True, arduino_boot: float = 300, latency_scale: float = 1.0
+):
+    """Boots the firmware once on a new board.
+
+    Returns:
+        the BootTimer of the run
+    """
+    import pyb
+
+    Board(latency_scale=latency_scale)
+    try:
+        boot = asyncio.run(_boot(parallel, arduino_boot))
+    finally:
+        pyb.Timer.deinit_all()
+    if not boot.finished:
+        raise RuntimeError("The main loop did not take a decision")
+    return boot
+
+
+def run(runs: int = 5, arduino_boot: float = 300, latency_scale: float = 1.0) -> dict:
+    """Boots the firmware a number of times, in parallel then in sequence.
+
+    Returns:
+        for each mode, the time to the first decision and the phases (ms)
+    """
+    report = {}
+    for mode, parallel in (("parallel", True), ("sequential", False)):
+        totals, phases = [], {}
+        for _ in range(runs):
+            boot = boot_once(parallel, arduino_boot, latency_scale)
+            totals.append(max(end for _, _, end in boot.phases) / 1000)
+            for name, start, end in boot.phases:
+                phases.setdefault(name, []).append((end - start) / 1000)
+        report[mode] = {
+            "first_decision_ms": summarize(totals),
+            "phases_ms": {
+                name: sum(values) / len(values) for name, values in phases.items()
+            },
+        }
+    report["arduino_boot_ms"] = arduino_boot
+    return report
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="boots per mode")
+    parser.add_argument(
+        "--arduino-boot", type=float, default=300, help="ms before the Arduino answers"
+    )
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    report = run(args.runs, args.arduino_boot, args.latency_scale)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for mode in ("parallel", "sequential"):
+        print(
+            "{:>10}: first decision mean {mean:.1f}  p50 {p50:.1f}  max {max:.1f} ms".format(
+                mode, **report[mode]["first_decision_ms"]
+            )
+        )
+        print(
+            "            "
+            + "  ".join(
+                "{} {:.1f}".format(name, value)
+                for name, value in report[mode]["phases_ms"].items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
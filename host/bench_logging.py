@@ -0,0 +1,65 @@
+"""Micro-benchmark of ulogging.
+
+Reports the time and the memory allocated per record (see
+``host/microbench.py``) for records rejected by the logger's level, records
+no handler accepts, and records written to a handler that discards them.
+On the OpenMV Cam, copy this file and ``microbench.py`` next to
+``ulogging.py`` and run it from the IDE.
+
+Usage:
+    python -m host.bench_logging [--records 10000]
+"""
+
+try:
+    import host  # noqa: F401 (makes the firmware importable on CPython)
+    from host.microbench import MICROPYTHON, compare
+except ImportError:  # running on the camera
+    from microbench import MICROPYTHON, compare
+
+import ulogging as logging
+
+
+class NullHandler(logging.Handler):
+    """Formats the records like the other handlers, but writes nothing."""
+
+    def __init__(self):
+        super().__init__()
+        self.formatter = "{level}: {name} (+{time}s) -> {message}"
+        self.written = 0
+
+    def write(self, content: str) -> None:
+        self.written += 1
+
+
+def main(records: int = 10000) -> None:
+    root = logging.Logger("root")
+    handler = NullHandler()
+    root.add_handler(handler)
+    logger = logging.Logger("bench")
+    logger.set_level("INFO")
+    quiet = logging.Logger("bench.quiet")  # its level accepts DEBUG, no handler does
+    quiet.set_level("DEBUG")
+    quiet.propagate = False
+    angles = list(range(8))
+    compare(
+        (
+            ("suppressed", lambda angle: logger.debug("angle: {}", angle)),
+            ("unhandled", lambda angle: quiet.debug("angle: {}", angle)),
+            ("emitted", lambda angle: logger.info("angle: {}", angle)),
+        ),
+        records,
+        angles,
+    )
+    if handler.written != records:
+        raise AssertionError("{} records written".format(handler.written))
+
+
+if __name__ == "__main__":
+    if MICROPYTHON:
+        main(1000)
+    else:
+        import argparse
+
+        parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+        parser.add_argument("--records", type=int, default=10000)
+        main(parser.parse_args().records)
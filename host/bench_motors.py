@@ -0,0 +1,62 @@
+"""Micro-benchmark of the motor frame encoder.
+
+Encodes speed commands with the former list-based encoder and with
+``motors.Frame``, and reports the time and the memory allocated per command
+(see ``host/microbench.py``). It fails if ``Frame.encode`` allocates: on the
+OpenMV Cam, copy this file and ``microbench.py`` next to ``motors.py`` and
+run it from the IDE, every allocated byte is counted there.
+
+Usage:
+    python -m host.bench_motors [--commands 10000]
+"""
+
+try:
+    import host  # noqa: F401 (makes the firmware importable on CPython)
+    from host.microbench import MICROPYTHON, allocations, compare
+except ImportError:  # running on the camera
+    from microbench import MICROPYTHON, allocations, compare
+
+import ustruct as struct
+import motors
+from motors import Frame, Motor
+
+
+def legacy_encode(slot: int, speed: float) -> bytearray:
+    """The encoder Motor used to have: lists concatenated for each frame."""
+    data = [slot, Motor.CMD_MOVE_SPD] + list(struct.pack("f", speed))
+    lrc = 0
+    for byte in data:
+        lrc ^= byte
+    trame = [0xA5, 0x01] + list(struct.pack("l", len(data))) + data + [lrc, Motor.END]
+    return bytearray(trame)
+
+
+def main(commands: int = 10000) -> None:
+    # Preallocated speeds: creating a float allocates on MicroPython
+    speeds = [-200.0, -150.0, -100.0, -1.5, 0.0, 1.5, 100.0, 200.0]
+    frame = Frame(1, Motor.CMD_MOVE_SPD, Motor.COMMANDS[Motor.CMD_MOVE_SPD])
+    for speed in speeds:
+        if bytes(frame.encode(speed)) != bytes(legacy_encode(1, speed)):
+            raise AssertionError("Frame differs from the legacy encoder")
+    compare(
+        (("legacy", lambda speed: legacy_encode(1, speed)), ("frame", frame.encode)),
+        commands,
+        speeds,
+    )
+    allocated = allocations(frame.encode, commands, speeds, motors.__file__)
+    if allocated:
+        raise SystemExit(
+            "Frame.encode allocated {} bytes in {} commands".format(allocated, commands)
+        )
+    print("Frame.encode: no allocation in {} commands".format(commands))
+
+
+if __name__ == "__main__":
+    if MICROPYTHON:
+        main(1000)
+    else:
+        import argparse
+
+        parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+        parser.add_argument("--commands", type=int, default=10000)
+        main(parser.parse_args().commands)
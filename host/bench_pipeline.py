@@ -0,0 +1,121 @@
+"""Benchmarks the control loop with the capture pipelined in framebuffers.
+
+Runs ``robot.main()`` on a simulated board for a number of frames, in
+two modes:
+
+- ``sequential``: the sensor reads each frame out when it is asked (one
+  framebuffer);
+- ``framebuffers``: the sensor captures the next frames in ``FRAMEBUFFERS``
+  buffers while a frame is processed (``Robot.FRAMEBUFFERS``).
+
+The loop is paced at ``--period`` ms, 0 runs it as fast as it can. For each
+mode, the report has the frames per second, the latency from the frame in
+hand to its motor command recorded by the firmware (``Scheduler.command``),
+and the age of the frame when it is in hand (from the end of its capture,
+measured by the sensor stand-in): their sum is the latency from the
+capture to the command.
+
+Usage:
+    python -m host.bench_pipeline [--frames 250] [--period 40]
+                                  [--latency-scale 1.0] [--seed 0] [--json]
+"""
+
+import argparse
+import json
+
+from host import bench
+from host.harness import Board
+from host.sources import SyntheticSource
+
+MODES = ("sequential", "framebuffers")
+FRAMEBUFFERS = 3
+
+
+class FrameAge:
+    """A sensor frame hook that records the age (us) of each frame returned."""
+
+    def __init__(self):
+        self.ages = []
+
+    def __call__(self, img) -> None:
+        import utime
+
+        self.ages.append(utime.ticks_diff(utime.ticks_us(), img.captured_us))
+
+
+def run_mode(
+    mode: str,
+    frames: int = 250,
+    period: int = 40,
+    latency_scale: float = 1.0,
+    seed: int = 0,
+) -> dict:
+    """Runs robot.main in a mode for a number of frames.
+
+    Returns:
+        the fps, the latencies (us) of the frames and the number commanded
+    """
+    board = Board(SyntheticSource(seed), latency_scale=latency_scale)
+    import robot
+    import sensor
+    from scheduler import Scheduler
+
+    robot.Robot.FRAMEBUFFERS = FRAMEBUFFERS if mode == "framebuffers" else 1
+    bot = robot.Robot()
+    scheduler = Scheduler(period)
+    age = FrameAge()
+    sensor.frame_hooks.append(age)
+    try:
+        report = bench.run(
+            frames, board, main=lambda: robot.main(bot, scheduler=scheduler)
+        )
+    finally:
+        sensor.frame_hooks.remove(age)
+        robot.Robot.FRAMEBUFFERS = 1
+    kept = min(scheduler.commands, len(scheduler.latencies))
+    latencies = list(scheduler.latencies[:kept])
+    ages = age.ages
+    return {
+        "fps": report["fps"],
+        "frames": scheduler.iterations,
+        "commanded": scheduler.commands,
+        "in_hand_to_command_us": bench.summarize(latencies),
+        "frame_age_us": bench.summarize(ages),
+        "capture_to_command_us": scheduler.latency_mean_us() + sum(ages) / len(ages),
+    }
+
+
+def run(
+    frames: int = 250, period: int = 40, latency_scale: float = 1.0, seed: int = 0
+) -> dict:
+    """Runs every mode."""
+    return {mode: run_mode(mode, frames, period, latency_scale, seed) for mode in MODES}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=250)
+    parser.add_argument("--period", type=int, default=40, help="ms, 0 is unpaced")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    report = run(args.frames, args.period, args.latency_scale, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for mode, result in report.items():
+        print(
+            "{:>13}: {fps:5.1f} FPS, {commanded} of {frames} frames commanded, "
+            "capture to command {capture_to_command_us:.0f} us".format(mode, **result)
+        )
+        for key in ("in_hand_to_command_us", "frame_age_us"):
+            print(
+                "               {:<22} mean {mean:7.0f}  p50 {p50:7.0f}  "
+                "p99 {p99:7.0f}  max {max:7.0f}".format(key, **result[key])
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Benchmarks the reaction of the robot to the line of the field on the host.
+
+Runs ``robot.main()`` on a simulated board and, at random times, makes the
+front left line sensor of the Arduino see the line from another thread, so
+that the crossings happen anywhere in the iterations of the main loop. For
+each crossing, the reaction is the time until the encoder driver receives
+the first frame of the retreat of ``safety.LineGuard``, and the time until
+it receives both (they are spaced by the gap the driver needs). A retreat
+is missed if it doesn't reach both motors, or if another command overrides
+it. The commands that went out between the crossing and the retreat, before
+the guard sampled the line, are counted apart.
+
+Usage:
+    python -m host.bench_safety [--crossings 20] [--latency-scale 1.0]
+                                [--seed 0] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+from host.bench import summarize
+from host.harness import Board
+
+LINE = 900  # value of a line sensor that sees the line
+FIELD = 120
+
+
+async def _scenario(board: Board, bot, crossings: int, seed: int) -> list:
+    """Crosses the line a number of times.
+
+    Returns:
+        (first, both, preceded) for each crossing: the times (ms) of the
+        retreat, and whether a command went out before it. None if missed
+    """
+    import robot
+
+    rng = random.Random(seed)
+    arduino, motors = board.arduino, board.motors
+    main = asyncio.create_task(robot.main(bot))
+    reactions = []
+    try:
+        await asyncio.sleep(0.5)
+        for _ in range(crossings):
+            crossed = []
+
+            def cross():
+                crossed.append(time.perf_counter())
+                arduino.lines[0] = LINE
+
+            threading.Timer(rng.uniform(0.05, 0.3), cross).start()
+            while not crossed:
+                await asyncio.sleep(0.005)
+            await asyncio.sleep(bot.guard.RETREAT_MS / 2000)
+            # The retreat of each motor after the crossing: nothing may
+            # override it, the commands that went out before it are counted
+            retreat = {
+                bot.lmotor.slot: bot.guard.lspeed,
+                bot.rmotor.slot: bot.guard.rspeed,
+            }
+            times = {}
+            overridden = before = False
+            for stamp, slot, speed in list(motors.history):
+                if stamp < crossed[0]:
+                    continue
+                if speed == retreat[slot]:
+                    times.setdefault(slot, (stamp - crossed[0]) * 1000)
+                elif slot in times:
+                    overridden = True
+                else:
+                    before = True
+            if len(times) == 2 and not overridden:
+                reactions.append((min(times.values()), max(times.values()), before))
+            else:
+                reactions.append(None)
+            arduino.lines[0] = FIELD
+            while bot.guard.active:
+                await asyncio.sleep(0.01)
+    finally:
+        main.cancel()
+        try:
+            await main
+        except asyncio.CancelledError:
+            pass
+        bot.guard.stop()
+    return reactions
+
+
+def run(crossings: int = 20, board: Board = None, seed: int = 0) -> dict:
+    """Crosses the line a number of times while robot.main runs.
+
+    Returns:
+        A report with the reaction times measured on the host and by the guard
+    """
+    board = board if board is not None else Board()
+    import robot
+
+    bot = robot.Robot()
+    reactions = asyncio.run(_scenario(board, bot, crossings, seed))
+    reacted = [reaction for reaction in reactions if reaction is not None]
+    guard = bot.guard
+    report = {
+        "crossings": crossings,
+        "retreats": len(reacted),
+        "sample_period_ms": 1000 / guard.RATE,
+        "preceded": sum(1 for _, _, before in reacted if before),
+        "reaction_ms": (
+            summarize([first for first, _, _ in reacted]) if reacted else None
+        ),
+        "both_motors_ms": (
+            summarize([both for _, both, _ in reacted]) if reacted else None
+        ),
+        "guard_latency_us": {
+            "mean": guard.latency_mean_us(),
+            "max": guard.latency_max_us,
+        },
+        "samples": guard.samples,
+        "overruns": guard.overruns,
+        "frames_dropped_while_held": bot.lmotor.bus.dropped,
+    }
+    return report
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--crossings", type=int, default=20)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    report = run(args.crossings, Board(latency_scale=args.latency_scale), args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        "retreats: {retreats}/{crossings}, {preceded} preceded by a command "
+        "sent before the line was sampled".format(**report)
+    )
+    for key, label in (
+        ("reaction_ms", "first motor"),
+        ("both_motors_ms", "both motors"),
+    ):
+        if report[key]:
+            print(
+                "line to {}: mean {mean:.1f}  p50 {p50:.1f}  p90 {p90:.1f}  "
+                "max {max:.1f} ms".format(label, **report[key])
+            )
+    print(
+        "guard (interrupt to motors) mean {mean:.0f} us, max {max} us".format(
+            **report["guard_latency_us"]
+        )
+    )
+    print(
+        "samples: {samples} ({sample_period_ms:.0f} ms period), {overruns} overruns, "
+        "{frames_dropped_while_held} frames dropped while held".format(**report)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Benchmarks the protocols of the Arduino against its stand-in.
+
+``sensors.Sensor`` polls a ``host.devices.ArduinoSensors`` that answers
+the protocol v1 (six fields) or v2 (a mask of fields, a header and a
+CRC-8, see arduino/sensor.ino). For each protocol, the report has:
+
+- the host time and the net memory blocks of a poll, the modelled I2C
+  time of a poll and of a sample of the line guard (only the lines in v2);
+- the corrupted answers: one bit of some answers is flipped on the wire,
+  the samples accepted with wrong values are counted;
+- a stall of the loop of the Arduino (its distances aren't measured
+  anymore): the samples flagged duplicate or stale.
+
+Usage:
+    python -m host.bench_sensors [--polls 10000] [--error-rate 0.05]
+                                 [--seed 0] [--json]
+"""
+
+import argparse
+import collections
+import json
+import random
+import struct
+import sys
+import time
+
+from host.devices import ArduinoSensors
+from host.harness import Board
+
+
+class NoisyWire:
+    """A slave whose answers have one bit flipped, at a given rate.
+
+    Attributes:
+        clean: the last answer, as sent by the slave
+        flipped: number of answers corrupted
+    """
+
+    def __init__(self, device, rate: float, rng: random.Random):
+        self.device = device
+        self.rate = rate
+        self.rng = rng
+        self.clean = b""
+        self.flipped = 0
+
+    def write(self, data: bytes) -> None:
+        self.device.write(data)
+
+    def read(self, nbytes: int) -> bytes:
+        self.clean = self.device.read(nbytes)
+        if self.rng.random() >= self.rate:
+            return self.clean
+        self.flipped += 1
+        data = bytearray(self.clean)
+        bit = self.rng.randrange(8 * len(data))
+        data[bit // 8] ^= 1 << (bit % 8)
+        return bytes(data)
+
+
+def _sensor(device):
+    """Returns a Sensor polling the device, its protocol detected."""
+    Board(latency_scale=1.0, arduino=device)
+    from sensors import Sensor
+
+    sensor = Sensor()
+    if not sensor.poll():
+        raise RuntimeError("The stand-in of the Arduino didn't answer")
+    return sensor
+
+
+def cost(version: int, polls: int) -> dict:
+    """Times the polls of a slave of a protocol version."""
+    import pyb
+    from sensors import Sensor
+
+    sensor = _sensor(ArduinoSensors(version))
+    wire = pyb.Bus(2)
+    wire.traffic = collections.deque(maxlen=1)  # the records of the stand-in
+    blocks, start = sys.getallocatedblocks(), time.perf_counter()
+    for _ in range(polls):
+        sensor.poll()
+    elapsed = time.perf_counter() - start
+    blocks = sys.getallocatedblocks() - blocks
+    if version == 1:
+        poll_us = guard_us = wire.transfer_time_us(2 * Sensor.FIELDS)
+    else:  # the mask, then the answer after a repeated start
+        poll_us = wire.transfer_time_us(Sensor.size(Sensor.ALL) + 2)
+        guard_us = wire.transfer_time_us(Sensor.size(Sensor.LINES) + 2)
+    return {
+        "version": sensor.version,
+        "poll_us": elapsed / polls * 1e6,
+        "alloc_blocks_per_poll": blocks / polls,
+        "wire_poll_us": poll_us,
+        "wire_guard_us": guard_us,
+    }
+
+
+def integrity(version: int, polls: int, rate: float, seed: int) -> dict:
+    """Polls through a noisy wire, counts the wrong samples accepted."""
+    noisy = NoisyWire(ArduinoSensors(version), 0.0, random.Random(seed))
+    sensor = _sensor(noisy)
+    noisy.rate = rate
+    accepted = wrong = 0
+    for _ in range(polls):
+        if not sensor.poll():
+            continue
+        accepted += 1
+        offset = 0 if version == 1 else sensor.HEADER
+        expected = struct.unpack_from(">6H", noisy.clean, offset)
+        if tuple(sensor.samples.get(i) for i in range(sensor.FIELDS)) != expected:
+            wrong += 1
+    return {
+        "corrupted": noisy.flipped,
+        "rejected": sensor.invalid,
+        "accepted": accepted,
+        "wrong_accepted": wrong,
+    }
+
+
+def stall(version: int, stall_s: float = 0.5, rate: int = 50) -> dict:
+    """Polls at rate (Hz) for 2 s of the stand-in's clock, stalled in the middle."""
+    now = [0.0]
+    device = ArduinoSensors(version, clock=lambda: now[0])
+    sensor = _sensor(device)
+    duplicates, stale = sensor.duplicates, sensor.stale
+    max_age = 0
+    for step in range(2 * rate):
+        now[0] = step / rate
+        device.stalled = 1 - stall_s / 2 <= now[0] < 1 + stall_s / 2
+        sensor.poll()
+        max_age = max(max_age, sensor.age_ms)
+    return {
+        "polls": 2 * rate,
+        "duplicates": sensor.duplicates - duplicates,
+        "stale": sensor.stale - stale,
+        "max_age_ms": max_age,
+        "stall_s": stall_s,
+    }
+
+
+def run(polls: int = 10000, error_rate: float = 0.05, seed: int = 0) -> dict:
+    """Benchmarks both protocols."""
+    report = {}
+    for version in (1, 2):
+        report["v{}".format(version)] = {
+            "cost": cost(version, polls),
+            "integrity": integrity(version, polls, error_rate, seed),
+            "stall": stall(version),
+        }
+    return report
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--polls", type=int, default=10000)
+    parser.add_argument(
+        "--error-rate", type=float, default=0.05, help="answers with a bit flipped"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    report = run(args.polls, args.error_rate, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, result in report.items():
+        print(
+            "{}: poll {poll_us:.1f} us on the host, {alloc_blocks_per_poll:.3f} blocks, "
+            "wire {wire_poll_us:.0f} us (guard sample {wire_guard_us:.0f} us)".format(
+                name, **result["cost"]
+            )
+        )
+        print(
+            "    {corrupted} answers corrupted: {rejected} rejected, "
+            "{wrong_accepted} wrong values accepted".format(**result["integrity"])
+        )
+        print(
+            "    stall of {stall_s:.1f} s: {duplicates} duplicates, {stale} stale "
+            "in {polls} polls, max age {max_age_ms} ms".format(**result["stall"])
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Benchmarks the telemetry stream of the camera against a pty.
+
+Runs ``robot.main()`` on a simulated board with a ``TelemetryStream`` on
+the USB VCP stand-in, connected to a pty: a thread reads the other side
+like ``host.viewer`` reads the serial port of the camera, and parses it.
+The reader stalls for a while in the middle of the run (a host that falls
+behind): the buffer of the VCP fills up, the camera drops its oldest
+frames and its loop goes on. The report compares the frames sent, dropped
+and received, and the latency of the main loop with the stream to the one
+without it.
+
+The parser is then benchmarked alone, on a stream of frames with some
+garbage in it.
+
+Usage:
+    python -m host.bench_telemetry [--frames 250] [--stall 2.0] [--json]
+"""
+
+import argparse
+import json
+import os
+import pty
+import random
+import threading
+import time
+import tty
+
+from host import bench, viewer
+from host.harness import Board
+
+
+class Reader(threading.Thread):
+    """Reads and parses the slave side of the pty, stalls once."""
+
+    def __init__(self, fd: int, stall_at: float, stall: float):
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.parser = viewer.Parser()
+        self.received = []
+        self._stall_at = stall_at
+        self._stall = stall
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        start = time.perf_counter()
+        stalled = False
+        while not self._stopped.is_set():
+            if not stalled and time.perf_counter() - start >= self._stall_at:
+                stalled = True
+                self._stopped.wait(self._stall)
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                self._stopped.wait(0.005)
+                continue
+            except OSError:  # the pty is closed
+                return
+            self.received.extend(self.parser.feed(data))
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+def parse_rate(frames: int = 100000, seed: int = 0) -> dict:
+    """Measures the parser on frames with garbage every 100 frames.
+
+    Returns:
+        frames and megabytes parsed per second
+    """
+    rng = random.Random(seed)
+    chunks = []
+    for seq in range(frames):
+        stages_and_blob = [rng.randrange(1000) for _ in range(8)]
+        angle, distance = rng.randrange(-3500, 3500), rng.randrange(2000)
+        sensors = [rng.randrange(1024) for _ in range(6)]
+        frame = bytearray(
+            viewer.FRAME.pack(
+                viewer.SYNC,
+                seq & 0xFFFF,
+                seq * 40,
+                viewer.BALL,
+                0,
+                *stages_and_blob,
+                angle,
+                distance,
+                1000,
+                -1000,
+                *sensors,
+                0,
+                viewer.END,
+            )
+        )
+        frame[-2] = viewer.lrc(frame[2:-2])
+        chunks.append(bytes(frame))
+        if seq % 100 == 99:
+            chunks.append(
+                bytes(rng.randrange(256) for _ in range(rng.randrange(1, 30)))
+            )
+    data = b"".join(chunks)
+    parser = viewer.Parser()
+    start = time.perf_counter()
+    for offset in range(0, len(data), 4096):
+        parser.feed(data[offset : offset + 4096])
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": parser.frames,
+        "frames_per_s": parser.frames / elapsed,
+        "mb_per_s": len(data) / elapsed / 1e6,
+        "invalid": parser.invalid,
+        "skipped": parser.skipped,
+    }
+
+
+def run(frames: int = 250, stall: float = 2.0, latency_scale: float = 1.0) -> dict:
+    """Runs the main loop with and without the stream.
+
+    Returns:
+        A report of the stream, and the latencies (ms) of the main loop
+    """
+    import pyb
+    import robot
+    from telemetry import TelemetryStream
+
+    baseline = bench.run(frames, Board(latency_scale=latency_scale))
+    board = Board(latency_scale=latency_scale)
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    os.set_blocking(slave, False)
+    pyb.USB_VCP.connect(master, slave)
+    bot = robot.Robot()
+    stream = TelemetryStream(pyb.USB_VCP())
+    # The stall starts in the middle of the run, and ends before its end
+    period = robot.Robot.PERIOD / 1000
+    reader = Reader(slave, frames * period / 2 - stall / 2, stall)
+    reader.start()
+    try:
+        streamed = bench.run(frames, board, main=lambda: robot.main(bot, stream=stream))
+        time.sleep(0.2)  # the last frames in the pty
+    finally:
+        reader.stop()
+        pyb.USB_VCP.connect(None)
+        os.close(master)
+        os.close(slave)
+    parser = reader.parser
+    return {
+        "stream": {
+            "recorded": stream.sent + stream.dropped + stream._count,
+            "sent": stream.sent,
+            "dropped": stream.dropped,
+            "received": parser.frames,
+            "lost": parser.lost,
+            "reported_dropped": parser.dropped,
+            "invalid": parser.invalid,
+            "skipped_bytes": parser.skipped,
+            "stall_s": stall,
+        },
+        "latency_ms": streamed["latency_ms"],
+        "baseline_latency_ms": baseline["latency_ms"],
+        "parser": parse_rate(),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=250)
+    parser.add_argument("--stall", type=float, default=2.0, help="seconds")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    report = run(args.frames, args.stall, args.latency_scale)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        "stream: {recorded} frames, {sent} sent, {dropped} dropped (reader stalled "
+        "{stall_s:.1f} s)".format(**report["stream"])
+    )
+    print(
+        "viewer: {received} received, {lost} lost ({reported_dropped} reported dropped), "
+        "{invalid} invalid, {skipped_bytes} bytes skipped".format(**report["stream"])
+    )
+    for key, label in (
+        ("baseline_latency_ms", "without stream"),
+        ("latency_ms", "with stream"),
+    ):
+        print(
+            "{:>14}: latency mean {mean:.2f}  p50 {p50:.2f}  p99 {p99:.2f}  "
+            "max {max:.2f} ms".format(label, **report[key])
+        )
+    print(
+        "parser: {frames_per_s:.0f} frames/s ({mb_per_s:.1f} MB/s), {invalid} invalid, "
+        "{skipped} bytes skipped".format(**report["parser"])
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""Calibrates the ball detection of ``Camera`` from labeled frames.
+
+Frames are RGB565 (a recording of ``recorder.Recorder``, a file of raw
+frames or a directory of PPM files), the ball is labeled by a CSV file of
+``frame,x,y,w,h`` rows (frame indexes from 0, in pixels of the frames, no
+row or an empty box when the ball isn't visible).
+
+The frames are converted to LAB once, like OpenMV does, with a table of the
+65536 RGB565 values. Candidate thresholds start from percentiles of the
+ball's pixels, then each bound is moved by steps while the F1 score of the
+detection improves. A candidate is evaluated on all the frames at once:
+the matching pixels of a frame are taken as one blob (find_blobs with
+merge=True), detected if it has enough pixels, area and roundness, right if
+its center is in the labeled box. The filters (pixels_threshold,
+area_threshold, roundness) are searched on a grid for each candidate.
+Candidates are spread over a pool of processes, which share the frames.
+
+The result is written as the JSON file that Camera loads at startup
+(``Camera.CONFIG``, copy it next to the firmware), filters in QVGA pixels.
+
+Usage:
+    python -m host.calibrate FRAMES LABELS [--size 80x60] [--byteswap]
+                             [--workers 8] [--output camera.json]
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+QVGA_WIDTH = 320
+PERCENTILES = ((2, 98), (5, 95), (10, 90))  # of the ball's pixels, per channel
+LIMITS = (0, 100, -128, 127, -128, 127)  # of the LAB channels
+STEPS = (8, 4, 2, 1)  # moves of a bound during the refinement
+PIXELS = np.array([5, 10, 20, 35, 50, 75, 100, 150, 200, 300])  # in QVGA
+AREAS = np.array([5, 10, 20, 35, 50, 75, 100, 150, 200, 300])  # in QVGA
+ROUNDNESS = np.array([0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7])
+
+_frames = None  # LAB frames of a worker (N x H x W x 3, int8)
+_boxes = None
+_scale = 1.0
+_memory = None
+
+
+def lab_table() -> np.ndarray:
+    """Returns the (l, a, b) values of each RGB565 pixel, like OpenMV (65536 x 3)."""
+    pixel = np.arange(65536, dtype=np.int32)
+    red = (((pixel >> 11) & 0x1F) * 255 + 15) // 31
+    green = (((pixel >> 5) & 0x3F) * 255 + 31) // 63
+    blue = ((pixel & 0x1F) * 255 + 15) // 31
+    rgb = np.stack((red, green, blue), axis=1) / 255
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    matrix = np.array(
+        ((0.4124, 0.3576, 0.1805), (0.2126, 0.7152, 0.0722), (0.0193, 0.1192, 0.9505))
+    )
+    xyz = linear @ matrix.T / np.array((0.95047, 1.0, 1.08883))
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+    lab_l = np.round(116 * f[:, 1] - 16)
+    lab_a = np.clip(np.round(500 * (f[:, 0] - f[:, 1])), -128, 127)
+    lab_b = np.clip(np.round(200 * (f[:, 1] - f[:, 2])), -128, 127)
+    return np.stack((lab_l, lab_a, lab_b), axis=1).astype(np.int8)
+
+
+def load_frames(path: str, size=None, byteswap: bool = False) -> np.ndarray:
+    """Returns the RGB565 frames of a recording, a raw file or PPM files (N x H x W)."""
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.endswith(".ppm"))
+        return np.stack([_load_ppm(os.path.join(path, name)) for name in names])
+    with open(path, "rb") as file:
+        magic = file.read(5)
+    if magic == b"RREC\x01":
+        from host.replay import Recording
+
+        recording = Recording(path)
+        try:
+            frames = []
+            for chunk in recording.frames:
+                width, height = np.frombuffer(recording.data, "<u2", 2, chunk.offset)
+                frames.append(
+                    np.frombuffer(
+                        recording.data,
+                        "<u2",
+                        int(width) * int(height),
+                        chunk.offset + 4,
+                    ).reshape(int(height), int(width))
+                )
+            frames = np.stack(frames)
+        finally:
+            recording.close()
+    else:
+        width, height = size
+        frames = np.fromfile(path, "<u2").reshape(-1, height, width)
+    return frames.byteswap() if byteswap else frames
+
+
+def _load_ppm(path: str) -> np.ndarray:
+    with open(path, "rb") as file:
+        data = file.read()
+    fields, offset = [], 0
+    while len(fields) < 4:
+        while data[offset : offset + 1].isspace():
+            offset += 1
+        if data[offset : offset + 1] == b"#":
+            offset = data.index(b"\n", offset)
+            continue
+        end = offset
+        while not data[end : end + 1].isspace():
+            end += 1
+        fields.append(data[offset:end])
+        offset = end
+    width, height = int(fields[1]), int(fields[2])
+    rgb = np.frombuffer(data, np.uint8, width * height * 3, offset + 1)
+    rgb = rgb.reshape(height, width, 3).astype(np.uint16)
+    return ((rgb[..., 0] >> 3) << 11) | ((rgb[..., 1] >> 2) << 5) | (rgb[..., 2] >> 3)
+
+
+def load_labels(path: str, count: int) -> np.ndarray:
+    """Returns the box (x, y, w, h) of each frame, -1s if there is no ball."""
+    boxes = np.full((count, 4), -1, dtype=np.int32)
+    with open(path, newline="") as file:
+        for row in csv.reader(file):
+            if not row or not row[0].strip().isdigit():
+                continue  # header or empty line
+            frame = int(row[0])
+            if frame < count and len(row) >= 5 and row[1].strip():
+                boxes[frame] = [int(float(value)) for value in row[1:5]]
+    return boxes
+
+
+def _attach(name: str, shape: tuple, boxes: np.ndarray, scale: float) -> None:
+    """Initializer of the workers: maps the shared LAB frames."""
+    global _frames, _boxes, _scale, _memory
+    _memory = shared_memory.SharedMemory(name=name)
+    _frames = np.ndarray(shape, dtype=np.int8, buffer=_memory.buf)
+    _boxes = boxes
+    _scale = scale
+
+
+def blob_stats(frames: np.ndarray, bounds: tuple, boxes: np.ndarray) -> tuple:
+    """Measures the blob of matching pixels in each frame.
+
+    Returns:
+        (pixels, area, roundness, right): arrays of one value per frame,
+        right is True if the blob's center is in the labeled box
+    """
+    lmin, lmax, amin, amax, bmin, bmax = bounds
+    lab_l, lab_a, lab_b = frames[..., 0], frames[..., 1], frames[..., 2]
+    mask = (
+        (lab_l >= lmin)
+        & (lab_l <= lmax)
+        & (lab_a >= amin)
+        & (lab_a <= amax)
+        & (lab_b >= bmin)
+        & (lab_b <= bmax)
+    )
+    height, width = mask.shape[1:]
+    xs = np.arange(width, dtype=np.float64)
+    ys = np.arange(height, dtype=np.float64)
+    columns = mask.sum(axis=1, dtype=np.float64)  # N x W
+    rows = mask.sum(axis=2, dtype=np.float64)  # N x H
+    pixels = columns.sum(axis=1)
+    count = np.maximum(pixels, 1)
+    cx, cy = columns @ xs / count, rows @ ys / count
+    vxx = columns @ (xs * xs) / count - cx * cx + 1 / 12
+    vyy = rows @ (ys * ys) / count - cy * cy + 1 / 12
+    vxy = np.einsum("nhw,h,w->n", mask, ys, xs, dtype=np.float64) / count - cx * cy
+    spread = np.sqrt(((vxx - vyy) / 2) ** 2 + vxy * vxy)
+    major, minor = (vxx + vyy) / 2 + spread, (vxx + vyy) / 2 - spread
+    roundness = np.sqrt(np.clip(minor, 0, None) / np.maximum(major, 1e-9))
+    used_x, used_y = columns > 0, rows > 0
+    x0 = used_x.argmax(axis=1)
+    x1 = width - used_x[:, ::-1].argmax(axis=1)
+    y0 = used_y.argmax(axis=1)
+    y1 = height - used_y[:, ::-1].argmax(axis=1)
+    area = np.where(pixels > 0, (x1 - x0) * (y1 - y0), 0)
+    right = (
+        (boxes[:, 2] > 0)
+        & (cx >= boxes[:, 0])
+        & (cx < boxes[:, 0] + boxes[:, 2])
+        & (cy >= boxes[:, 1])
+        & (cy < boxes[:, 1] + boxes[:, 3])
+    )
+    return pixels, area, roundness, right
+
+
+def best_filters(stats: tuple, boxes: np.ndarray, scale: float) -> tuple:
+    """Searches the filters that maximize the F1 score of a candidate.
+
+    Args:
+        scale: number of pixels of a frame for one pixel of a QVGA frame
+
+    Returns:
+        (f1, precision, recall, pixels_threshold, area_threshold, roundness),
+        the filters in QVGA pixels
+    """
+    pixels, area, roundness, right = stats
+    detected = (
+        (pixels[None, None, None, :] >= PIXELS[:, None, None, None] * scale)
+        & (area[None, None, None, :] >= AREAS[None, :, None, None] * scale)
+        & (roundness[None, None, None, :] >= ROUNDNESS[None, None, :, None])
+    )
+    balls = max(int((boxes[:, 2] > 0).sum()), 1)
+    true = (detected & right).sum(axis=-1)
+    false = (detected & ~right).sum(axis=-1)
+    precision = true / np.maximum(true + false, 1)
+    recall = true / balls
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-9)
+    p, a, r = np.unravel_index(np.argmax(f1), f1.shape)
+    return (
+        float(f1[p, a, r]),
+        float(precision[p, a, r]),
+        float(recall[p, a, r]),
+        int(PIXELS[p]),
+        int(AREAS[a]),
+        float(ROUNDNESS[r]),
+    )
+
+
+def evaluate(bounds: tuple) -> tuple:
+    """Scores a candidate in a worker: (score, bounds)."""
+    return best_filters(blob_stats(_frames, bounds, _boxes), _boxes, _scale), bounds
+
+
+def initial_candidates(frames: np.ndarray, boxes: np.ndarray) -> list:
+    """Returns thresholds built from percentiles of the ball's pixels.
+
+    The center of each box (half its size) is used, its border is mostly
+    the background.
+    """
+    samples = []
+    for frame, (x, y, w, h) in zip(frames, boxes):
+        if w > 0:
+            samples.append(
+                frame[y + h // 4 : y + h - h // 4, x + w // 4 : x + w - w // 4].reshape(
+                    -1, 3
+                )
+            )
+    if not samples:
+        raise ValueError("No labeled ball")
+    samples = np.concatenate(samples).astype(np.int16)
+    ranges = []
+    for channel in range(3):
+        ranges.append(
+            [
+                tuple(int(v) for v in np.percentile(samples[:, channel], (low, high)))
+                for low, high in PERCENTILES
+            ]
+        )
+    return sorted(
+        {
+            l_range + a_range + b_range
+            for l_range in ranges[0]
+            for a_range in ranges[1]
+            for b_range in ranges[2]
+        }
+    )
+
+
+def neighbours(bounds: tuple, step: int) -> list:
+    """Returns the thresholds with one bound moved by a step."""
+    found = []
+    for i in range(6):
+        for move in (-step, step):
+            moved = list(bounds)
+            moved[i] = min(
+                max(moved[i] + move, LIMITS[i - i % 2]), LIMITS[i - i % 2 + 1]
+            )
+            if moved[i - i % 2] <= moved[i - i % 2 + 1] and moved != list(bounds):
+                found.append(tuple(moved))
+    return found
+
+
+def calibrate(frames: np.ndarray, boxes: np.ndarray, workers=None) -> dict:
+    """Searches the thresholds and filters of the ball in RGB565 frames."""
+    start = time.perf_counter()
+    lab = lab_table()[frames]
+    scale = (frames.shape[2] / QVGA_WIDTH) ** 2
+    workers = workers or os.cpu_count() or 1
+    memory = shared_memory.SharedMemory(create=True, size=lab.nbytes)
+    try:
+        shared = np.ndarray(lab.shape, dtype=np.int8, buffer=memory.buf)
+        shared[:] = lab
+        evaluated = {}
+        with ProcessPoolExecutor(
+            workers,
+            initializer=_attach,
+            initargs=(memory.name, lab.shape, boxes, scale),
+        ) as pool:
+
+            def run(candidates: list) -> None:
+                candidates = [
+                    bounds for bounds in candidates if bounds not in evaluated
+                ]
+                chunksize = max(1, len(candidates) // (4 * workers))
+                for score, bounds in pool.map(
+                    evaluate, candidates, chunksize=chunksize
+                ):
+                    evaluated[bounds] = score
+
+            run(initial_candidates(lab, boxes))
+            best = max(evaluated, key=lambda bounds: evaluated[bounds][0])
+            for step in STEPS:
+                while True:
+                    run(neighbours(best, step))
+                    better = max(evaluated, key=lambda bounds: evaluated[bounds][0])
+                    if evaluated[better][0] <= evaluated[best][0]:
+                        break
+                    best = better
+    finally:
+        memory.close()
+        memory.unlink()
+    f1, precision, recall, pixels, area, roundness = evaluated[best]
+    return {
+        "thresholds": [list(best)],
+        "pixels_threshold": pixels,
+        "area_threshold": area,
+        "roundness": roundness,
+        "f1": round(f1, 4),
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "frames": int(frames.shape[0]),
+        "candidates": len(evaluated),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("frames", help="recording, raw RGB565 file or PPM directory")
+    parser.add_argument("labels", help="CSV of frame,x,y,w,h")
+    parser.add_argument("--size", default="80x60", help="size of raw frames")
+    parser.add_argument("--byteswap", action="store_true", help="big-endian pixels")
+    parser.add_argument("--workers", type=int, help="processes (all cores by default)")
+    parser.add_argument("--output", default="camera.json")
+    args = parser.parse_args(argv)
+
+    size = tuple(int(value) for value in args.size.split("x"))
+    frames = load_frames(args.frames, size, args.byteswap)
+    boxes = load_labels(args.labels, len(frames))
+    config = calibrate(frames, boxes, args.workers)
+    with open(args.output, "w") as file:
+        json.dump(config, file, indent=2)
+    print(json.dumps(config, indent=2))
+
+
+if __name__ == "__main__":
+    main()
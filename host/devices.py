@@ -0,0 +1,200 @@
+"""Simulated I2C slaves of the robot, to attach on a ``pyb.Bus``."""
+
+import collections
+import struct
+import time
+
+
+class EncoderDriver:
+    """The Makeblock encoder motor driver (two slots, 0 and 1).
+
+    Frames are decoded like the driver board does: header 0xA5 0x01, the
+    payload length (int32, little-endian), the payload [slot, CMD, args],
+    the LRC of the payload and 0x5A. Invalid frames are counted in errors.
+    Frames received less than min_gap_us after the previous one are dropped,
+    like the board does while it is still processing a frame.
+
+    CMD_GET_POS and CMD_GET_SPEED are answered on the next read: the angle
+    (degrees) or the speed (RPM) of the slot, as a little-endian float.
+
+    Args:
+        min_gap_us: minimum time between two frames
+        efficiency: ratio of the commanded speed the wheels actually reach
+            (friction and slip), the same for both slots
+        clock: returns the time in seconds (time.perf_counter by default)
+
+    Attributes:
+        commands: number of valid frames received, by command
+        dropped: number of frames received too early
+        speed: current speed (RPM) of each slot
+        history: the last speed changes (clock time, slot, speed)
+    """
+
+    HEADER = b"\xa5\x01"
+    END = 0x5A
+    CMD_MOVE_SPD = 0x05
+    CMD_RESET = 0x07
+    CMD_MOVE_SPD_TIME = 0x08
+    CMD_MOVE_AGL = 0x11
+    CMD_GET_SPEED = 0x10
+    CMD_GET_POS = 0x12
+
+    def __init__(self, min_gap_us: int = 3000, efficiency: float = 1.0, clock=None):
+        self.min_gap_us = min_gap_us
+        self.efficiency = efficiency
+        self.clock = clock if clock is not None else time.perf_counter
+        self.commands = collections.Counter()
+        self.errors = 0
+        self.dropped = 0
+        self._last_frame = float("-inf")
+        self.speed = [0.0, 0.0]
+        self._position = [0.0, 0.0]
+        self._since = [self.clock()] * 2
+        self._answer = b""
+        self.history = collections.deque(maxlen=10000)
+
+    def position(self, slot: int) -> float:
+        """Returns the angle (degrees) travelled by a slot since its last reset."""
+        elapsed = self.clock() - self._since[slot]
+        return self._position[slot] + self.speed[slot] * self.efficiency * 6 * elapsed
+
+    def _set_speed(self, slot: int, speed: float) -> None:
+        self._position[slot] = self.position(slot)
+        self._since[slot] = self.clock()
+        self.speed[slot] = speed
+        self.history.append((self._since[slot], slot, speed))
+
+    def write(self, data: bytes) -> None:
+        now = self.clock()
+        if (now - self._last_frame) * 1e6 < self.min_gap_us:
+            self.dropped += 1
+            return
+        self._last_frame = now
+        if len(data) < 8 or data[:2] != self.HEADER or data[-1] != self.END:
+            self.errors += 1
+            return
+        (length,) = struct.unpack_from("<l", data, 2)
+        payload = data[6:-2]
+        lrc = 0
+        for byte in payload:
+            lrc ^= byte
+        if length != len(payload) or length < 2 or lrc != data[-2]:
+            self.errors += 1
+            return
+        slot, cmd = payload[0], payload[1]
+        self.commands[cmd] += 1
+        if cmd in (self.CMD_MOVE_SPD, self.CMD_MOVE_SPD_TIME):
+            self._set_speed(slot, struct.unpack_from("<f", payload, 2)[0])
+        elif cmd == self.CMD_MOVE_AGL:
+            self._set_speed(slot, struct.unpack_from("<f", payload, 6)[0])
+        elif cmd == self.CMD_RESET:
+            self._set_speed(slot, 0.0)
+            self._position[slot] = 0.0
+        elif cmd == self.CMD_GET_POS:
+            self._answer = struct.pack("<f", self.position(slot))
+        elif cmd == self.CMD_GET_SPEED:
+            self._answer = struct.pack("<f", self.speed[slot] * self.efficiency)
+
+    def read(self, nbytes: int) -> bytes:
+        answer, self._answer = self._answer, b""
+        return answer[:nbytes].ljust(nbytes, b"\x00")
+
+
+def crc8(data: bytes) -> int:
+    """Returns the CRC-8 (polynomial 0x07, initial value 0) of data."""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+class ArduinoSensors:
+    """The Arduino nano: two ultrasonic sensors (cm) and four line sensors.
+
+    It answers like arduino/sensor.ino. The ultrasonic sensors are measured
+    one after the other, every MEASURE_S, by the loop of the Arduino: the
+    answers have the last measures, and the line sensors read on request.
+
+    With the protocol v2, the master writes a mask of fields (the register
+    of a mem_read): the next read is answered VERSION, the mask, the sequence
+    number of the measures (uint16), the age (ms, uint16) of the oldest
+    distance of the mask, the fields of the mask (uint16), then the CRC-8 of
+    all that, big-endian. A read without a register before is answered the
+    six fields of the v1, like with version=1.
+
+    Args:
+        version: of the protocol, 1 answers the six fields of every read
+        clock: returns the time in seconds (time.perf_counter by default)
+
+    Attributes:
+        front, back: distances returned by the ultrasonic sensors, once
+            measured
+        lines: analog values of the line sensors (0-1023)
+        stalled: if True, the distances aren't measured anymore
+        seq: number of measures of the distances (modulo 65536)
+        requests: number of answers, by mask (None for v1)
+    """
+
+    VERSION = 0x82
+    FIELDS = ("front", "back", "line0", "line1", "line2", "line3")
+    MEASURE_S = 0.03  # an ultrasonic measure, the sensors take turns
+
+    def __init__(self, version: int = 2, clock=None):
+        self.version = version
+        self.clock = clock if clock is not None else time.perf_counter
+        self.front = 80
+        self.back = 80
+        self.lines = [120, 120, 120, 120]
+        self.stalled = False
+        self.seq = 0
+        self.requests = collections.Counter()
+        self._register = None
+        self._cache = [0, 0]  # like the globals of the sketch before a measure
+        self._measured = [self.clock()] * 2
+        self._turn = 0  # the next sensor to measure
+        self._next = self.clock() + ArduinoSensors.MEASURE_S
+
+    def write(self, data: bytes) -> None:
+        if self.version >= 2 and data:
+            self._register = data[0]
+
+    def _measure(self) -> None:
+        """Catches up with the measures done by the loop of the Arduino."""
+        now = self.clock()
+        if self.stalled or now < self._next:
+            return
+        cycles = int((now - self._next) / ArduinoSensors.MEASURE_S) + 1
+        last = self._next + (cycles - 1) * ArduinoSensors.MEASURE_S
+        for k in range(min(cycles, 2)):  # the last measure of each sensor
+            which = (self._turn + cycles - 1 - k) % 2
+            self._cache[which] = (self.front, self.back)[which]
+            self._measured[which] = last - k * ArduinoSensors.MEASURE_S
+        self._turn = (self._turn + cycles) % 2
+        self.seq = (self.seq + cycles) & 0xFFFF
+        self._next = last + ArduinoSensors.MEASURE_S
+
+    def answer(self, mask: int = None) -> bytes:
+        """Returns the answer to a mask of fields, the v1 one for None."""
+        self._measure()
+        values = (*self._cache, *self.lines)
+        if mask is None:
+            return struct.pack(">6H", *values)
+        fields = [value for i, value in enumerate(values) if mask >> i & 1]
+        ages = [self._measured[i] for i in range(2) if mask >> i & 1]
+        age = int((self.clock() - min(ages)) * 1000) if ages else 0
+        data = struct.pack(
+            ">BBHH{}H".format(len(fields)),
+            ArduinoSensors.VERSION,
+            mask,
+            self.seq,
+            min(age, 0xFFFF),
+            *fields,
+        )
+        return data + bytes((crc8(data),))
+
+    def read(self, nbytes: int) -> bytes:
+        mask, self._register = self._register, None
+        self.requests[mask] += 1
+        return self.answer(mask)[:nbytes].ljust(nbytes, b"\xff")
@@ -0,0 +1,77 @@
+"""Precompiles the firmware of the camera, to boot without compiling it.
+
+On the camera, importing a ``.py`` module compiles it to bytecode first,
+which is most of the time of the imports at startup. This tool compiles
+every module of ``openmv_cam`` but ``boot.py`` (the entry script) with
+``mpy-cross`` (``pip install mpy-cross``, its version must match the
+MicroPython of the firmware):
+
+- copy the ``.mpy`` files next to ``boot.py`` on the camera, in place of
+  the ``.py`` ones (a ``.py`` is imported before a ``.mpy`` of the same name);
+- or freeze the modules into a custom firmware with the ``manifest.py``
+  written along them (``freeze()`` of the MicroPython manifests): they are
+  then imported from the flash of the MCU, without allocating their
+  bytecode in the heap. Only ``boot.py`` is left on the drive of the camera.
+
+Usage:
+    python -m host.freeze [--output build/mpy] [--mpy-cross PATH]
+"""
+
+import argparse
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+from host.harness import FIRMWARE, ROOT
+
+ENTRY = "boot.py"
+
+
+def modules(firmware: Path = FIRMWARE) -> list:
+    """Returns the modules of the firmware to compile, the entry script apart."""
+    return sorted(path for path in firmware.glob("*.py") if path.name != ENTRY)
+
+
+def compile_all(output: Path, mpy_cross: str = "mpy-cross") -> list:
+    """Compiles the modules of the firmware into output, with a manifest.
+
+    Returns:
+        the .mpy files written
+    """
+    output.mkdir(parents=True, exist_ok=True)
+    written = []
+    for source in modules():
+        target = (output / (source.stem + ".mpy")).resolve()
+        command = [mpy_cross, "-o", str(target), source.name]
+        # Compiled from the firmware folder: the name of the source is kept
+        # in the bytecode, for the tracebacks
+        subprocess.run(command, cwd=str(FIRMWARE), check=True)
+        written.append(target)
+    names = ", ".join('"{}"'.format(source.name) for source in modules())
+    (output / "manifest.py").write_text(
+        'freeze("{}", ({},))\n'.format(FIRMWARE.as_posix(), names)
+    )
+    return written
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", type=Path, default=ROOT / "build" / "mpy")
+    parser.add_argument("--mpy-cross", default="mpy-cross", help="the compiler to run")
+    args = parser.parse_args(argv)
+
+    if shutil.which(args.mpy_cross) is None:
+        sys.exit("{} not found: pip install mpy-cross".format(args.mpy_cross))
+    written = compile_all(args.output, args.mpy_cross)
+    size = sum(path.stat().st_size for path in written)
+    source = sum(path.stat().st_size for path in modules())
+    print(
+        "{} modules compiled in {} ({} bytes, {} bytes of sources)".format(
+            len(written), args.output, size, source
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Runs the OpenMV Cam firmware on CPython.
+
+``install()`` puts the stand-in modules (``host/stubs``) and the firmware
+(``openmv_cam``) on ``sys.path``, so that ``import robot`` works like on
+the camera. A :class:`Board` then wires the simulated devices.
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+STUBS = ROOT / "host" / "stubs"
+FIRMWARE = ROOT / "openmv_cam"
+
+
+def install() -> None:
+    """Makes the firmware and the stand-in modules importable."""
+    for path in (FIRMWARE, STUBS):
+        if str(path) not in sys.path:
+            sys.path.insert(0, str(path))
+
+
+class Board:
+    """The simulated OpenMV Cam H7 and the devices wired to it.
+
+    Args:
+        source: the frame source of the camera (defaults to SyntheticSource)
+        latency_scale: multiplies the modelled I2C, readout and find_blobs
+            times (0 runs the firmware as fast as possible)
+        debug: emulates a connected OpenMV IDE (USB_VCP.debug_mode_enabled())
+        motors, arduino: devices to attach instead of new ones (see
+            host.devices)
+
+    Attributes:
+        motors: the encoder motor driver on bus 4, address 0x09
+        arduino: the Arduino nano on bus 2, address 0x10
+    """
+
+    def __init__(
+        self,
+        source=None,
+        latency_scale: float = 1.0,
+        debug: bool = False,
+        motors=None,
+        arduino=None,
+    ):
+        import image
+        import pyb
+        import sensor
+
+        from host.devices import ArduinoSensors, EncoderDriver
+        from host.sources import SyntheticSource
+
+        pyb.Bus.reset_all()
+        pyb.Timer.deinit_all()
+        # Shared instances of a previous run are bound to old devices and loops
+        if "bus" in sys.modules:
+            sys.modules["bus"].I2CBus.BUSES.clear()
+        if "utils" in sys.modules:
+            sys.modules["utils"].TimerService.INSTANCE = None
+        pyb.LATENCY_SCALE = latency_scale
+        pyb.USB_VCP.DEBUG = debug
+        pyb.USB_VCP.connect(None)
+        sensor.READOUT_SCALE = latency_scale
+        image.FIND_BLOBS_NS_PER_PIXEL = 300 * latency_scale
+        sensor.reset()
+        sensor.set_source(source if source is not None else SyntheticSource())
+        sensor.frame_hooks.clear()
+
+        self.motors = motors if motors is not None else EncoderDriver()
+        pyb.Bus(4).attach(0x09, self.motors)
+        self.arduino = arduino if arduino is not None else ArduinoSensors()
+        pyb.Bus(2).attach(0x10, self.arduino)
+
+    @staticmethod
+    def traffic(pin: int) -> list:
+        """Returns the transfers recorded on a bus."""
+        import pyb
+
+        return list(pyb.Bus(pin).traffic)
@@ -0,0 +1,174 @@
+"""Decodes the binary logs written by ``ulogging.BinaryHandler``.
+
+The file is mapped in memory and parsed record by record, so that logs of
+long matches are streamed without being loaded. Records are rendered like
+the text handlers do, or written as CSV columns (one per argument), which
+suits per-frame telemetry.
+
+Usage:
+    python -m host.logdecode telemetry.bin [--level INFO] [--name robot]
+                             [--grep angle] [--since 0] [--until 60000]
+                             [--csv] [--count]
+"""
+
+import argparse
+import csv
+import mmap
+import struct
+import sys
+
+NAMES = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+MAGIC = b"ULOG\x01"
+RECORD = struct.Struct("<BBBHHI")  # level, name, nargs, message, types, ticks_ms
+NAME = struct.Struct("<BBB")  # kind, id, length
+MESSAGE = struct.Struct("<BHH")  # kind, id, length
+DROPPED = struct.Struct("<BI")  # kind, count
+INT32 = struct.Struct("<i")
+FLOAT32 = struct.Struct("<f")
+NAME_KIND, MESSAGE_KIND, DROPPED_KIND = 0x80, 0x81, 0x82
+TICKS_PERIOD = 1 << 30  # ticks_ms wrap around on MicroPython
+
+
+class Record:
+    __slots__ = ("time_ms", "level", "name", "message", "args")
+
+    def __init__(self, time_ms: int, level: int, name: str, message: str, args: tuple):
+        self.time_ms = time_ms
+        self.level = level
+        self.name = name
+        self.message = message
+        self.args = args
+
+    def text(self) -> str:
+        message = self.message
+        if self.args:
+            try:
+                message = message.format(*self.args)
+            except (TypeError, ValueError, IndexError):
+                message = "{} {}".format(message, self.args)
+        return "{}: {} (+{:.3f}s) -> {}".format(
+            NAMES[self.level], self.name, self.time_ms / 1000, message
+        )
+
+
+def records(data):
+    """Yields the Records of a log, with ticks unwrapped in milliseconds.
+
+    The time of each boot (an appended file) starts again from its ticks.
+    A truncated last record (power loss during a write) is ignored.
+
+    Args:
+        data: a bytes-like object, a mmap for instance
+    """
+    offset = len(MAGIC) if data[: len(MAGIC)] == MAGIC else 0
+    names, messages = {}, {}
+    end = len(data)
+    last_tick, wraps = None, 0
+    try:
+        while offset < end:
+            kind = data[offset]
+            if kind == NAME_KIND:
+                _, ident, length = NAME.unpack_from(data, offset)
+                offset += NAME.size
+                names[ident] = bytes(data[offset : offset + length]).decode()
+                offset += length
+            elif kind == MESSAGE_KIND:
+                _, ident, length = MESSAGE.unpack_from(data, offset)
+                offset += MESSAGE.size
+                messages[ident] = bytes(data[offset : offset + length]).decode()
+                offset += length
+            elif kind == DROPPED_KIND:
+                _, count = DROPPED.unpack_from(data, offset)
+                offset += DROPPED.size
+                yield Record(
+                    (last_tick or 0) + wraps * TICKS_PERIOD,
+                    2,
+                    "ulogging",
+                    "{} records dropped",
+                    (count,),
+                )
+            elif kind == MAGIC[0] and data[offset : offset + len(MAGIC)] == MAGIC:
+                offset += len(MAGIC)  # a rotated file was concatenated
+            elif kind < len(NAMES):
+                level, name, nargs, message, types, tick = RECORD.unpack_from(
+                    data, offset
+                )
+                offset += RECORD.size
+                args = []
+                for i in range(nargs):
+                    kind = (types >> (2 * i)) & 3
+                    if kind == 0:
+                        args.append(INT32.unpack_from(data, offset)[0])
+                        offset += 4
+                    elif kind == 1:
+                        args.append(FLOAT32.unpack_from(data, offset)[0])
+                        offset += 4
+                    else:
+                        length = data[offset]
+                        args.append(
+                            bytes(data[offset + 1 : offset + 1 + length]).decode()
+                        )
+                        offset += 1 + length
+                if offset > end:
+                    return
+                if last_tick is not None and tick < last_tick:
+                    if last_tick - tick > TICKS_PERIOD // 2:
+                        wraps += 1
+                    else:  # the camera rebooted
+                        wraps = 0
+                last_tick = tick
+                yield Record(
+                    tick + wraps * TICKS_PERIOD,
+                    level,
+                    names.get(name, "#{}".format(name)),
+                    messages.get(message, "#{}".format(message)),
+                    tuple(args),
+                )
+            else:
+                raise ValueError("Corrupted log at offset {}".format(offset))
+    except struct.error:
+        return  # truncated record
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("path", help="log written by ulogging.BinaryHandler")
+    parser.add_argument("--level", default="DEBUG", choices=NAMES)
+    parser.add_argument("--name", help="keep the loggers with this prefix")
+    parser.add_argument("--grep", help="keep the messages containing this text")
+    parser.add_argument("--since", type=int, help="first time (ms)")
+    parser.add_argument("--until", type=int, help="last time (ms)")
+    parser.add_argument("--csv", action="store_true", help="time, logger, args")
+    parser.add_argument("--count", action="store_true", help="count the records")
+    args = parser.parse_args(argv)
+
+    level = NAMES.index(args.level)
+    writer = csv.writer(sys.stdout) if args.csv else None
+    count = 0
+    with open(args.path, "rb") as logfile, mmap.mmap(
+        logfile.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        for record in records(data):
+            if record.level < level:
+                continue
+            if args.name and not record.name.startswith(args.name):
+                continue
+            if args.grep and args.grep not in record.message:
+                continue
+            if args.since is not None and record.time_ms < args.since:
+                continue
+            if args.until is not None and record.time_ms > args.until:
+                continue
+            count += 1
+            if args.count:
+                continue
+            if writer:
+                writer.writerow((record.time_ms, record.name) + record.args)
+            else:
+                print(record.text())
+    if args.count:
+        print(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Measures the time and the memory allocated by a function, call by call.
+
+Runs on CPython and on the OpenMV Cam (copy it next to the benchmark). On
+the camera, allocations are measured with ``gc.mem_alloc()`` while the GC
+is disabled, which counts every allocated byte. CPython frees temporaries
+immediately, so the net number of allocated blocks and the peak of traced
+memory are reported instead. Both are given relative to an empty loop.
+"""
+
+import gc
+import sys
+
+import utime as time
+
+MICROPYTHON = sys.implementation.name == "micropython"
+
+
+def measure(function, calls: int, values: list) -> tuple:
+    """Calls function(value) for values in turn (len(values) a power of 2).
+
+    Returns:
+        (microseconds per call, allocated): allocated is a number of bytes
+        on MicroPython, (net blocks, peak bytes) on CPython
+    """
+    mask = len(values) - 1
+    gc.collect()
+    gc.disable()
+    try:
+        if MICROPYTHON:
+            before = gc.mem_alloc()
+        else:
+            import tracemalloc
+
+            tracemalloc.start()
+            before = sys.getallocatedblocks()
+        start = time.ticks_us()
+        for i in range(calls):
+            function(values[i & mask])
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        if MICROPYTHON:
+            allocated = gc.mem_alloc() - before
+        else:
+            allocated = sys.getallocatedblocks() - before
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            allocated = (allocated, peak)
+    finally:
+        gc.enable()
+    return elapsed / calls, allocated
+
+
+def allocations(function, calls: int, values: list, filename: str) -> int:
+    """Returns the bytes allocated by calls of function, an empty loop deducted.
+
+    On the camera, every allocated byte is counted. CPython frees the
+    temporaries at once, and the stand-ins of the MicroPython modules
+    allocate on their own (ustruct wraps struct): only the memory allocated
+    by the lines of filename, and still alive after the calls, is counted.
+    """
+    if MICROPYTHON:
+        empty = measure(lambda value: None, calls, values)[1]
+        return measure(function, calls, values)[1] - empty
+    import tracemalloc
+
+    mask = len(values) - 1
+    function(values[0])  # the first call may fill caches
+    only = (tracemalloc.Filter(True, filename),)
+    tracemalloc.start()
+    try:
+        gc.collect()  # also empties the free lists of the interpreter
+        before = tracemalloc.take_snapshot().filter_traces(only)
+        for i in range(calls):
+            function(values[i & mask])
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(only)
+    finally:
+        tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+
+def compare(cases, calls: int, values: list) -> None:
+    """Prints the cost of each (name, function) case, minus an empty loop."""
+    empty, baseline = measure(lambda value: None, calls, values)
+    for name, function in cases:
+        per_call, allocated = measure(function, calls, values)
+        if MICROPYTHON:
+            print(
+                "{:<12} {:8.2f} us/call  {:8.2f} bytes allocated/call".format(
+                    name, per_call - empty, (allocated - baseline) / calls
+                )
+            )
+        else:
+            print(
+                "{:<12} {:8.2f} us/call  {:6d} blocks net  {:6d} bytes peak".format(
+                    name,
+                    per_call - empty,
+                    allocated[0] - baseline[0],
+                    allocated[1] - baseline[1],
+                )
+            )
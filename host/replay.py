@@ -0,0 +1,391 @@
+"""Replays a match recorded by ``recorder.Recorder`` on the host.
+
+The recording is memory-mapped and its frames are fed to the firmware
+through the sensor stand-in, with the Arduino answering the sensor values
+recorded before each frame. Two replays are available:
+
+- detection: ``Camera.ball_blob()`` runs on every frame as fast as
+  possible, which measures the detection throughput of the current code;
+- decisions (--compare): ``robot.main()`` runs on the frames at its own
+  pace, and the motor commands it sends are compared, frame by frame, with
+  the recorded ones. The decisions are given the recorded inputs of the
+  tracker: the measures of the ball (BALL chunks) and the ticks of each
+  frame (``Camera.captured_ms``), so that identical code gives identical
+  commands. With --redetect, the ball is measured again in the recorded
+  frames, which are downsampled: the commands are close, not identical.
+
+A match can be recorded on the host too, from synthetic frames (--record).
+
+Usage:
+    python -m host.replay match.rec [--compare] [--redetect] [--tolerance 0.1]
+                                    [--json]
+    python -m host.replay match.rec --record [--frames 250] [--seed 0]
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from host.harness import Board
+
+MAGIC = b"RREC\x01"
+HEADER = struct.Struct("<4sIII")  # tag, ticks_ms, frame number, length
+TRAILER = struct.Struct("<4sI")  # b"RIDX", offset of the index chunk
+ENTRY = struct.Struct("<BI")  # tag, offset
+TAGS = (b"FRAM", b"SENS", b"MOTR", b"STOP", b"INDX", b"BALL")
+FRAME, SENSORS, MOTORS, STOP, INDEX, BALL = 0, 1, 2, 3, 4, 5
+
+
+class Chunk:
+    __slots__ = ("tag", "tick", "frame", "offset", "length")
+
+    def __init__(self, tag: int, tick: int, frame: int, offset: int, length: int):
+        self.tag = tag
+        self.tick = tick
+        self.frame = frame
+        self.offset = offset  # of the payload
+        self.length = length
+
+
+class Recording:
+    """A memory-mapped recording: its chunks, read from the index.
+
+    A recording that wasn't closed (no index) is read chunk by chunk, and a
+    truncated last chunk is ignored.
+
+    Attributes:
+        chunks: all the chunks but the index, in file order
+        frames, sensors, commands, balls: the chunks of each kind (STOP
+            chunks are commands)
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[: len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a recording".format(path))
+        offsets = self._index()
+        if offsets is None:
+            offsets = self._scan()
+        self.chunks = []
+        for offset in offsets:
+            tag, tick, frame, length = HEADER.unpack_from(self.data, offset)
+            self.chunks.append(
+                Chunk(TAGS.index(tag), tick, frame, offset + HEADER.size, length)
+            )
+        self.frames = [chunk for chunk in self.chunks if chunk.tag == FRAME]
+        self.sensors = [chunk for chunk in self.chunks if chunk.tag == SENSORS]
+        self.commands = [chunk for chunk in self.chunks if chunk.tag in (MOTORS, STOP)]
+        self.balls = [chunk for chunk in self.chunks if chunk.tag == BALL]
+
+    def _index(self):
+        """Returns the offsets of the chunks read in the index, if any."""
+        data = self.data
+        if len(data) < len(MAGIC) + TRAILER.size:
+            return None
+        magic, index = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        if magic != b"RIDX":
+            return None
+        if HEADER.unpack_from(data, index)[0] != TAGS[INDEX]:
+            return None
+        (count,) = struct.unpack_from("<I", data, index + HEADER.size)
+        start = index + HEADER.size + 4
+        return [
+            ENTRY.unpack_from(data, start + i * ENTRY.size)[1] for i in range(count)
+        ]
+
+    def _scan(self) -> list:
+        offsets, offset, end = [], len(MAGIC), len(self.data)
+        while offset + HEADER.size <= end:
+            tag, _, _, length = HEADER.unpack_from(self.data, offset)
+            if tag not in TAGS or tag == TAGS[INDEX]:
+                break
+            if offset + HEADER.size + length > end:
+                break  # truncated
+            offsets.append(offset)
+            offset += HEADER.size + length
+        return offsets
+
+    def image(self, chunk: Chunk):
+        """Returns the image of a FRAM chunk."""
+        import image
+
+        width, height = struct.unpack_from("<HH", self.data, chunk.offset)
+        pixels = bytearray(self.data[chunk.offset + 4 : chunk.offset + chunk.length])
+        return image.Image(width=width, height=height, buffer=pixels)
+
+    def sensor_values(self, chunk: Chunk) -> tuple:
+        """Returns (front, back, lines) of a SENS chunk."""
+        values = struct.unpack_from(">6H", self.data, chunk.offset)
+        return values[0], values[1], list(values[2:])
+
+    def ball(self, chunk: Chunk) -> tuple:
+        """Returns (angle, distance) of a BALL chunk."""
+        return struct.unpack_from("<fi", self.data, chunk.offset)
+
+    def command(self, chunk: Chunk) -> tuple:
+        """Returns (frame, lspeed, rspeed, time_ms) of a command, 0s for STOP."""
+        if chunk.tag == STOP:
+            return chunk.frame, 0.0, 0.0, 0
+        lspeed, rspeed, time_ms = struct.unpack_from("<ffi", self.data, chunk.offset)
+        return chunk.frame, round(lspeed, 3), round(rspeed, 3), time_ms
+
+    def close(self) -> None:
+        self.data.close()
+        self._file.close()
+
+
+class ReplaySource:
+    """A frame source of the sensor stand-in that plays a recording.
+
+    Before each frame, the Arduino of the board is set to the last sensor
+    values recorded before that frame.
+
+    Attributes:
+        frame: index of the next frame in recording.frames
+        number, ticks: recorded frame number and ticks_ms of the last
+            frame returned
+    """
+
+    def __init__(self, recording: Recording, board: Board = None):
+        self.recording = recording
+        self.board = board
+        self.frame = 0
+        self.number = 0
+        self.ticks = 0
+        self._sensor = 0
+
+    def __call__(self, width: int, height: int):
+        recording = self.recording
+        chunk = recording.frames[self.frame % len(recording.frames)]
+        self.frame += 1
+        self.number, self.ticks = chunk.frame, chunk.tick
+        if self.board is not None:
+            sensors = recording.sensors
+            while (
+                self._sensor < len(sensors)
+                and sensors[self._sensor].frame < chunk.frame
+            ):
+                self._sensor += 1
+            if self._sensor:
+                arduino = self.board.arduino
+                arduino.front, arduino.back, arduino.lines = recording.sensor_values(
+                    sensors[self._sensor - 1]
+                )
+        img = recording.image(chunk)
+        if (img.width(), img.height()) != (width, height):
+            img = img.copy(x_scale=width / img.width(), y_scale=height / img.height())
+        return img
+
+
+def detect(recording: Recording) -> dict:
+    """Runs the ball detection on every frame, as fast as possible."""
+    board = Board(latency_scale=0)
+    import sensor
+    from sensors import Camera
+
+    sensor.set_source(ReplaySource(recording, board))
+    camera = Camera()
+    found = 0
+    start = time.perf_counter()
+    for _ in recording.frames:
+        if camera.ball_blob():
+            found += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": len(recording.frames),
+        "detections": found,
+        "fps": len(recording.frames) / elapsed if elapsed else 0.0,
+        "detect_us_max": camera.detect_us_max,
+    }
+
+
+def _same(before: list, after: list, tolerance: float) -> bool:
+    """True if two lists of commands have the same speeds and close times."""
+    if before is None or after is None or len(before) != len(after):
+        return before == after
+    for (lspeed1, rspeed1, time1), (lspeed2, rspeed2, time2) in zip(before, after):
+        if (lspeed1, rspeed1) != (lspeed2, rspeed2):
+            return False
+        if abs(time1 - time2) > tolerance * max(abs(time1), abs(time2)):
+            return False
+    return True
+
+
+class RecordedBall:
+    """Stands for the ball's blob of a frame, with its recorded measure."""
+
+    __slots__ = ("angle", "distance")
+
+    def __init__(self, angle: float, distance: int):
+        self.angle = angle
+        self.distance = distance
+
+
+def _feed(camera, source: ReplaySource, recording: Recording, redetect: bool) -> None:
+    """Gives the recorded inputs of the tracker to the decisions of a camera.
+
+    The ball is still searched in each frame (the frame size and the region
+    of interest follow the frames), then replaced by its recorded measure.
+    """
+    balls = {chunk.frame: recording.ball(chunk) for chunk in recording.balls}
+    ball_blob, get_angle, distance_to = (
+        camera.ball_blob,
+        camera.get_angle,
+        camera.distance_to,
+    )
+
+    def replayed_blob():
+        blob = ball_blob()
+        camera.captured_ms = source.ticks  # the time of the recorded frame
+        if redetect:
+            return blob
+        ball = balls.get(source.number)
+        return RecordedBall(*ball) if ball else None
+
+    def angle(blob):
+        return blob.angle if isinstance(blob, RecordedBall) else get_angle(blob)
+
+    def distance(blob):
+        return blob.distance if isinstance(blob, RecordedBall) else distance_to(blob)
+
+    camera.ball_blob = replayed_blob
+    camera.get_angle = angle
+    camera.distance_to = distance
+
+
+def compare(
+    recording: Recording,
+    latency_scale: float = 1.0,
+    tolerance: float = 0.1,
+    redetect: bool = False,
+) -> dict:
+    """Replays the decisions of robot.main and compares the motor commands.
+
+    Stops are sent by timers, their frame depends on the pace of the loop:
+    they are counted, not compared.
+
+    Args:
+        tolerance: relative difference allowed between the times of commands
+        redetect: measures the ball again in the frames, instead of giving
+            the recorded measures (always done if none was recorded)
+
+    Returns:
+        A report with the commands of both runs and the frames where they differ
+    """
+    from host import bench
+
+    board = Board(latency_scale=latency_scale)
+    import robot
+    import sensor
+    from recorder import Recorder
+
+    source = ReplaySource(recording, board)
+    sensor.set_source(source)
+    fd, path = tempfile.mkstemp(suffix=".rec")
+    os.close(fd)
+    replayed = Recorder(path, frames=False)
+    bot = robot.Robot()
+    _feed(bot.camera, source, recording, redetect or not recording.balls)
+    try:
+        bench.run(len(recording.frames), board, lambda: robot.main(bot, replayed))
+        replayed.close()
+        new = Recording(path)
+        # Frame numbers of the replay count the recorded frames
+        numbers = [chunk.frame for chunk in recording.frames]
+        before = {}
+        for chunk in recording.commands:
+            if chunk.tag == MOTORS:
+                frame, *command = recording.command(chunk)
+                before.setdefault(frame, []).append(tuple(command))
+        after = {}
+        for chunk in new.commands:
+            frame, *command = new.command(chunk)
+            if chunk.tag == MOTORS and 0 < frame <= len(numbers):
+                after.setdefault(numbers[frame - 1], []).append(tuple(command))
+        stops = len(new.commands) - sum(len(commands) for commands in after.values())
+        new.close()
+    finally:
+        os.remove(path)
+    last = numbers[-1] if numbers else 0
+    differ = sorted(
+        frame
+        for frame in set(before) | set(after)
+        if frame <= last and not _same(before.get(frame), after.get(frame), tolerance)
+    )
+    return {
+        "frames": len(numbers),
+        "recorded_commands": sum(len(commands) for commands in before.values()),
+        "replayed_commands": sum(len(commands) for commands in after.values()),
+        "recorded_stops": len(recording.commands)
+        - sum(len(commands) for commands in before.values()),
+        "replayed_stops": stops,
+        "differing_frames": len(differ),
+        "first_differences": [
+            {
+                "frame": frame,
+                "recorded": before.get(frame),
+                "replayed": after.get(frame),
+            }
+            for frame in differ[:5]
+        ],
+    }
+
+
+def record(path: str, frames: int, seed: int) -> None:
+    """Records a match of robot.main on synthetic frames."""
+    from host import bench
+    from host.sources import SyntheticSource
+
+    board = Board(SyntheticSource(seed))
+    import robot
+    from recorder import Recorder
+
+    recorder = Recorder(path)
+    bot = robot.Robot()
+    try:
+        bench.run(frames, board, lambda: robot.main(bot, recorder))
+    finally:
+        recorder.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("path", help="recording (match.rec)")
+    parser.add_argument("--compare", action="store_true", help="replay the decisions")
+    parser.add_argument(
+        "--redetect", action="store_true", help="measure the ball in the frames again"
+    )
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--tolerance", type=float, default=0.1, help="on the times")
+    parser.add_argument("--record", action="store_true", help="record synthetic frames")
+    parser.add_argument("--frames", type=int, default=250)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record(args.path, args.frames, args.seed)
+    recording = Recording(args.path)
+    try:
+        if args.compare:
+            report = compare(
+                recording, args.latency_scale, args.tolerance, args.redetect
+            )
+        else:
+            report = detect(recording)
+    finally:
+        recording.close()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print("{}: {}".format(key, value))
+
+
+if __name__ == "__main__":
+    main()
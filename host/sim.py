@@ -0,0 +1,530 @@
+"""Simulates matches of the robot on the host, faster than real time.
+
+The firmware runs unmodified (``robot.main``) on the stand-ins, with a
+virtual clock (``utime.set_clock``) and an event loop that jumps to the
+next deadline instead of waiting for it: an episode takes the time the
+host needs to run the firmware, not the time of the match. The C functions
+of the board still take the virtual time the stand-ins model (snapshots,
+find_blobs, I2C transfers), so the main loop keeps its timing.
+
+The field is a 2D model (x to the right, y towards the opponent goal, mm,
+headings clockwise from y like ``Odometry``) advanced lazily, whenever the
+firmware looks at it (a frame, a read of the Arduino), with NumPy:
+
+- the robot moves on the arc of its wheel speeds (the speeds commanded to
+  the encoder driver, times the efficiency of the wheels), stopped by the
+  walls of the outer area;
+- the ball rolls with an exponential friction and bounces on the walls;
+- the camera sees the ball in its field of view, with the height the
+  firmware's distance table expects at that distance (``CAMERA_K``);
+- the line sensors see the white line under them, the ultrasonic sensors
+  measure the distance to the walls in front and behind.
+
+An episode starts from a random (seeded) pose of the robot and state of the
+ball, and ends when the robot touches the ball or after a duration. Its
+result has the time to the ball and the number of times the robot went
+fully out of the field lines. See ``host.sweep`` to run many of them over
+sets of parameters.
+
+Usage:
+    python -m host.sim [--episodes 10] [--seed 0] [--duration 20]
+                       [--set tracking=0] [--efficiency 0.9] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import selectors
+import time
+
+import numpy as np
+
+from host.bench import summarize
+from host.devices import ArduinoSensors, EncoderDriver
+from host.harness import Board
+
+# Field (mm): the area inside the lines, and the outer area up to the walls
+FIELD_WIDTH = 1580
+FIELD_LENGTH = 2190
+OUTER = 250
+LINE_WIDTH = 20
+ROBOT_RADIUS = 110
+BALL_RADIUS = 37
+# The real robot: the firmware's Robot constants are what it believes
+WHEEL_DIAMETER = 80
+TRACK = 270
+# Line sensors (x right, y forward, mm): front left, front right, rear left
+# and rear right, the order of their bits in safety.LineGuard
+LINE_SENSORS = np.array([[-60.0, 90.0], [60.0, 90.0], [-60.0, -90.0], [60.0, -90.0]])
+SENSOR_REACH = math.hypot(60, 90)  # distance of the line sensors to the center
+LINE, GREEN = 900, 120  # values of a line sensor
+# Camera: at the front of the robot, pitched down
+CAMERA_OFFSET = 90
+CAMERA_HEIGHT = 120
+CAMERA_PITCH = 15  # degrees
+HFOV, VFOV = 70.8, 55.6
+CAMERA_K = 18  # radius of the ball (frame widths) times its distance (mm)
+BALL_RGB = (220, 30, 30)
+# Dynamics
+STEP_S = 0.002  # substeps of the lazy advance
+BALL_TAU_S = 1.5  # time constant of the friction of the ball
+BALL_SPEED = 300  # maximal initial speed (mm/s) of the ball
+
+
+class VirtualClock:
+    """The time of a simulation, in nanoseconds from its start.
+
+    Each read costs READ_NS: a busy-wait on the ticks ends, like on the
+    board (see bus.I2CBus.send_now).
+    """
+
+    READ_NS = 1000
+
+    def __init__(self):
+        self.ns = 0
+
+    def read_ns(self) -> int:
+        self.ns += VirtualClock.READ_NS
+        return self.ns
+
+    def advance(self, seconds: float) -> None:
+        if seconds > 0:
+            self.ns += math.ceil(seconds * 1e9)
+
+    def seconds(self) -> float:
+        return self.ns / 1e9
+
+
+class _Selector(selectors.DefaultSelector):
+    """Polls the file descriptors, then advances the clock to the deadline."""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None:
+            raise RuntimeError("Nothing to wait for in virtual time")
+        self._clock.advance(timeout)
+        return []
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    """An event loop on a virtual clock: it never waits for a deadline."""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__(_Selector(clock))
+        self.clock = clock
+
+    def time(self) -> float:
+        return self.clock.ns / 1e9
+
+
+def _fold(u: np.ndarray, limit: np.ndarray) -> tuple:
+    """Reflects coordinates (one row per axis) into [-limit, limit].
+
+    Returns:
+        (coordinates, sign of the velocity after the bounces)
+    """
+    length = 2 * limit
+    k = np.floor((u + limit) / length)
+    r = (u + limit) - k * length
+    odd = k % 2 == 1
+    return np.where(odd, limit - r, r - limit), np.where(odd, -1.0, 1.0)
+
+
+class World:
+    """The field, the robot and the ball, advanced with the wheel speeds.
+
+    Args:
+        motors: the encoder driver, its speeds drive the wheels
+        lslot, rslot: the slots of the left and right motors
+        clock: the virtual clock
+
+    Attributes:
+        t: time (s) of the state
+        robot: x, y (mm) and heading (radians, clockwise) of the robot
+        ball, ball_velocity: position (mm) and velocity (mm/s) of the ball
+        touched: time (s) the robot touched the ball, None before
+        out_events: number of times the robot went fully out of the lines
+        out_s: time (s) spent fully out
+    """
+
+    def __init__(
+        self, motors: EncoderDriver, lslot: int, rslot: int, clock: VirtualClock
+    ):
+        self.motors = motors
+        self.lslot, self.rslot = lslot, rslot
+        self.clock = clock
+        self.t = 0.0
+        self.robot = np.zeros(3)
+        self.ball = np.zeros(2)
+        self.ball_velocity = np.zeros(2)
+        self.touched = None
+        self.out_events = 0
+        self.out_s = 0.0
+        self._out = False
+        self._wall = np.array([FIELD_WIDTH / 2 + OUTER, FIELD_LENGTH / 2 + OUTER])
+        # The robot is fully out beyond these coordinates
+        self._field = np.array([FIELD_WIDTH / 2, FIELD_LENGTH / 2]) + ROBOT_RADIUS
+
+    def place(self, rng: random.Random) -> None:
+        """Places the robot and the ball at random in the field, apart."""
+        half = np.array([FIELD_WIDTH / 2, FIELD_LENGTH / 2])
+        while True:
+            robot = np.array([rng.uniform(-1, 1), rng.uniform(-1, 1)]) * (
+                half - ROBOT_RADIUS
+            )
+            ball = np.array([rng.uniform(-1, 1), rng.uniform(-1, 1)]) * (
+                half - BALL_RADIUS
+            )
+            if np.hypot(*(ball - robot)) > 500:
+                break
+        self.robot[:2] = robot
+        self.robot[2] = rng.uniform(-math.pi, math.pi)
+        self.ball[:] = ball
+        angle, speed = rng.uniform(-math.pi, math.pi), rng.uniform(0, BALL_SPEED)
+        self.ball_velocity[:] = speed * math.sin(angle), speed * math.cos(angle)
+
+    def advance(self) -> None:
+        """Advances the state to the time of the clock."""
+        now = self.clock.ns / 1e9
+        duration = now - self.t
+        if duration <= 0 or self.touched is not None:
+            return
+        steps = max(1, math.ceil(duration / STEP_S))
+        dt = duration / steps
+        ts = np.arange(1, steps + 1) * dt
+        # Wheels (mm/s), the right one is mounted mirrored
+        speed = self.motors.speed
+        wheel = self.motors.efficiency * math.pi * WHEEL_DIAMETER / 60
+        left, right = speed[self.lslot] * wheel, -speed[self.rslot] * wheel
+        forward, spin = (left + right) / 2, (left - right) / TRACK
+        heading = self.robot[2]
+        headings = heading + spin * ts
+        middle = headings - spin * dt / 2
+        moves = forward * dt * np.stack((np.sin(middle), np.cos(middle)))
+        robot = self.robot[:2, None] + np.cumsum(moves, axis=1)
+        # The walls stop the robot (its state restarts from there next time)
+        limit = self._wall[:, None] - ROBOT_RADIUS
+        robot = np.clip(robot, -limit, limit)
+        # The ball slows down exponentially and bounces on the walls
+        decay = np.exp(-ts / BALL_TAU_S)
+        travel = BALL_TAU_S * (1 - decay)
+        ball, signs = _fold(
+            self.ball[:, None] + self.ball_velocity[:, None] * travel,
+            self._wall[:, None] - BALL_RADIUS,
+        )
+        # The first contact ends the episode
+        gap = ball - robot
+        touch = gap[0] * gap[0] + gap[1] * gap[1] <= (ROBOT_RADIUS + BALL_RADIUS) ** 2
+        end = steps
+        if touch.any():
+            end = int(np.argmax(touch)) + 1
+            self.touched = self.t + ts[end - 1]
+        # Fully out of the lines
+        out = (np.abs(robot[:, :end]) > self._field[:, None]).any(axis=0)
+        if out.any():
+            previous = np.concatenate(([self._out], out[:-1]))
+            self.out_events += int(np.count_nonzero(out & ~previous))
+            self.out_s += float(np.count_nonzero(out)) * dt
+        self._out = bool(out[-1])
+        last = end - 1
+        self.robot[:2] = robot[:, last]
+        self.robot[2] = (headings[last] + math.pi) % (2 * math.pi) - math.pi
+        self.ball[:] = ball[:, last]
+        self.ball_velocity *= decay[last] * signs[:, last]
+        self.t = now
+
+    def _axes(self) -> tuple:
+        heading = self.robot[2]
+        forward = np.array([math.sin(heading), math.cos(heading)])
+        right = np.array([math.cos(heading), -math.sin(heading)])
+        return forward, right
+
+    def lines(self) -> list:
+        """Returns the values of the four line sensors."""
+        x, y = abs(self.robot[0]), abs(self.robot[1])
+        half_w, half_l, half_line = FIELD_WIDTH / 2, FIELD_LENGTH / 2, LINE_WIDTH / 2
+        reach = SENSOR_REACH + half_line
+        if abs(x - half_w) > reach and abs(y - half_l) > reach:
+            return [GREEN] * 4  # no line under any sensor
+        forward, right = self._axes()
+        points = self.robot[:2] + np.outer(LINE_SENSORS[:, 0], right)
+        points += np.outer(LINE_SENSORS[:, 1], forward)
+        ax, ay = np.abs(points[:, 0]), np.abs(points[:, 1])
+        side = (np.abs(ax - half_w) <= half_line) & (ay <= half_l + half_line)
+        end = (np.abs(ay - half_l) <= half_line) & (ax <= half_w + half_line)
+        return np.where(side | end, LINE, GREEN).tolist()
+
+    def distances(self) -> tuple:
+        """Returns the distances (cm) to the walls in front and behind."""
+        heading = self.robot[2]
+        dx, dy = math.sin(heading), math.cos(heading)
+        result = []
+        for sign in (1, -1):
+            hits = []
+            for position, direction, wall in (
+                (self.robot[0], sign * dx, self._wall[0]),
+                (self.robot[1], sign * dy, self._wall[1]),
+            ):
+                if direction:
+                    hits.append((math.copysign(wall, direction) - position) / direction)
+            distance = min(hits) - ROBOT_RADIUS
+            result.append(int(max(0, min(400, distance / 10))))
+        return tuple(result)
+
+    def ball_in_view(self):
+        """Returns the disc (u, v, radius) of the ball in the frame, or None."""
+        forward, right = self._axes()
+        relative = self.ball - (self.robot[:2] + CAMERA_OFFSET * forward)
+        ahead, lateral = float(relative @ forward), float(relative @ right)
+        if ahead <= BALL_RADIUS:
+            return None
+        distance = math.hypot(ahead, lateral)
+        radius = CAMERA_K / distance
+        u = 0.5 + math.degrees(math.atan2(lateral, ahead)) / HFOV
+        below = math.atan2(CAMERA_HEIGHT - BALL_RADIUS, distance) - math.radians(
+            CAMERA_PITCH
+        )
+        v = 0.5 + 0.5 * math.tan(below) / math.tan(math.radians(VFOV / 2))
+        if not (-radius < u < 1 + radius and v < 1 + radius * 4 / 3):
+            return None
+        return u, v, radius
+
+
+class FieldCamera:
+    """The frame source of the sensor stand-in: the ball seen in the world."""
+
+    def __init__(self, world: World):
+        self.world = world
+
+    def __call__(self, width: int, height: int):
+        import image
+
+        world = self.world
+        world.advance()
+        shapes = []
+        disc = world.ball_in_view()
+        if disc is not None:
+            shapes.append(image.Disc(*disc, BALL_RGB))
+        return image.Image(width=width, height=height, scene=image.Scene(shapes=shapes))
+
+
+class FieldSensors(ArduinoSensors):
+    """The Arduino, whose sensors measure the world."""
+
+    def __init__(self, clock=None):
+        super().__init__(clock=clock)
+        self.world = None
+
+    def read(self, nbytes: int) -> bytes:
+        world = self.world
+        if world is not None:
+            world.advance()
+            self.lines = world.lines()
+            self.front, self.back = world.distances()
+        return super().read(nbytes)
+
+
+def _apply(params: dict) -> dict:
+    """Sets constants of the firmware's Robot class, returns the old values.
+
+    Args:
+        params: values by lowercase name of the constants (tracking, ...)
+    """
+    import robot
+
+    old = {}
+    for name, value in params.items():
+        attribute = name.upper()
+        if not hasattr(robot.Robot, attribute):
+            raise ValueError("Robot has no constant {}".format(attribute))
+        old[name] = getattr(robot.Robot, attribute)
+        setattr(robot.Robot, attribute, value)
+    return old
+
+
+async def _play(world: World, bot, duration: float) -> None:
+    import robot
+
+    main = asyncio.create_task(robot.main(bot))
+    try:
+        while world.touched is None and world.t < duration:
+            await asyncio.sleep(robot.Robot.PERIOD / 1000)
+            world.advance()
+    finally:
+        main.cancel()
+        try:
+            await main
+        except asyncio.CancelledError:
+            pass
+        bot.guard.stop()
+
+
+def run_episode(
+    seed: int,
+    params: dict = None,
+    duration: float = 20.0,
+    efficiency: float = 0.9,
+    latency_scale: float = 1.0,
+) -> dict:
+    """Plays an episode: robot.main from a random start, until the ball.
+
+    Args:
+        seed: the start of the robot and the ball
+        params: constants of the firmware's Robot (see _apply)
+        duration: maximal time (s) of the episode
+        efficiency: of the wheels (see EncoderDriver)
+        latency_scale: of the modelled times of the C functions (see Board)
+
+    Returns:
+        the time to the ball (s, None if not reached), the times the robot
+        went out of the lines and the time it was out, the retreats of the
+        line guard, the frames, and the virtual and host durations
+    """
+    import pyb
+    import robot
+    import sensor
+    import utime
+
+    started = time.perf_counter()
+    clock = VirtualClock()
+    utime.set_clock(clock)
+    old = _apply(params or {})
+    loop = VirtualLoop(clock)
+    try:
+        asyncio.set_event_loop(loop)
+        motors = EncoderDriver(efficiency=efficiency, clock=clock.seconds)
+        arduino = FieldSensors(clock=clock.seconds)
+        Board(latency_scale=latency_scale, motors=motors, arduino=arduino)
+        bot = robot.Robot()
+        world = World(motors, bot.lmotor.slot, bot.rmotor.slot, clock)
+        world.place(random.Random(seed))
+        arduino.world = world
+        sensor.set_source(FieldCamera(world))
+        try:
+            loop.run_until_complete(_play(world, bot, duration))
+        finally:
+            # The background tasks of the firmware (sensors, odometry, bus)
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        return {
+            "seed": seed,
+            "time_to_ball": world.touched,
+            "out_events": world.out_events,
+            "out_s": world.out_s,
+            "retreats": bot.guard.triggers,
+            "frames": bot.camera.frames,
+            "virtual_s": world.t,
+            "host_s": time.perf_counter() - started,
+        }
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        _apply(old)
+        pyb.Timer.deinit_all()
+        utime.set_clock(None)
+
+
+def report(results: list) -> dict:
+    """Aggregates the results of episodes."""
+    reached = [r["time_to_ball"] for r in results if r["time_to_ball"] is not None]
+    virtual = sum(r["virtual_s"] for r in results)
+    host = sum(r["host_s"] for r in results)
+    return {
+        "episodes": len(results),
+        "reached": len(reached) / len(results),
+        "time_to_ball_s": summarize(reached) if reached else None,
+        "out_of_bounds": sum(1 for r in results if r["out_events"]) / len(results),
+        "out_events": sum(r["out_events"] for r in results) / len(results),
+        "retreats": sum(r["retreats"] for r in results) / len(results),
+        "speedup": virtual / host if host else 0.0,
+    }
+
+
+def parse_value(text: str):
+    """Parses the value of a parameter: an int, a float or a boolean."""
+    lowered = text.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def format_report(report: dict) -> str:
+    line = "reached {:.0%}".format(report["reached"])
+    if report["time_to_ball_s"]:
+        line += "  time to ball mean {mean:.2f}  p50 {p50:.2f}  p90 {p90:.2f} s".format(
+            **report["time_to_ball_s"]
+        )
+    line += "  out of bounds {:.0%} ({:.2f}/episode)  retreats {:.2f}  x{:.0f}".format(
+        report["out_of_bounds"],
+        report["out_events"],
+        report["retreats"],
+        report["speedup"],
+    )
+    return line
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--episodes", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="a constant of Robot (wheel_diameter, tracking, ...)",
+    )
+    parser.add_argument("--efficiency", type=float, default=0.9)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    params = {}
+    for item in args.set:
+        name, _, value = item.partition("=")
+        params[name] = parse_value(value)
+    results = [
+        run_episode(args.seed + i, params, args.duration, args.efficiency)
+        for i in range(args.episodes)
+    ]
+    summary = report(results)
+    if args.json:
+        print(
+            json.dumps(
+                {"params": params, "report": summary, "episodes": results}, indent=2
+            )
+        )
+        return
+    for result in results:
+        reached = result["time_to_ball"]
+        print(
+            "seed {:4d}: {}  out {}  retreats {}  frames {}".format(
+                result["seed"],
+                (
+                    "ball in {:5.2f} s".format(reached)
+                    if reached is not None
+                    else "no ball   "
+                ),
+                result["out_events"],
+                result["retreats"],
+                result["frames"],
+            )
+        )
+    print(format_report(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Frame sources for the ``sensor`` stand-in: ``source(width, height) -> Image``."""
+
+import os
+import random
+
+import image
+
+
+class SyntheticSource:
+    """A red ball wandering across the field of view.
+
+    The ball moves with a random velocity, bounces on the borders and goes
+    out of sight from time to time, so that the search behaviour runs too.
+    Runs are reproducible for a given seed.
+    """
+
+    BALL_RGB = (220, 30, 30)
+
+    def __init__(self, seed: int = 0, hidden_every: int = 200, hidden_for: int = 25):
+        self._random = random.Random(seed)
+        self._hidden_every = hidden_every
+        self._hidden_for = hidden_for
+        self.frame = 0
+        self.u, self.v = 0.5, 0.6
+        self.du = self._random.uniform(-0.01, 0.01)
+        self.dv = self._random.uniform(-0.004, 0.004)
+        self.radius = 0.05
+
+    def step(self) -> None:
+        self.frame += 1
+        self.u += self.du
+        self.v += self.dv
+        if not 0.05 < self.u < 0.95:
+            self.du = -self.du
+        if not 0.3 < self.v < 0.9:
+            self.dv = -self.dv
+        # the ball gets closer when it goes down the image
+        self.radius = 0.01 + 0.08 * (self.v - 0.3)
+
+    def __call__(self, width: int, height: int):
+        self.step()
+        shapes = []
+        if self._hidden_every <= 0 or (
+            self.frame % self._hidden_every < self._hidden_every - self._hidden_for
+        ):
+            shapes.append(image.Disc(self.u, self.v, self.radius, self.BALL_RGB))
+        scene = image.Scene(shapes=shapes)
+        return image.Image(width=width, height=height, scene=scene)
+
+
+class RecordedSource:
+    """Replays recorded frames, looping at the end.
+
+    Args:
+        path: a directory of PPM files (replayed in name order), or a file
+            of raw RGB565 frames stored back to back
+        size: (width, height) of the raw frames, unused for PPM files
+    """
+
+    def __init__(self, path: str, size=(320, 240)):
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.endswith(".ppm"))
+            self._frames = [image.Image(os.path.join(path, name)) for name in names]
+        else:
+            width, height = size
+            with open(path, "rb") as file:
+                data = file.read()
+            length = width * height * 2
+            self._frames = [
+                image.Image(
+                    width=width,
+                    height=height,
+                    buffer=bytearray(data[offset : offset + length]),
+                )
+                for offset in range(0, len(data) - length + 1, length)
+            ]
+        if not self._frames:
+            raise ValueError("No frame found in {}".format(path))
+        self.frame = 0
+
+    def __call__(self, width: int, height: int):
+        img = self._frames[self.frame % len(self._frames)]
+        self.frame += 1
+        if (img.width(), img.height()) != (width, height):
+            img = img.copy(x_scale=width / img.width(), y_scale=height / img.height())
+        return img
@@ -0,0 +1,511 @@
+"""Stand-in for OpenMV's ``image`` module.
+
+An :class:`Image` is either:
+    - synthetic: a :class:`Scene` of coloured shapes placed in normalized
+      coordinates, so the same scene can be shot at any frame size.
+      ``find_blobs`` is computed analytically and its cost on the H7 is
+      modelled with ``FIND_BLOBS_NS_PER_PIXEL`` (0 disables it).
+    - raster: a RGB565 buffer (one little-endian uint16 per pixel), e.g. a
+      recorded frame or a PPM file. ``find_blobs`` labels the pixels for real.
+"""
+
+import array
+import math
+import sys
+
+import utime
+
+GRAYSCALE = 1
+RGB565 = 2
+
+# find_blobs scans the ROI once per threshold, with a cost per visited pixel
+FIND_BLOBS_NS_PER_PIXEL = 300
+FIND_BLOBS_OVERHEAD_US = 100
+
+_LAB_TABLE = None
+_MATCH_TABLES = {}
+
+
+def _linear(channel: int) -> float:
+    channel /= 255
+    if channel <= 0.04045:
+        return channel / 12.92
+    return ((channel + 0.055) / 1.055) ** 2.4
+
+
+def _lab_f(t: float) -> float:
+    return t ** (1 / 3) if t > 0.008856 else 7.787 * t + 16 / 116
+
+
+def rgb_to_lab(rgb) -> tuple:
+    """Converts a (r, g, b) tuple (0-255) to a (l, a, b) tuple like OpenMV."""
+    r, g, b = (_linear(channel) for channel in rgb)
+    x = _lab_f((0.4124 * r + 0.3576 * g + 0.1805 * b) / 0.95047)
+    y = _lab_f(0.2126 * r + 0.7152 * g + 0.0722 * b)
+    z = _lab_f((0.0193 * r + 0.1192 * g + 0.9505 * b) / 1.08883)
+    lab_l = round(116 * y - 16)
+    lab_a = max(-128, min(127, round(500 * (x - y))))
+    lab_b = max(-128, min(127, round(200 * (y - z))))
+    return lab_l, lab_a, lab_b
+
+
+def rgb_to_rgb565(rgb) -> int:
+    r, g, b = rgb
+    return ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
+
+
+def rgb565_to_rgb(pixel: int) -> tuple:
+    r = (pixel >> 11) & 0x1F
+    g = (pixel >> 5) & 0x3F
+    b = pixel & 0x1F
+    return (r * 255 + 15) // 31, (g * 255 + 31) // 63, (b * 255 + 15) // 31
+
+
+def _lab_table() -> list:
+    global _LAB_TABLE
+    if _LAB_TABLE is None:
+        _LAB_TABLE = [rgb_to_lab(rgb565_to_rgb(pixel)) for pixel in range(65536)]
+    return _LAB_TABLE
+
+
+def _bounds(threshold) -> tuple:
+    """Returns (lmin, lmax, amin, amax, bmin, bmax), swapping reversed pairs."""
+    values = tuple(threshold) + (0, 100, -128, 127, -128, 127)[len(threshold) :]
+    bounds = ()
+    for i in range(0, 6, 2):
+        bounds += (min(values[i], values[i + 1]), max(values[i], values[i + 1]))
+    return bounds
+
+
+def _inside(lab, bounds) -> bool:
+    return (
+        bounds[0] <= lab[0] <= bounds[1]
+        and bounds[2] <= lab[1] <= bounds[3]
+        and bounds[4] <= lab[2] <= bounds[5]
+    )
+
+
+def _match_table(bounds, invert: bool) -> bytes:
+    key = bounds + (invert,)
+    if key not in _MATCH_TABLES:
+        _MATCH_TABLES[key] = bytes(
+            _inside(lab, bounds) != invert for lab in _lab_table()
+        )
+    return _MATCH_TABLES[key]
+
+
+class Blob:
+    """A blob, with the same accessors as OpenMV's ``image.blob``."""
+
+    def __init__(self, rect, pixels, cx, cy, code=1, count=1, roundness=1.0):
+        self._rect = tuple(rect)
+        self._pixels = int(pixels)
+        self._cx = cx
+        self._cy = cy
+        self._code = code
+        self._count = count
+        self._roundness = roundness
+
+    def __repr__(self) -> str:
+        return '{{"x":{}, "y":{}, "w":{}, "h":{}, "pixels":{}, "code":{}}}'.format(
+            *self._rect, self._pixels, self._code
+        )
+
+    def __getitem__(self, index):
+        return (self._rect + (self._pixels, self.cx(), self.cy()))[index]
+
+    def rect(self) -> tuple:
+        return self._rect
+
+    def x(self) -> int:
+        return self._rect[0]
+
+    def y(self) -> int:
+        return self._rect[1]
+
+    def w(self) -> int:
+        return self._rect[2]
+
+    def h(self) -> int:
+        return self._rect[3]
+
+    def pixels(self) -> int:
+        return self._pixels
+
+    def cx(self) -> int:
+        return int(round(self._cx))
+
+    def cy(self) -> int:
+        return int(round(self._cy))
+
+    def cxf(self) -> float:
+        return float(self._cx)
+
+    def cyf(self) -> float:
+        return float(self._cy)
+
+    def code(self) -> int:
+        return self._code
+
+    def count(self) -> int:
+        return self._count
+
+    def area(self) -> int:
+        return self._rect[2] * self._rect[3]
+
+    def density(self) -> float:
+        return self._pixels / max(1, self.area())
+
+    def roundness(self) -> float:
+        return self._roundness
+
+    def elongation(self) -> float:
+        return 1 - self._roundness
+
+
+class Disc:
+    """A filled disc. (u, v) is the center and radius is relative to the width."""
+
+    def __init__(self, u: float, v: float, radius: float, rgb):
+        self.u = u
+        self.v = v
+        self.radius = radius
+        self.rgb = tuple(rgb)
+        self.lab = rgb_to_lab(self.rgb)
+
+    def extent(self, width: int, height: int) -> tuple:
+        cx, cy, r = self.u * width, self.v * height, self.radius * width
+        return cx - r, cy - r, cx + r, cy + r
+
+    def pixels(self, width: int, height: int, clip) -> float:
+        """Area of the disc inside clip (x0, y0, x1, y1), column by column."""
+        cx, cy, r = self.u * width, self.v * height, self.radius * width
+        area = 0.0
+        for x in range(int(clip[0]), int(math.ceil(clip[2]))):
+            dx = x + 0.5 - cx
+            if abs(dx) >= r:
+                continue
+            chord = math.sqrt(r * r - dx * dx)
+            area += max(0.0, min(cy + chord, clip[3]) - max(cy - chord, clip[1]))
+        return area
+
+    def covers(self, x: float, y: float, width: int, height: int) -> bool:
+        dx, dy = x - self.u * width, y - self.v * height
+        return dx * dx + dy * dy <= (self.radius * width) ** 2
+
+
+class Rect:
+    """A filled rectangle. (u, v) is the top-left corner, (uw, vh) its size."""
+
+    def __init__(self, u: float, v: float, uw: float, vh: float, rgb):
+        self.u = u
+        self.v = v
+        self.uw = uw
+        self.vh = vh
+        self.rgb = tuple(rgb)
+        self.lab = rgb_to_lab(self.rgb)
+
+    def extent(self, width: int, height: int) -> tuple:
+        x, y = self.u * width, self.v * height
+        return x, y, x + self.uw * width, y + self.vh * height
+
+    def pixels(self, width: int, height: int, clip) -> float:
+        return (clip[2] - clip[0]) * (clip[3] - clip[1])
+
+    def covers(self, x: float, y: float, width: int, height: int) -> bool:
+        x0, y0, x1, y1 = self.extent(width, height)
+        return x0 <= x < x1 and y0 <= y < y1
+
+
+class Scene:
+    """Shapes drawn over a uniform background, the last shape on top."""
+
+    def __init__(self, background=(40, 110, 50), shapes=()):
+        self.background = tuple(background)
+        self.shapes = list(shapes)
+
+
+def _clip_roi(roi, width: int, height: int) -> tuple:
+    if roi is None:
+        return 0, 0, width, height
+    x, y, w, h = roi
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    return x0, y0, max(0, x1 - x0), max(0, y1 - y0)
+
+
+def _merge(blobs: list, margin: int) -> list:
+    """Merges blobs whose bounding rectangles (grown by margin) overlap."""
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(blobs)):
+            for j in range(i + 1, len(blobs)):
+                a, b = blobs[i], blobs[j]
+                if (
+                    a.x() - margin <= b.x() + b.w()
+                    and b.x() - margin <= a.x() + a.w()
+                    and a.y() - margin <= b.y() + b.h()
+                    and b.y() - margin <= a.y() + a.h()
+                ):
+                    x0, y0 = min(a.x(), b.x()), min(a.y(), b.y())
+                    x1 = max(a.x() + a.w(), b.x() + b.w())
+                    y1 = max(a.y() + a.h(), b.y() + b.h())
+                    pixels = a.pixels() + b.pixels()
+                    blobs[i] = Blob(
+                        (x0, y0, x1 - x0, y1 - y0),
+                        pixels,
+                        (a.cxf() * a.pixels() + b.cxf() * b.pixels()) / pixels,
+                        (a.cyf() * a.pixels() + b.cyf() * b.pixels()) / pixels,
+                        code=a.code() | b.code(),
+                        count=a.count() + b.count(),
+                        roundness=min(x1 - x0, y1 - y0) / max(x1 - x0, y1 - y0, 1),
+                    )
+                    del blobs[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return blobs
+
+
+class Image:
+    """A frame, built from a Scene, a RGB565 buffer or a PPM (P6) file."""
+
+    def __init__(self, path=None, *, width=0, height=0, scene=None, buffer=None):
+        if path is not None:
+            width, height, buffer = self._load_ppm(path)
+        self._width = width
+        self._height = height
+        self._scene = scene
+        self._buffer = buffer
+
+    @staticmethod
+    def _load_ppm(path: str) -> tuple:
+        with open(path, "rb") as file:
+            data = file.read()
+        fields, offset = [], 0
+        while len(fields) < 4:
+            while data[offset : offset + 1].isspace():
+                offset += 1
+            if data[offset : offset + 1] == b"#":
+                offset = data.index(b"\n", offset)
+                continue
+            end = offset
+            while not data[end : end + 1].isspace():
+                end += 1
+            fields.append(data[offset:end])
+            offset = end
+        if fields[0] != b"P6":
+            raise OSError("Only binary PPM (P6) files are supported")
+        width, height = int(fields[1]), int(fields[2])
+        rgb = data[offset + 1 : offset + 1 + width * height * 3]
+        pixels = array.array(
+            "H", (rgb_to_rgb565(rgb[i : i + 3]) for i in range(0, len(rgb), 3))
+        )
+        if sys.byteorder == "big":
+            pixels.byteswap()
+        return width, height, bytearray(pixels.tobytes())
+
+    def width(self) -> int:
+        return self._width
+
+    def height(self) -> int:
+        return self._height
+
+    def format(self) -> int:
+        return RGB565
+
+    def size(self) -> int:
+        return self._width * self._height * 2
+
+    def bytearray(self) -> bytearray:
+        """Returns the RGB565 pixels, rasterizing the scene if needed."""
+        if self._buffer is None:
+            self._buffer = self._rasterize()
+        return self._buffer
+
+    def _rasterize(self) -> bytearray:
+        width, height = self._width, self._height
+        pixels = array.array("H", [rgb_to_rgb565(self._scene.background)]) * (
+            width * height
+        )
+        for shape in self._scene.shapes:
+            x0, y0, x1, y1 = shape.extent(width, height)
+            color = rgb_to_rgb565(shape.rgb)
+            for y in range(max(0, int(y0)), min(height, int(math.ceil(y1)))):
+                for x in range(max(0, int(x0)), min(width, int(math.ceil(x1)))):
+                    if shape.covers(x + 0.5, y + 0.5, width, height):
+                        pixels[y * width + x] = color
+        if sys.byteorder == "big":
+            pixels.byteswap()
+        return bytearray(pixels.tobytes())
+
+    def _pixels(self) -> array.array:
+        pixels = array.array("H")
+        pixels.frombytes(bytes(self.bytearray()))
+        if sys.byteorder == "big":
+            pixels.byteswap()
+        return pixels
+
+    def get_pixel(self, x: int, y: int, rgbtuple: bool = True):
+        pixel = self._pixels()[y * self._width + x]
+        return rgb565_to_rgb(pixel) if rgbtuple else pixel
+
+    def copy(self, roi=None, x_scale: float = 1.0, y_scale: float = 1.0):
+        """Returns a cropped and/or scaled copy (nearest neighbour)."""
+        x, y, w, h = _clip_roi(roi, self._width, self._height)
+        new_w, new_h = max(1, int(w * x_scale)), max(1, int(h * y_scale))
+        if self._buffer is None and roi is None:
+            return Image(width=new_w, height=new_h, scene=self._scene)
+        source = self._pixels()
+        pixels = array.array(
+            "H",
+            (
+                source[(y + j * h // new_h) * self._width + x + i * w // new_w]
+                for j in range(new_h)
+                for i in range(new_w)
+            ),
+        )
+        if sys.byteorder == "big":
+            pixels.byteswap()
+        return Image(width=new_w, height=new_h, buffer=bytearray(pixels.tobytes()))
+
+    def find_blobs(
+        self,
+        thresholds,
+        invert=False,
+        roi=None,
+        x_stride=2,
+        y_stride=1,
+        area_threshold=10,
+        pixels_threshold=10,
+        merge=False,
+        margin=0,
+    ) -> list:
+        roi = _clip_roi(roi, self._width, self._height)
+        if FIND_BLOBS_NS_PER_PIXEL and self._buffer is None:
+            scanned = roi[2] * roi[3] // (x_stride * y_stride) * len(thresholds)
+            utime.sleep(
+                FIND_BLOBS_OVERHEAD_US / 1e6 + scanned * FIND_BLOBS_NS_PER_PIXEL / 1e9
+            )
+        blobs = []
+        for index, threshold in enumerate(thresholds):
+            bounds = _bounds(threshold)
+            if self._buffer is None:
+                found = self._scene_blobs(bounds, invert, roi, 1 << index)
+            else:
+                found = self._raster_blobs(
+                    bounds, invert, roi, x_stride, y_stride, 1 << index
+                )
+            blobs.extend(
+                blob
+                for blob in found
+                if blob.pixels() >= pixels_threshold and blob.area() >= area_threshold
+            )
+        if merge:
+            blobs = _merge(blobs, margin)
+        return blobs
+
+    def _scene_blobs(self, bounds, invert, roi, code) -> list:
+        blobs = []
+        rx, ry, rw, rh = roi
+        for shape in self._scene.shapes:
+            if _inside(shape.lab, bounds) == invert:
+                continue
+            x0, y0, x1, y1 = shape.extent(self._width, self._height)
+            clip = (max(x0, rx), max(y0, ry), min(x1, rx + rw), min(y1, ry + rh))
+            if clip[0] >= clip[2] or clip[1] >= clip[3]:
+                continue
+            x, y = int(clip[0]), int(clip[1])
+            w = int(math.ceil(clip[2])) - x
+            h = int(math.ceil(clip[3])) - y
+            pixels = shape.pixels(self._width, self._height, clip)
+            if pixels < 1:
+                continue
+            roundness = min(w, h) / max(w, h)
+            if isinstance(shape, Rect):
+                roundness = min(roundness, 0.5)
+            blobs.append(
+                Blob(
+                    (x, y, w, h),
+                    pixels,
+                    (clip[0] + clip[2]) / 2,
+                    (clip[1] + clip[3]) / 2,
+                    code=code,
+                    roundness=roundness,
+                )
+            )
+        return blobs
+
+    def _raster_blobs(self, bounds, invert, roi, x_stride, y_stride, code) -> list:
+        """Labels matching pixels of the strided grid (4-connectivity)."""
+        table = _match_table(bounds, invert)
+        pixels = self._pixels()
+        rx, ry, rw, rh = roi
+        cols = range(rx, rx + rw, x_stride)
+        rows = range(ry, ry + rh, y_stride)
+        ncols = len(cols)
+        mask = bytearray(table[pixels[y * self._width + x]] for y in rows for x in cols)
+        blobs = []
+        for start in range(len(mask)):
+            if not mask[start]:
+                continue
+            mask[start] = 0
+            stack = [start]
+            count = sx = sy = sxx = syy = sxy = 0
+            xmin = ymin = 1 << 30
+            xmax = ymax = -1
+            while stack:
+                cell = stack.pop()
+                row, col = divmod(cell, ncols)
+                x, y = cols[col], rows[row]
+                count += 1
+                sx += x
+                sy += y
+                sxx += x * x
+                syy += y * y
+                sxy += x * y
+                xmin, xmax = min(xmin, x), max(xmax, x)
+                ymin, ymax = min(ymin, y), max(ymax, y)
+                if col > 0 and mask[cell - 1]:
+                    mask[cell - 1] = 0
+                    stack.append(cell - 1)
+                if col < ncols - 1 and mask[cell + 1]:
+                    mask[cell + 1] = 0
+                    stack.append(cell + 1)
+                if row > 0 and mask[cell - ncols]:
+                    mask[cell - ncols] = 0
+                    stack.append(cell - ncols)
+                if cell + ncols < len(mask) and mask[cell + ncols]:
+                    mask[cell + ncols] = 0
+                    stack.append(cell + ncols)
+            cx, cy = sx / count, sy / count
+            vxx = sxx / count - cx * cx + x_stride * x_stride / 12
+            vyy = syy / count - cy * cy + y_stride * y_stride / 12
+            vxy = sxy / count - cx * cy
+            spread = math.sqrt(((vxx - vyy) / 2) ** 2 + vxy * vxy)
+            major, minor = (vxx + vyy) / 2 + spread, (vxx + vyy) / 2 - spread
+            blobs.append(
+                Blob(
+                    (xmin, ymin, xmax - xmin + x_stride, ymax - ymin + y_stride),
+                    count * x_stride * y_stride,
+                    cx,
+                    cy,
+                    code=code,
+                    roundness=math.sqrt(max(minor, 0) / major) if major > 0 else 1.0,
+                )
+            )
+        return blobs
+
+    def draw_rectangle(self, *args, **kwargs):
+        return self
+
+    def draw_cross(self, *args, **kwargs):
+        return self
+
+    def draw_circle(self, *args, **kwargs):
+        return self
+
+    def draw_string(self, *args, **kwargs):
+        return self
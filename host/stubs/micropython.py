@@ -0,0 +1,86 @@
+"""Stand-in for MicroPython's ``micropython`` module.
+
+Callbacks given to ``schedule()`` run on the main thread "between two
+bytecodes", like on the board: a profile hook of the main thread runs them
+at the next Python call or return, and the asyncio loop is woken up if it
+is idle. Like the C functions of the board, the blocking calls of the
+stand-ins (``time.sleep``) delay them until they return.
+"""
+
+import asyncio
+import collections
+import sys
+import threading
+import traceback
+
+QUEUE_SIZE = 8
+
+_pending = collections.deque()
+_running = False
+_main = threading.main_thread()
+_loop = None
+
+
+def const(value):
+    return value
+
+
+def alloc_emergency_exception_buf(size: int) -> None:
+    pass
+
+
+def schedule(function, arg) -> None:
+    """Queues function(arg) to run on the main thread."""
+    if len(_pending) >= QUEUE_SIZE:
+        raise RuntimeError("schedule queue full")
+    _pending.append((function, arg))
+    if threading.current_thread() is not _main and _loop is not None:
+        try:
+            _loop.call_soon_threadsafe(run_pending)
+        except RuntimeError:  # the loop is closed
+            pass
+
+
+def run_pending() -> None:
+    """Runs the scheduled callbacks (on the main thread, not nested)."""
+    global _running
+    if _running:
+        return
+    _running = True
+    try:
+        while _pending:
+            function, arg = _pending.popleft()
+            try:
+                function(arg)
+            except Exception:
+                traceback.print_exc()
+    finally:
+        _running = False
+
+
+def _profile(frame, event, arg) -> None:
+    if _pending:
+        run_pending()
+
+
+def install() -> None:
+    """Runs the scheduled callbacks on the main thread, from now on.
+
+    Called from the main thread, by the stand-ins that schedule callbacks
+    (pyb.Timer).
+    """
+    global _loop
+    try:
+        _loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _loop = None
+    if sys.getprofile() is not _profile:
+        sys.setprofile(_profile)
+
+
+def uninstall() -> None:
+    global _loop
+    _loop = None
+    _pending.clear()
+    if sys.getprofile() is _profile:
+        sys.setprofile(None)
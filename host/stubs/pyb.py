@@ -0,0 +1,330 @@
+"""Stand-in for the ``pyb`` module of the OpenMV Cam.
+
+Only the parts used by the firmware are provided. Every I2C bus is shared
+between the ``I2C`` objects created on the same pin, like on the board:
+slave devices are attached to a :class:`Bus` (see ``host.devices``), and
+all transfers are recorded with a timestamp in ``Bus.traffic``.
+
+Transfers block for the time they would take on the wire
+(``(bytes + 1) * 9`` bits at the bus baudrate plus a fixed overhead),
+multiplied by ``LATENCY_SCALE``. Set it to 0 to disable the latency model.
+
+The callback of a :class:`Timer` is called from a thread, like an interrupt
+handler: it should only schedule work with ``micropython.schedule()``.
+While a timer runs, the thread switch interval of CPython is shortened to
+``TIMER_SWITCH_S``, so that the thread gets the interpreter about as
+promptly as an interrupt gets the CPU. With a virtual clock (see
+``utime.set_clock``), the running event loop calls it at virtual time
+instead, then the scheduled callbacks: only between two steps of the tasks.
+"""
+
+import asyncio
+import collections
+import errno
+import fcntl
+import os
+import sys
+import termios
+import threading
+import time as _time
+
+import micropython
+import utime
+
+LATENCY_SCALE = 1.0
+TRANSFER_OVERHEAD_US = 30
+TIMER_SWITCH_S = 0.0002
+
+Transfer = collections.namedtuple("Transfer", "ticks_us kind addr data")
+
+
+class Bus:
+    """The physical I2C bus behind a pin, shared by all I2C objects on it.
+
+    Attributes:
+        devices: slaves attached to the bus, by address
+        traffic: the last transfers (ticks_us, "send" | "recv", addr, data)
+    """
+
+    BUSES = {}
+
+    def __new__(cls, pin: int):
+        if pin not in cls.BUSES:
+            bus = super().__new__(cls)
+            bus.pin = pin
+            bus.baudrate = 400000
+            bus.devices = {}
+            bus.traffic = collections.deque(maxlen=100000)
+            cls.BUSES[pin] = bus
+        return cls.BUSES[pin]
+
+    def attach(self, addr: int, device) -> None:
+        """Attach a slave device (an object with write(data) and read(n))."""
+        self.devices[addr] = device
+
+    def transfer_time_us(self, nbytes: int) -> float:
+        return TRANSFER_OVERHEAD_US + (nbytes + 1) * 9 * 1000000 / self.baudrate
+
+    def _wait(self, nbytes: int) -> None:
+        if LATENCY_SCALE:
+            utime.sleep_us(self.transfer_time_us(nbytes) * LATENCY_SCALE)
+
+    def _device(self, addr: int):
+        if addr not in self.devices:
+            raise OSError(errno.ENODEV)
+        return self.devices[addr]
+
+    def send(self, addr: int, data: bytes) -> None:
+        device = self._device(addr)
+        self._wait(len(data))
+        self.traffic.append(Transfer(utime.ticks_us(), "send", addr, data))
+        device.write(data)
+
+    def recv(self, addr: int, nbytes: int) -> bytes:
+        device = self._device(addr)
+        self._wait(nbytes)
+        data = bytes(device.read(nbytes))
+        self.traffic.append(Transfer(utime.ticks_us(), "recv", addr, data))
+        return data
+
+    def mem_read(self, addr: int, memaddr: int, nbytes: int) -> bytes:
+        """Writes memaddr then reads nbytes, with a repeated start."""
+        device = self._device(addr)
+        self._wait(nbytes + 2)
+        device.write(bytes((memaddr,)))
+        data = bytes(device.read(nbytes))
+        self.traffic.append(Transfer(utime.ticks_us(), "mem_read", addr, data))
+        return data
+
+    @classmethod
+    def reset_all(cls) -> None:
+        cls.BUSES.clear()
+
+
+class I2C:
+    MASTER = 0
+    SLAVE = 1
+
+    def __init__(self, bus: int, mode=None, **kwargs):
+        self._bus = Bus(bus)
+        self._mode = None
+        if mode is not None:
+            self.init(mode, **kwargs)
+
+    def init(self, mode, *, addr=0x12, baudrate=400000, gencall=False, dma=False):
+        self._mode = mode
+        self._bus.baudrate = baudrate
+
+    def deinit(self) -> None:
+        self._mode = None
+
+    def is_ready(self, addr: int) -> bool:
+        return addr in self._bus.devices
+
+    def scan(self) -> list:
+        return sorted(self._bus.devices)
+
+    def send(self, send, addr: int = 0x00, *, timeout: int = 5000) -> None:
+        if isinstance(send, int):
+            send = bytes((send,))
+        self._bus.send(addr, bytes(send))
+
+    def recv(self, recv, addr: int = 0x00, *, timeout: int = 5000):
+        if isinstance(recv, int):
+            return self._bus.recv(addr, recv)
+        recv[:] = self._bus.recv(addr, len(recv))
+        return recv
+
+    def mem_read(
+        self, data, addr: int, memaddr: int, *, timeout: int = 5000, addr_size: int = 8
+    ):
+        if isinstance(data, int):
+            return self._bus.mem_read(addr, memaddr, data)
+        data[:] = self._bus.mem_read(addr, memaddr, len(data))
+        return data
+
+
+class LED:
+    def __init__(self, led: int):
+        self.led = led
+        self.state = False
+
+    def on(self) -> None:
+        self.state = True
+
+    def off(self) -> None:
+        self.state = False
+
+    def toggle(self) -> None:
+        self.state = not self.state
+
+
+class Timer:
+    """A hardware timer, its callback is called from a thread at freq Hz."""
+
+    TIMERS = {}
+    _switch = None  # the switch interval to restore
+
+    def __init__(self, id: int, freq: float = None, callback=None):
+        self.id = id
+        self._freq = freq
+        self._callback = None
+        self._thread = None
+        self._stopped = threading.Event()
+        if id in Timer.TIMERS:
+            Timer.TIMERS[id].deinit()
+        Timer.TIMERS[id] = self
+        if freq is not None:
+            self.init(freq=freq, callback=callback)
+
+    def init(self, freq: float, callback=None) -> None:
+        self.deinit()
+        if utime.virtual():
+            self._freq = freq
+            self._stopped = threading.Event()
+            loop = asyncio.get_running_loop()
+            self._deadline = loop.time()
+            self._tick(loop)
+            self._callback = callback
+            return
+        if sys.getswitchinterval() > TIMER_SWITCH_S:
+            Timer._switch = sys.getswitchinterval()
+            sys.setswitchinterval(TIMER_SWITCH_S)
+        self._freq = freq
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.callback(callback)
+
+    def callback(self, function) -> None:
+        if function is not None and not utime.virtual():
+            micropython.install()
+        self._callback = function
+
+    def freq(self) -> float:
+        return self._freq
+
+    def deinit(self) -> None:
+        self._callback = None
+        self._stopped.set()
+
+    def _run(self) -> None:
+        period = 1 / self._freq
+        stopped = self._stopped
+        deadline = _time.perf_counter()
+        while not stopped.is_set():
+            deadline += period
+            wait = deadline - _time.perf_counter()
+            if wait > 0:
+                stopped.wait(wait)
+            else:
+                deadline = _time.perf_counter()  # late: don't try to catch up
+            callback = self._callback
+            if callback is not None and not stopped.is_set():
+                callback(self)
+
+    def _tick(self, loop) -> None:
+        """Calls the callback at virtual time, and schedules the next call."""
+        if self._stopped.is_set():
+            return
+        callback = self._callback
+        if callback is not None:
+            callback(self)
+            micropython.run_pending()
+        self._deadline += 1 / self._freq
+        loop.call_at(self._deadline, self._tick, loop)
+
+    @classmethod
+    def deinit_all(cls) -> None:
+        for timer in cls.TIMERS.values():
+            timer.deinit()
+        cls.TIMERS.clear()
+        micropython.uninstall()
+        if cls._switch is not None:
+            sys.setswitchinterval(cls._switch)
+            cls._switch = None
+
+
+class USB_VCP:
+    """The USB virtual COM port. ``DEBUG`` emulates a connected OpenMV IDE.
+
+    With :meth:`connect`, it writes to a file descriptor (the master side of
+    a pty: a program opens the slave side like the serial port of the
+    camera). Writes don't block, like on the board: they return the number
+    of bytes taken, None if the buffer is full. Given the slave side too,
+    the bytes the host hasn't read yet are limited to TX_BUFFER, the buffer
+    of the board, instead of the much larger one of the pty.
+    """
+
+    DEBUG = False
+    PORT = None  # file descriptor written to, None if no host is connected
+    PEER = None  # file descriptor the host reads from, if known
+    TX_BUFFER = 1024
+
+    def __init__(self, id: int = 0):
+        self.id = id
+
+    @classmethod
+    def connect(cls, fd, peer=None) -> None:
+        """Connects a host on a file descriptor (None to disconnect it).
+
+        Args:
+            fd: the file descriptor to write to
+            peer: the one the host reads from (the slave side of a pty)
+        """
+        if fd is not None:
+            os.set_blocking(fd, False)
+        cls.PORT, cls.PEER = fd, peer
+
+    def debug_mode_enabled(self) -> bool:
+        return USB_VCP.DEBUG
+
+    def isconnected(self) -> bool:
+        return USB_VCP.DEBUG or USB_VCP.PORT is not None
+
+    def any(self) -> bool:
+        return False
+
+    def read(self, nbytes: int = -1):
+        return None
+
+    def write(self, buf):
+        if USB_VCP.PORT is None:
+            return len(buf)
+        if USB_VCP.PEER is not None:
+            pending = fcntl.ioctl(USB_VCP.PEER, termios.FIONREAD, b"\0\0\0\0")
+            room = USB_VCP.TX_BUFFER - int.from_bytes(pending, sys.byteorder)
+            if room <= 0:
+                return None
+            buf = buf[:room]
+        try:
+            return os.write(USB_VCP.PORT, buf) or None
+        except BlockingIOError:
+            return None
+
+    def setinterrupt(self, char: int) -> None:
+        pass
+
+
+def millis() -> int:
+    return utime.ticks_ms()
+
+
+def micros() -> int:
+    return utime.ticks_us()
+
+
+def elapsed_millis(start: int) -> int:
+    return utime.ticks_diff(utime.ticks_ms(), start)
+
+
+def elapsed_micros(start: int) -> int:
+    return utime.ticks_diff(utime.ticks_us(), start)
+
+
+def delay(ms: int) -> None:
+    utime.sleep_ms(ms)
+
+
+def udelay(us: int) -> None:
+    utime.sleep_us(us)
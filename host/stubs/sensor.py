@@ -0,0 +1,202 @@
+"""Stand-in for OpenMV's ``sensor`` module.
+
+Frames come from a source, a callable ``source(width, height) -> Image``
+set with :func:`set_source` (see ``host.sources``). ``snapshot`` blocks for
+the time the H7 needs to read the frame out of the camera, proportional to
+its size and multiplied by ``READOUT_SCALE`` (0 disables it), and ``reset``
+for the power cycle and the register writes of the camera (``RESET_MS``).
+With more than one framebuffer, the camera captures the frames one after
+the other meanwhile (DMA): ``snapshot`` returns the latest one at once, or
+waits for the next one if it was already returned (``skip_frames`` goes
+through the frames the same way, ``get_frame_available`` tells if one is
+complete and not returned yet). Every frame has a
+``captured_us`` attribute, the ``ticks_us`` at the end of its capture.
+Callables in ``frame_hooks`` are called with every new frame.
+"""
+
+import image
+import utime
+
+GRAYSCALE = image.GRAYSCALE
+RGB565 = image.RGB565
+
+QQQQVGA = 1
+QQQVGA = 2
+QQVGA = 3
+QVGA = 4
+VGA = 5
+
+FRAME_SIZES = {
+    QQQQVGA: (40, 30),
+    QQQVGA: (80, 60),
+    QQVGA: (160, 120),
+    QVGA: (320, 240),
+    VGA: (640, 480),
+}
+
+READOUT_SCALE = 1.0
+READOUT_OVERHEAD_US = 2000
+READOUT_NS_PER_PIXEL = 130
+RESET_MS = 100
+
+frame_hooks = []
+
+_DEFAULT_SCENE = image.Scene(shapes=[image.Disc(0.5, 0.6, 0.05, (220, 30, 30))])
+_state = {}
+_source = None
+_stream = {"start": 0, "returned": -1}  # frames captured in the framebuffers
+
+
+def set_source(source) -> None:
+    """Sets the callable that produces the frames (None for a static scene)."""
+    global _source
+    _source = source
+
+
+def reset() -> None:
+    if READOUT_SCALE:
+        utime.sleep(RESET_MS / 1000 * READOUT_SCALE)
+    _init()
+
+
+def _init() -> None:
+    _state.update(
+        framesize=QVGA,
+        pixformat=RGB565,
+        vflip=False,
+        hmirror=False,
+        auto_gain=True,
+        auto_whitebal=True,
+        framebuffers=1,
+        running=True,
+    )
+    _restart()
+
+
+def _restart() -> None:
+    """Starts capturing in the framebuffers again, from now."""
+    _stream.update(start=utime._ns(), returned=-1)
+
+
+def shutdown(enable: bool = True) -> None:
+    _state["running"] = not enable
+
+
+def set_pixformat(pixformat: int) -> None:
+    _state["pixformat"] = pixformat
+
+
+def get_pixformat() -> int:
+    return _state["pixformat"]
+
+
+def set_framesize(framesize: int) -> None:
+    _state["framesize"] = framesize
+    _restart()
+
+
+def get_framesize() -> int:
+    return _state["framesize"]
+
+
+def set_vflip(enable: bool) -> None:
+    _state["vflip"] = enable
+
+
+def set_hmirror(enable: bool) -> None:
+    _state["hmirror"] = enable
+
+
+def set_auto_gain(enable: bool, **kwargs) -> None:
+    _state["auto_gain"] = enable
+
+
+def set_auto_whitebal(enable: bool, **kwargs) -> None:
+    _state["auto_whitebal"] = enable
+
+
+def set_framebuffers(count: int) -> None:
+    _state["framebuffers"] = count
+    _restart()
+
+
+def get_framebuffers() -> int:
+    return _state["framebuffers"]
+
+
+def width() -> int:
+    return FRAME_SIZES[_state["framesize"]][0]
+
+
+def height() -> int:
+    return FRAME_SIZES[_state["framesize"]][1]
+
+
+def _readout_s(w: int, h: int) -> float:
+    seconds = READOUT_OVERHEAD_US / 1e6 + w * h * READOUT_NS_PER_PIXEL / 1e9
+    return seconds * READOUT_SCALE
+
+
+def _readout(w: int, h: int) -> None:
+    if READOUT_SCALE:
+        utime.sleep(_readout_s(w, h))
+
+
+def _streamed(w: int, h: int) -> int:
+    """Returns the end (ns) of the capture of the latest frame not returned yet.
+
+    Frame k of the stream is captured at start + (k + 1) * readout time.
+    Like a readout, a frame waited for ends when the wait returns: the
+    oversleep of the host isn't counted in its age.
+    """
+    period = int(_readout_s(w, h) * 1e9)
+    now = utime._ns()
+    latest = (now - _stream["start"]) // period - 1
+    if latest <= _stream["returned"]:
+        _stream["returned"] += 1
+        utime.sleep((_stream["start"] + (_stream["returned"] + 1) * period - now) / 1e9)
+        return utime._ns()
+    _stream["returned"] = latest
+    return _stream["start"] + (latest + 1) * period
+
+
+def snapshot():
+    """Returns the next frame of the source at the current frame size."""
+    w, h = width(), height()
+    if _state["framebuffers"] > 1 and READOUT_SCALE:
+        captured = _streamed(w, h)
+    else:
+        _readout(w, h)
+        captured = utime._ns()
+    if _source is None:
+        img = image.Image(width=w, height=h, scene=_DEFAULT_SCENE)
+    else:
+        img = _source(w, h)
+    age_us = (utime._ns() - captured) // 1000
+    img.captured_us = utime.ticks_add(utime.ticks_us(), -age_us)
+    for hook in frame_hooks:
+        hook(img)
+    return img
+
+
+def get_frame_available() -> bool:
+    """True if snapshot() would return a frame without waiting."""
+    if _state["framebuffers"] == 1 or not READOUT_SCALE:
+        return False
+    period = int(_readout_s(width(), height()) * 1e9)
+    return (utime._ns() - _stream["start"]) // period - 1 > _stream["returned"]
+
+
+def skip_frames(n: int = 10, time=None) -> None:
+    if time is not None:
+        utime.sleep_ms(time)
+        return
+    w, h = width(), height()
+    for _ in range(n):
+        if _state["framebuffers"] > 1 and READOUT_SCALE:
+            _streamed(w, h)
+        else:
+            _readout(w, h)
+
+
+_init()
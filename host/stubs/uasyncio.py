@@ -0,0 +1,32 @@
+"""Stand-in for MicroPython's ``uasyncio`` module, backed by CPython's asyncio."""
+
+import asyncio as _asyncio
+from asyncio import *  # noqa: F401,F403
+
+
+async def sleep_ms(ms: int) -> None:
+    await _asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(awaitable, timeout: int):
+    return await _asyncio.wait_for(awaitable, timeout / 1000)
+
+
+class ThreadSafeFlag:
+    """A flag set by a scheduled callback, to wake up a task.
+
+    On the host, scheduled callbacks run on the main thread (see micropython).
+    """
+
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self) -> None:
+        self._event.set()
+
+    def clear(self) -> None:
+        self._event.clear()
+
+    async def wait(self) -> None:
+        await self._event.wait()
+        self._event.clear()
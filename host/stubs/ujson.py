@@ -0,0 +1,3 @@
+"""Stand-in for MicroPython's ``ujson`` module, backed by CPython's json."""
+
+from json import *  # noqa: F401,F403
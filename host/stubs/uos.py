@@ -0,0 +1,3 @@
+"""Stand-in for MicroPython's ``uos`` module, backed by CPython's os."""
+
+from os import *  # noqa: F401,F403
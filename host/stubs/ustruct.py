@@ -0,0 +1,76 @@
+"""Stand-in for MicroPython's ``ustruct`` module.
+
+Native formats (no byte-order prefix) are laid out like on the OpenMV Cam
+H7, a 32-bit little-endian port: ``struct.pack("l", 1)`` is 4 bytes long
+here too, so frames built on the host are byte-identical to the device.
+"""
+
+import struct as _struct
+
+_NATIVE_SIZES = {
+    "x": 1,
+    "c": 1,
+    "b": 1,
+    "B": 1,
+    "?": 1,
+    "s": 1,
+    "h": 2,
+    "H": 2,
+    "e": 2,
+    "i": 4,
+    "I": 4,
+    "l": 4,
+    "L": 4,
+    "f": 4,
+    "P": 4,
+    "q": 8,
+    "Q": 8,
+    "d": 8,
+}
+_CACHE = {}
+
+
+def _standard(fmt: str) -> str:
+    """Translates a native format string into an explicit little-endian one."""
+    if fmt and fmt[0] in "<>!=":
+        return fmt
+    if fmt in _CACHE:
+        return _CACHE[fmt]
+    parts, offset, count = ["<"], 0, ""
+    for char in fmt.lstrip("@"):
+        if char.isdigit():
+            count += char
+            continue
+        if char.isspace():
+            continue
+        repeat = int(count) if count else 1
+        count = ""
+        size = _NATIVE_SIZES[char]
+        if char not in "xs" and offset % size:
+            padding = size - offset % size
+            parts.append("{}x".format(padding))
+            offset += padding
+        parts.append("{}{}".format(repeat, "I" if char == "P" else char))
+        offset += size * repeat
+    _CACHE[fmt] = "".join(parts)
+    return _CACHE[fmt]
+
+
+def calcsize(fmt: str) -> int:
+    return _struct.calcsize(_standard(fmt))
+
+
+def pack(fmt: str, *values) -> bytes:
+    return _struct.pack(_standard(fmt), *values)
+
+
+def pack_into(fmt: str, buffer, offset: int, *values) -> None:
+    _struct.pack_into(_standard(fmt), buffer, offset, *values)
+
+
+def unpack(fmt: str, data) -> tuple:
+    return _struct.unpack(_standard(fmt), data)
+
+
+def unpack_from(fmt: str, data, offset: int = 0) -> tuple:
+    return _struct.unpack_from(_standard(fmt), data, offset)
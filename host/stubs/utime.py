@@ -0,0 +1,76 @@
+"""Stand-in for MicroPython's ``utime`` module.
+
+Ticks wrap around like on the OpenMV Cam (30 bits), so code that forgets
+to use ``ticks_diff`` breaks on the host as well.
+
+The time is the host's, unless a virtual clock is set with
+:func:`set_clock` (see ``host.sim``): then ticks read it, and ``sleep``
+advances it instead of blocking. The other stand-ins model the time of the
+board's C functions with ``sleep``, so they take virtual time too.
+"""
+
+import time as _time
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+_EPOCH = _time.perf_counter_ns()
+
+_clock = None  # an object with read_ns() and advance(seconds), or None
+
+
+def set_clock(clock) -> None:
+    """Replaces the time of the host by a virtual clock (None to restore it)."""
+    global _clock
+    _clock = clock
+
+
+def virtual() -> bool:
+    """True if a virtual clock is set."""
+    return _clock is not None
+
+
+def _ns() -> int:
+    if _clock is not None:
+        return _clock.read_ns()
+    return _time.perf_counter_ns() - _EPOCH
+
+
+def time() -> int:
+    """Returns the number of seconds since the Epoch (as an integer)."""
+    return int(_time.time())
+
+
+def ticks_ms() -> int:
+    return (_ns() // 1000000) & _TICKS_MAX
+
+
+def ticks_us() -> int:
+    return (_ns() // 1000) & _TICKS_MAX
+
+
+def ticks_cpu() -> int:
+    return ticks_us()
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1: int, ticks2: int) -> int:
+    return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+
+def sleep(seconds: float) -> None:
+    if _clock is not None:
+        _clock.advance(seconds)
+    else:
+        _time.sleep(seconds)
+
+
+def sleep_ms(ms: int) -> None:
+    sleep(ms / 1000)
+
+
+def sleep_us(us: int) -> None:
+    sleep(us / 1000000)
@@ -0,0 +1,111 @@
+"""Sweeps constants of the robot over simulated episodes (see ``host.sim``).
+
+Each parameter set is the product of the values given for each constant of
+``Robot`` (``--param wheel_diameter=76,80,84 --param tracking=0,1``). Every
+set plays the same seeded episodes, so that the sets are compared on the
+same starts. The episodes are spread over a pool of processes, each one
+runs the firmware of its episodes one after the other.
+
+For each set, the report has the ratio of episodes where the robot reached
+the ball, the time it took (s), the ratio of episodes where it went fully
+out of the lines at least once, and the mean number of these exits and of
+retreats of the line guard.
+
+Usage:
+    python -m host.sweep [--param NAME=V1,V2 ...] [--episodes 1000]
+                         [--seed 0] [--duration 20] [--efficiency 0.9]
+                         [--workers 8] [--json]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from host import sim
+
+
+def parameter_sets(grid: dict) -> list:
+    """Returns the product of the values of each parameter, as dicts."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def _episode(job: tuple) -> tuple:
+    index, params, seed, duration, efficiency = job
+    return index, sim.run_episode(seed, params, duration, efficiency)
+
+
+def sweep(
+    grid: dict,
+    episodes: int = 1000,
+    seed: int = 0,
+    duration: float = 20.0,
+    efficiency: float = 0.9,
+    workers: int = None,
+) -> list:
+    """Plays the episodes of every parameter set on a pool of processes.
+
+    Args:
+        grid: the values of each parameter, by name (see sim.run_episode)
+        workers: number of processes, all the cores by default
+
+    Returns:
+        (params, report) for each parameter set, in the order of the grid
+    """
+    sets = parameter_sets(grid)
+    jobs = [
+        (index, params, seed + episode, duration, efficiency)
+        for index, params in enumerate(sets)
+        for episode in range(episodes)
+    ]
+    results = [[] for _ in sets]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(workers) as executor:
+        for index, result in executor.map(_episode, jobs, chunksize=chunksize):
+            results[index].append(result)
+    return [(params, sim.report(found)) for params, found in zip(sets, results)]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=V1,V2",
+        help="values of a constant of Robot (wheel_diameter, tracking, ...)",
+    )
+    parser.add_argument("--episodes", type=int, default=1000, help="per parameter set")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--efficiency", type=float, default=0.9)
+    parser.add_argument("--workers", type=int, help="processes (all cores by default)")
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    grid = {}
+    for item in args.param:
+        name, _, values = item.partition("=")
+        grid[name] = [sim.parse_value(value) for value in values.split(",")]
+    start = time.perf_counter()
+    reports = sweep(
+        grid, args.episodes, args.seed, args.duration, args.efficiency, args.workers
+    )
+    elapsed = time.perf_counter() - start
+    if args.json:
+        print(json.dumps([{"params": p, "report": r} for p, r in reports], indent=2))
+        return
+    for params, report in reports:
+        name = " ".join("{}={}".format(key, value) for key, value in params.items())
+        print("{}:".format(name or "defaults"))
+        print("  " + sim.format_report(report))
+    episodes = sum(report["episodes"] for _, report in reports)
+    print("{} episodes in {:.1f} s".format(episodes, elapsed))
+
+
+if __name__ == "__main__":
+    main()
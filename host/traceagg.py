@@ -0,0 +1,143 @@
+"""Aggregates the tracing dumps of many matches.
+
+Reads logs written by the camera (text logs, console captures or binary
+logs of ``ulogging.BinaryHandler``) and finds the lines written by
+``Tracer.dump()``. Dumps are cumulative since the boot: the last dump of
+each match is kept, a match ends when the number of calls of a span goes
+down (the camera rebooted) or at the end of a file. Spans are then summed
+over the matches, percentiles are estimated from the histograms.
+
+Usage:
+    python -m host.traceagg robot.log robot.log.1 ... [--json]
+"""
+
+import argparse
+import json
+import mmap
+import re
+
+from host.logdecode import MAGIC, records
+
+BUCKETS = 12
+BUCKET_MIN_US = 64
+SPAN = re.compile(r"span (\S+) calls (\d+) total_us (\d+) max_us (\d+) hist ([\d,]+)")
+COUNTER = re.compile(r"counter (\S+) (\d+)")
+
+
+def lines(path: str):
+    """Yields the text lines of a log, decoding it if it's binary."""
+    with open(path, "rb") as logfile:
+        if logfile.read(len(MAGIC)) == MAGIC:
+            with mmap.mmap(logfile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for record in records(data):
+                    yield record.text()
+            return
+    with open(path, encoding="utf-8", errors="replace") as logfile:
+        yield from logfile
+
+
+def matches(paths: list) -> list:
+    """Returns the last dump of each match: ({span: stats}, {counter: value})."""
+    found = []
+    for path in paths:
+        spans, counters = {}, {}
+        for line in lines(path):
+            match = SPAN.search(line)
+            if match:
+                name = match.group(1)
+                calls, total, longest = (int(match.group(i)) for i in (2, 3, 4))
+                if name in spans and calls < spans[name]["calls"]:
+                    found.append((spans, counters))
+                    spans, counters = {}, {}
+                spans[name] = {
+                    "calls": calls,
+                    "total_us": total,
+                    "max_us": longest,
+                    "hist": [int(count) for count in match.group(5).split(",")],
+                }
+                continue
+            match = COUNTER.search(line)
+            if match:
+                counters[match.group(1)] = int(match.group(2))
+        if spans or counters:
+            found.append((spans, counters))
+    return found
+
+
+def bucket_bound(bucket: int) -> int:
+    """Upper bound (us) of a histogram bucket, -1 for the last one."""
+    return -1 if bucket == BUCKETS - 1 else BUCKET_MIN_US << bucket
+
+
+def quantile(hist: list, q: float) -> int:
+    """Returns the upper bound of the bucket holding the q-th quantile."""
+    total = sum(hist)
+    rank, seen = q * total, 0
+    for bucket, count in enumerate(hist):
+        seen += count
+        if count and seen >= rank:
+            return bucket_bound(bucket)
+    return bucket_bound(len(hist) - 1)
+
+
+def aggregate(found: list) -> dict:
+    spans, counters = {}, {}
+    for match_spans, match_counters in found:
+        for name, stats in match_spans.items():
+            total = spans.setdefault(
+                name,
+                {
+                    "matches": 0,
+                    "calls": 0,
+                    "total_us": 0,
+                    "max_us": 0,
+                    "hist": [0] * BUCKETS,
+                },
+            )
+            total["matches"] += 1
+            total["calls"] += stats["calls"]
+            total["total_us"] += stats["total_us"]
+            total["max_us"] = max(total["max_us"], stats["max_us"])
+            for bucket, count in enumerate(stats["hist"][:BUCKETS]):
+                total["hist"][bucket] += count
+        for name, value in match_counters.items():
+            counters[name] = counters.get(name, 0) + value
+    for stats in spans.values():
+        stats["mean_us"] = stats["total_us"] // stats["calls"] if stats["calls"] else 0
+        for q in (50, 90, 99):
+            stats["p{}_us".format(q)] = quantile(stats["hist"], q / 100)
+    return {"matches": len(found), "spans": spans, "counters": counters}
+
+
+def print_summary(summary: dict) -> None:
+    print("matches: {}".format(summary["matches"]))
+    print(
+        "{:<12} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+            "span", "calls", "mean us", "p50 <", "p90 <", "p99 <", "max us"
+        )
+    )
+    spans = summary["spans"]
+    for name in sorted(spans, key=lambda name: -spans[name]["total_us"]):
+        stats = spans[name]
+        print(
+            "{:<12} {calls:>8} {mean_us:>9} {p50_us:>9} {p90_us:>9} {p99_us:>9} "
+            "{max_us:>9}".format(name, **stats).replace(" -1", "inf")
+        )
+    for name, value in sorted(summary["counters"].items()):
+        print("counter {:<12} {}".format(name, value))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="+", help="logs of the camera")
+    parser.add_argument("--json", action="store_true", help="print a JSON summary")
+    args = parser.parse_args(argv)
+    summary = aggregate(matches(args.paths))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
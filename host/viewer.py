@@ -0,0 +1,193 @@
+"""Receives the telemetry frames streamed by ``telemetry.TelemetryStream``.
+
+The camera writes a fixed-size binary frame per iteration of its main loop
+on the USB VCP (when no OpenMV IDE is connected, see boot.py). The parser
+resynchronizes on SYNC after any garbage or cut frame, checks the LRC and
+counts the frames lost on the way: the sequence numbers that are missing,
+of which the camera itself dropped ``dropped`` (its ring was full).
+
+The port is read raw (no pyserial needed), frames are printed as text, as
+CSV, or summarized every second.
+
+Usage:
+    python -m host.viewer /dev/ttyACM0 [--csv] [--stats] [--count 1000]
+"""
+
+import argparse
+import collections
+import csv
+import os
+import struct
+import sys
+import termios
+import time
+import tty
+
+SYNC = b"\xa5\x5a"
+END = 0x55
+SIZE = 48
+FRAME = struct.Struct("<2sHIBB4H4HhH2h6HBB")
+BALL, PREEMPTED, MOVING = 1, 2, 4
+NONE = 0xFFFF
+
+Frame = collections.namedtuple(
+    "Frame",
+    "seq ticks_ms flags dropped capture_us detect_us decide_us actuate_us "
+    "x y w h angle distance lspeed rspeed front back line0 line1 line2 line3",
+)
+
+
+def lrc(data) -> int:
+    """Returns the XOR of the bytes of data (folded as a single integer)."""
+    value = int.from_bytes(data, "little")
+    shift = 8
+    while shift < 8 * len(data):
+        shift *= 2
+    while shift > 8:
+        shift //= 2
+        value ^= value >> shift
+    return value & 0xFF
+
+
+class Parser:
+    """Parses a stream of telemetry frames, fed by chunks of any size.
+
+    Attributes:
+        frames: number of valid frames
+        skipped: bytes skipped to resynchronize (garbage, cut frames)
+        invalid: frames with a wrong LRC or END
+        lost: frames missing from the sequence numbers
+        dropped: frames the camera dropped (part of lost), from the counter
+            in the frames
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.lost = 0
+        self.dropped = 0
+        self._buffer = bytearray()
+        self._seq = None
+        self._dropped = None
+
+    def feed(self, data) -> list:
+        """Parses a chunk of the stream.
+
+        Returns:
+            the Frames completed by this chunk
+        """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        pos, end = 0, len(buffer)
+        view = memoryview(buffer)
+        while end - pos >= SIZE:
+            if buffer[pos] != 0xA5 or buffer[pos + 1] != 0x5A:
+                found = buffer.find(SYNC, pos + 1)
+                found = found if found >= 0 else end - 1
+                self.skipped += found - pos
+                pos = found
+                continue
+            check = lrc(view[pos + 2 : pos + SIZE - 2])
+            if buffer[pos + SIZE - 1] != END or check != buffer[pos + SIZE - 2]:
+                self.invalid += 1
+                self.skipped += 1
+                pos += 1  # another SYNC may be inside
+                continue
+            frame = Frame._make(FRAME.unpack_from(buffer, pos)[1:-2])
+            if self._seq is not None:
+                self.lost += (frame.seq - self._seq - 1) & 0xFFFF
+                self.dropped += (frame.dropped - self._dropped) & 0xFF
+            self._seq, self._dropped = frame.seq, frame.dropped
+            self.frames += 1
+            frames.append(frame)
+            pos += SIZE
+        view.release()
+        del buffer[:pos]
+        return frames
+
+
+def describe(frame: Frame) -> str:
+    """Renders a frame as a line of text."""
+    if frame.flags & BALL:
+        ball = "ball ({},{},{},{}) {:+.2f} deg {} mm".format(
+            frame.x, frame.y, frame.w, frame.h, frame.angle / 100, frame.distance
+        )
+    else:
+        ball = "no ball"
+    text = "#{:5d} {:9.3f}s {:<40} speeds {:+6.1f} {:+6.1f}{} lines {} {} {} {}"
+    text += " us {} {} {} {}"
+    return text.format(
+        frame.seq,
+        frame.ticks_ms / 1000,
+        ball,
+        frame.lspeed / 10,
+        frame.rspeed / 10,
+        " (preempted)" if frame.flags & PREEMPTED else "",
+        frame.line0,
+        frame.line1,
+        frame.line2,
+        frame.line3,
+        frame.capture_us,
+        frame.detect_us,
+        frame.decide_us,
+        frame.actuate_us,
+    )
+
+
+def open_port(path: str) -> int:
+    """Opens a serial port (or a pty) raw, returns its file descriptor."""
+    fd = os.open(path, os.O_RDONLY | os.O_NOCTTY)
+    if os.isatty(fd):
+        tty.setraw(fd, termios.TCSANOW)
+    return fd
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("port", help="serial port of the camera, e.g. /dev/ttyACM0")
+    parser.add_argument("--csv", action="store_true", help="one CSV row per frame")
+    parser.add_argument("--stats", action="store_true", help="a summary every second")
+    parser.add_argument("--count", type=int, help="stops after this number of frames")
+    args = parser.parse_args(argv)
+
+    fd = open_port(args.port)
+    stream = Parser()
+    writer = None
+    if args.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(Frame._fields)
+    last, last_frames = time.monotonic(), 0
+    try:
+        while args.count is None or stream.frames < args.count:
+            data = os.read(fd, 4096)
+            if not data:
+                break
+            for frame in stream.feed(data):
+                if writer:
+                    writer.writerow(frame)
+                elif not args.stats:
+                    print(describe(frame))
+            now = time.monotonic()
+            if args.stats and now - last >= 1:
+                print(
+                    "{:.1f} frames/s, {} frames, {} lost ({} dropped by the camera), "
+                    "{} invalid, {} bytes skipped".format(
+                        (stream.frames - last_frames) / (now - last),
+                        stream.frames,
+                        stream.lost,
+                        stream.dropped,
+                        stream.invalid,
+                        stream.skipped,
+                    )
+                )
+                last, last_frames = now, stream.frames
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.close(fd)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,27 +3,75 @@ This program is the entry point of the Open MV Cam.
 This is the one you need to launch in OpenMV IDE.
 """
 
+# Times the startup, from the imports to the first decision of the robot
+from startup import BootTimer
+
+boot = BootTimer()
+
+import micropython
 import pyb
 import uasyncio as asyncio
 
 import robot
 import ulogging as logging
 
+boot.mark("imports")
+
+# Reports the exceptions raised in interrupt handlers (see safety.LineGuard)
+micropython.alloc_emergency_exception_buf(100)
+
+# Records the frames, sensors and motor commands in match.rec, to replay
+# them on a computer (see host/replay.py). Frames are written to the flash,
+# the loop is slower.
+RECORD = False
+
 # Creates the root logger (all loggers are herited from it by default)
 logger = logging.Logger("root")
 usb_vcp = pyb.USB_VCP()
+stream = None
 
 if usb_vcp.debug_mode_enabled():
     # Logs will be displayed in the console output
     logger.add_handler(logging.StreamHandler())
     logger.set_level("DEBUG")
 else:
-    logger.add_handler(logging.FileHandler("robot.log"))
+    # Records are written by batches, the loop isn't blocked for each one
+    logger.add_handler(logging.BufferedFileHandler("robot.log"))
+
+    def binary_telemetry():
+        """Ball and motors, frame by frame: decode it with host/logdecode.py"""
+        telemetry = logging.Logger("telemetry")
+        telemetry.propagate = False
+        telemetry.set_level("DEBUG")
+        binary = logging.BinaryHandler("telemetry.bin", size=8192)
+        binary.set_level("DEBUG")
+        telemetry.add_handler(binary)
+
+    # Nothing is recorded before the first frame: set up while the camera settles
+    boot.defer(binary_telemetry)
+    if usb_vcp.isconnected():
+        # A viewer instead of the IDE: frames of telemetry, see host/viewer.py
+        from telemetry import TelemetryStream
+
+        stream = TelemetryStream(usb_vcp)
+
+recorder = None
+if RECORD:
+    from recorder import Recorder
+
+    recorder = Recorder("match.rec")
 
 try:
-    asyncio.run(robot.main())  # Runs the main script
+    # Runs the main script
+    asyncio.run(robot.main(recorder=recorder, stream=stream, boot=boot))
 except Exception as error:
     if str(error) == "IDE interrupt":
         logger.critical("The script was stopped by Open MV IDE")
     else:
         raise error
+finally:
+    if recorder:
+        recorder.close()
+    for name in logging.Logger.LOGGERS:
+        for handler in logging.Logger(name).handlers:
+            handler.flush()
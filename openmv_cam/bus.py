@@ -0,0 +1,373 @@
+import array
+
+import pyb
+import uasyncio as asyncio
+import utime as time
+
+from tracing import tracer
+import ulogging as logging
+
+logger = logging.Logger(__name__)
+
+I2C_WRITE = tracer.span("i2c_write")
+I2C_REQUEST = tracer.span("i2c_request")
+I2C_ERRORS = tracer.counter("i2c_errors")
+
+
+class I2CBus:
+    """A class that shares one I2C bus between all the devices of a pin.
+
+    Writes are queued in channels (one per motor slot for instance) and sent
+    by a single task, spaced by the minimum gap the slaves need between two
+    frames. A channel only keeps its latest frame: a newer command replaces
+    the pending one instead of waiting behind it. Requests (a frame, then
+    the answer of the slave) are batched and sent by the same task, once no
+    write is pending, so that they are spaced like the writes.
+
+    A safety path can write ahead of the queue with send_now(), and hold the
+    bus meanwhile: the frames submitted while it is held are dropped.
+
+    Conventionnal usage:
+    bus = I2CBus(4)  # the same instance is returned for a given pin
+
+    Attributes:
+        i2c: the pyb.I2C object of the pin
+        gap_us: minimum time between two frames written on the bus
+        sent: number of frames written
+        requests: number of requests answered
+        held: if True, the queued frames are dropped instead of written
+        dropped: number of frames dropped while the bus was held
+        coalesced: number of pending frames replaced by a newer one
+        latency_last_us, latency_max_us, latency_total_us:
+            time between the submission of a frame and its write on the bus
+    """
+
+    GAP_US = 4000  # the encoder motor driver drops frames sent too close
+    PROBE_MS = 20  # between two probes of a slave that doesn't answer yet
+    # A dict containing all instances of bus, by pin
+    BUSES = {}
+
+    def __new__(cls, pin: int):
+        """Returns the instance of the given pin, or creates one.
+
+        Args:
+            pin: I2C bus' pin (2 or 4)
+        """
+        if pin not in cls.BUSES:
+            bus = super().__new__(cls)
+            bus._setup(pin)
+            cls.BUSES[pin] = bus
+        return cls.BUSES[pin]
+
+    def _setup(self, pin: int) -> None:
+        self.pin = pin
+        self.i2c = pyb.I2C(pin)
+        self.i2c.init(pyb.I2C.MASTER)
+        self.gap_us = I2CBus.GAP_US
+        self.sent = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.held = False
+        self.dropped = 0
+        self.latency_last_us = 0
+        self.latency_max_us = 0
+        self.latency_total_us = 0
+        self._addrs = []
+        self._pending = []
+        self._queued_at = array.array("l")
+        self._chain = array.array("b")  # channel to write right after, or -1
+        self._next = 0  # next channel to look at (round robin)
+        self._last_write = time.ticks_us()
+        self._sending = False  # from the gap's check to the end of a write
+        # Frames of send_now() called during a write, sent right after it
+        self._urgent = [None, None]
+        self._urgent_addrs = array.array("B", (0, 0))
+        self._batch = None  # (addr, trames, buffers) of the running request
+        self._batch_next = 0
+        self._batch_ok = True
+        self._batch_done = asyncio.Event()
+        self._event = asyncio.Event()
+        self._writer = None
+
+    def __repr__(self) -> str:
+        return "I2CBus(pin={}, channels={})".format(self.pin, len(self._addrs))
+
+    def channel(self, addr: int) -> int:
+        """Creates a write channel to a slave.
+
+        Args:
+            addr: slave's address
+
+        Returns:
+            channel: the id to give to submit()
+        """
+        self._addrs.append(addr)
+        self._pending.append(None)
+        self._queued_at.append(0)
+        self._chain.append(-1)
+        return len(self._addrs) - 1
+
+    def submit(self, channel: int, trame) -> None:
+        """Queues a frame, replacing the one pending on the channel.
+
+        The buffer is sent as it is when its turn comes, it must not be
+        modified in the meantime unless the newer content is meant to be sent.
+
+        Args:
+            channel: the id returned by channel()
+            trame: the bytes to write
+        """
+        if self._pending[channel] is None:
+            self._queued_at[channel] = time.ticks_us()
+        else:
+            self.coalesced += 1
+        self._pending[channel] = trame
+        self._event.set()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    def submit_pair(self, first: int, trame1, second: int, trame2) -> None:
+        """Queues two frames to be written one right after the other.
+
+        No frame of another channel is written between them, they are only
+        spaced by the minimum gap. A frame can be None if its channel has
+        nothing new to write.
+
+        Args:
+            first, second: the ids of the channels
+            trame1, trame2: the frames of each channel
+        """
+        if trame1 is None:
+            if trame2 is not None:
+                self.submit(second, trame2)
+            return
+        self.submit(first, trame1)
+        if trame2 is not None:
+            self.submit(second, trame2)
+            self._chain[first] = second
+        self._next = first
+
+    @property
+    def idle(self) -> bool:
+        """True if no frame is waiting to be written."""
+        for trame in self._pending:
+            if trame is not None:
+                return False
+        return True
+
+    async def drain(self) -> None:
+        """Waits until every pending frame has been written."""
+        while not self.idle:
+            await asyncio.sleep_ms(1)
+
+    async def request(self, addr: int, trames, buffers) -> bool:
+        """Sends a batch of requests to a slave and receives their answers.
+
+        The writer task sends each frame then reads its answer, spaced by
+        gap_us. Pending writes go first, but once started the batch isn't
+        interleaved with writes (at most one gap for each request), so that
+        the answers are sampled as close together as possible.
+
+        Args:
+            addr: slave's address
+            trames: the request frames
+            buffers: the buffer of each answer, filled in-place
+
+        Returns:
+            False if a request failed (the next answers aren't read)
+        """
+        while self._batch is not None:  # one batch at a time
+            await asyncio.sleep_ms(1)
+        self._batch = (addr, trames, buffers)
+        self._batch_next = 0
+        self._batch_ok = True
+        self._batch_done.clear()
+        self._event.set()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+        await self._batch_done.wait()
+        return self._batch_ok
+
+    def send_now(self, addr: int, trame) -> bool:
+        """Writes a frame right away, ahead of the queued ones.
+
+        Only waits (busy) for the gap since the last frame. It doesn't
+        touch the queue, so that it can be called from a callback scheduled
+        in the middle of the writer task. If that task was between its check
+        of the gap and the end of its write, its frame could follow this one
+        too closely: this frame is handed to the writer instead, which sends
+        it right after its own (one frame and one gap later at most).
+
+        Args:
+            addr: slave's address
+            trame: the bytes to write
+
+        Returns:
+            False if the write failed
+        """
+        if self._sending:
+            return self._defer(addr, trame)
+        self._sending = True
+        try:
+            self._send(addr, trame)
+        except OSError:
+            tracer.count(I2C_ERRORS)
+            return False
+        finally:
+            self._flush()
+        return True
+
+    def recv(self, buffer, addr: int):
+        """Reads from a slave, filling the buffer in-place.
+
+        Args:
+            buffer: a bytearray, its length is the number of bytes to read
+            addr: slave's address
+        """
+        return self.i2c.recv(buffer, addr)
+
+    def read_register(self, buffer, addr: int, register: int):
+        """Writes a register's number then reads from a slave, in one transfer.
+
+        No other read of the slave can come in between, even from an
+        interrupt: the answer is the one of this register.
+
+        Args:
+            buffer: a bytearray, its length is the number of bytes to read
+            addr: slave's address
+            register: 8 bits
+        """
+        return self.i2c.mem_read(buffer, addr, register)
+
+    async def probe(self, addr: int, timeout: int, period: int = PROBE_MS) -> bool:
+        """Waits for a slave to acknowledge its address.
+
+        A slave may boot slower than the camera: its address is polled every
+        period (ms), the other tasks run in between.
+
+        Args:
+            addr: slave's address
+            timeout: in milliseconds
+
+        Returns:
+            False if the slave didn't answer in time
+        """
+        deadline = time.ticks_add(time.ticks_ms(), timeout)
+        while not self.i2c.is_ready(addr):
+            wait = time.ticks_diff(deadline, time.ticks_ms())
+            if wait <= 0:
+                return False
+            await asyncio.sleep_ms(period if period < wait else wait)
+        return True
+
+    def latency_mean_us(self) -> float:
+        return self.latency_total_us / self.sent if self.sent else 0.0
+
+    def _send(self, addr: int, trame) -> None:
+        """Writes a frame once the gap since the last one has passed.
+
+        The caller sets _sending first, so that a callback that runs in
+        between defers its frames instead of writing them.
+        """
+        while time.ticks_diff(time.ticks_us(), self._last_write) < self.gap_us:
+            pass
+        try:
+            self.i2c.send(trame, addr)
+        finally:
+            self._last_write = time.ticks_us()
+
+    def _defer(self, addr: int, trame) -> bool:
+        urgent = self._urgent
+        for i in range(len(urgent)):
+            if urgent[i] is None or urgent[i] is trame:
+                urgent[i] = trame
+                self._urgent_addrs[i] = addr
+                return True
+        return False
+
+    def _flush(self) -> None:
+        """Writes the deferred frames of send_now(), then ends the write."""
+        urgent = self._urgent
+        while True:
+            for i in range(len(urgent)):
+                trame = urgent[i]
+                if trame is not None:
+                    urgent[i] = None
+                    try:
+                        self._send(self._urgent_addrs[i], trame)
+                    except OSError:
+                        tracer.count(I2C_ERRORS)
+            self._sending = False
+            # A callback may have deferred a frame before the flag was cleared
+            if urgent[0] is None and urgent[1] is None:
+                return
+            self._sending = True
+
+    async def _write_loop(self) -> None:
+        """Writes the pending frames, one channel after the other."""
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            while self._batch is not None or not self.idle:
+                wait = self.gap_us - time.ticks_diff(time.ticks_us(), self._last_write)
+                if wait > 0:
+                    await asyncio.sleep_ms((wait + 999) // 1000)
+                    continue  # send_now() may have written meanwhile
+                if self._batch is not None and (self._batch_next or self.idle):
+                    self._request_next()
+                else:
+                    self._write_next()
+
+    def _request_next(self) -> None:
+        addr, trames, buffers = self._batch
+        i = self._batch_next
+        start = tracer.begin()
+        self._sending = True
+        try:
+            self._send(addr, trames[i])
+            self.i2c.recv(buffers[i], addr)
+            self.requests += 1
+        except OSError as error:
+            tracer.count(I2C_ERRORS)
+            logger.error("Request to {:#x} failed: {}", addr, error)
+            self._batch_ok = False
+        self._last_write = time.ticks_us()
+        self._flush()
+        tracer.end(I2C_REQUEST, start)
+        self._batch_next = i + 1
+        if not self._batch_ok or self._batch_next == len(trames):
+            self._batch = None
+            self._batch_done.set()
+
+    def _write_next(self) -> None:
+        count = len(self._pending)
+        for i in range(count):
+            channel = (self._next + i) % count
+            trame = self._pending[channel]
+            if trame is not None:
+                break
+        self._pending[channel] = None
+        self._next = channel + 1
+        follower = self._chain[channel]
+        if follower >= 0:
+            self._chain[channel] = -1
+            if self._pending[follower] is not None:
+                self._next = follower
+        if self.held:
+            self.dropped += 1
+            return
+        start = tracer.begin()
+        self._sending = True
+        try:
+            self._send(self._addrs[channel], trame)
+        except OSError as error:
+            tracer.count(I2C_ERRORS)
+            logger.error("Write to {:#x} failed: {}", self._addrs[channel], error)
+        latency = time.ticks_diff(self._last_write, self._queued_at[channel])
+        self._flush()
+        tracer.end(I2C_WRITE, start)
+        self.sent += 1
+        self.latency_last_us = latency
+        self.latency_total_us += latency
+        if latency > self.latency_max_us:
+            self.latency_max_us = latency
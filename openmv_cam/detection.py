@@ -0,0 +1,249 @@
+import array
+
+
+class Detections:
+    """The objects found in a frame, one per class, in preallocated arrays.
+
+    A class that wasn't searched in a frame (see Detector.every) keeps its
+    last result, age() tells how many frames ago it was seen.
+
+    Attributes:
+        frame: number of the last frame
+        values: FIELDS values (x, y, w, h, cx, cy, pixels) for each class
+        seen: frame where each class was last seen, 0 if never
+    """
+
+    FIELDS = 7
+    X, Y, W, H, CX, CY, PIXELS = 0, 1, 2, 3, 4, 5, 6
+
+    def __init__(self, classes: int):
+        self.frame = 0
+        self.values = array.array("H", [0] * (classes * Detections.FIELDS))
+        self.seen = array.array("I", [0] * classes)
+
+    def found(self, cls: int) -> bool:
+        """True if the class was seen in the last frame."""
+        return self.seen[cls] != 0 and self.seen[cls] == self.frame
+
+    def age(self, cls: int) -> int:
+        """Returns the number of frames since the class was seen, -1 if never."""
+        return self.frame - self.seen[cls] if self.seen[cls] else -1
+
+    def get(self, cls: int, field: int) -> int:
+        """Returns a value (see FIELDS) of the last object seen of a class."""
+        return self.values[cls * Detections.FIELDS + field]
+
+    def set(self, cls: int, blob) -> None:
+        """Replaces the object of a class by a blob seen in this frame."""
+        i = cls * Detections.FIELDS
+        values = self.values
+        values[i], values[i + 1], values[i + 2], values[i + 3] = (
+            blob.x(),
+            blob.y(),
+            blob.w(),
+            blob.h(),
+        )
+        values[i + 4], values[i + 5], values[i + 6] = (
+            blob.cx(),
+            blob.cy(),
+            blob.pixels(),
+        )
+        self.seen[cls] = self.frame
+
+    def extend(self, cls: int, blob) -> None:
+        """Merges a blob into the object of a class seen in this frame."""
+        if self.seen[cls] != self.frame:
+            self.set(cls, blob)
+            return
+        i = cls * Detections.FIELDS
+        values = self.values
+        x0, y0 = min(values[i], blob.x()), min(values[i + 1], blob.y())
+        x1 = max(values[i] + values[i + 2], blob.x() + blob.w())
+        y1 = max(values[i + 1] + values[i + 3], blob.y() + blob.h())
+        pixels, more = values[i + 6], blob.pixels()
+        total = pixels + more
+        # The center is weighted by the pixels of each part
+        values[i + 4] = (values[i + 4] * pixels + blob.cx() * more) // total
+        values[i + 5] = (values[i + 5] * pixels + blob.cy() * more) // total
+        values[i], values[i + 1], values[i + 2], values[i + 3] = (
+            x0,
+            y0,
+            x1 - x0,
+            y1 - y0,
+        )
+        values[i + 6] = total if total < 0xFFFF else 0xFFFF
+
+
+class Detector:
+    """A class that finds the goals and the obstacles in one pass.
+
+    The thresholds of every class searched in a frame are given to a single
+    find_blobs call (see Camera._find_objects): each blob has the code bit
+    of the threshold it matches, which tells its class. The fragments of a
+    goal (cut by the ball or a robot in front of it) are merged into one
+    object, the largest obstacle is kept.
+
+    Goals barely move in the image: a class is only searched every few
+    frames (every), and only in its region of interest (rois, in QVGA
+    pixels, None for the whole frame). The pass covers the union of the
+    regions of the classes searched in the frame. The objects are large:
+    the pass tests one pixel every STRIDE (scaled to the frame width), the
+    blobs found are filled pixel by pixel.
+
+    The ball keeps its own pass (see Camera.ball_blob): its region is small
+    while it is tracked, adding the thresholds of the other classes to it
+    would search them there only, or widen it to the whole frame.
+
+    Masks of classes have the bit 1 << cls for each class searched.
+
+    Conventionnal usage:
+    blob = camera.ball_blob()  # searches the other classes too
+    if camera.detections.found(Detector.YELLOW_GOAL):
+        cx = camera.detections.get(Detector.YELLOW_GOAL, Detections.CX)
+
+    Attributes:
+        thresholds: LAB thresholds of each class (the ball's are the camera's)
+        every: frames between two searches of each class, 0 to disable it
+        rois: region of interest of each class (QVGA pixels), or None
+        pixels_threshold: minimal number of pixels of each class (QVGA)
+        detections: the results, updated in place
+        stride: pixels skipped between two tested ones, at the frame width
+    """
+
+    BALL, YELLOW_GOAL, BLUE_GOAL, OBSTACLE = 0, 1, 2, 3
+    NAMES = ("ball", "yellow_goal", "blue_goal", "obstacle")
+    THRESHOLDS = (
+        None,
+        [(40, 100, -30, 20, 40, 127)],  # yellow
+        [(0, 60, -30, 60, -128, -35)],  # blue
+        [(0, 20, -20, 20, -20, 20)],  # black robots
+    )
+    EVERY = (1, 4, 4, 2)
+    PIXELS_THRESHOLD = (0, 300, 300, 200)  # the ball's is the camera's
+    MERGED = (False, True, True, False)  # fragments merged into one object
+    STRIDE = 8  # at QVGA, the smallest objects are about 14 pixels wide
+
+    def __init__(self):
+        self.thresholds = [None] + [list(t) for t in Detector.THRESHOLDS[1:]]
+        self.every = bytearray(Detector.EVERY)
+        self.rois = [None, None, None, None]
+        self.pixels_threshold = list(Detector.PIXELS_THRESHOLD)
+        self.detections = Detections(len(Detector.NAMES))
+        self._pixels = array.array("H", Detector.PIXELS_THRESHOLD)
+        self._searched = array.array("I", [0] * len(Detector.NAMES))
+        self._scale = 1.0
+        self.stride = Detector.STRIDE
+        self._plans = {}  # by mask of classes: (thresholds, class of each code bit)
+        self._roi = [0, 0, 0, 0]
+
+    def configure(self, config: dict) -> None:
+        """Loads the settings of the classes (keyed by NAMES) from a config.
+
+        Each class can have thresholds, every, roi and pixels_threshold.
+        """
+        for cls in range(1, len(Detector.NAMES)):
+            settings = config.get(Detector.NAMES[cls])
+            if not settings:
+                continue
+            if "thresholds" in settings:
+                self.thresholds[cls] = [tuple(t) for t in settings["thresholds"]]
+            self.every[cls] = settings.get("every", self.every[cls])
+            roi = settings.get("roi", self.rois[cls])
+            self.rois[cls] = tuple(roi) if roi else None
+            self.pixels_threshold[cls] = settings.get(
+                "pixels_threshold", self.pixels_threshold[cls]
+            )
+        self._plans.clear()
+
+    def scale(self, width: int) -> None:
+        """Scales the QVGA filters and regions to a frame width."""
+        self._scale = width / 320
+        self.stride = max(2, Detector.STRIDE * width // 320)
+        for cls in range(len(Detector.NAMES)):
+            self._pixels[cls] = (
+                self.pixels_threshold[cls] * width * width // (320 * 320)
+            )
+
+    def due(self, frame: int) -> int:
+        """Returns the mask of the classes to search in a frame."""
+        self.detections.frame = frame
+        mask = 0
+        for cls in range(1, len(Detector.NAMES)):
+            every = self.every[cls]
+            if every and frame - self._searched[cls] >= every:
+                mask |= 1 << cls
+        return mask
+
+    def searched(self, mask: int) -> None:
+        """Marks the classes of a mask as searched in this frame."""
+        for cls in range(1, len(Detector.NAMES)):
+            if mask & (1 << cls):
+                self._searched[cls] = self.detections.frame
+
+    def plan(self, mask: int) -> tuple:
+        """Returns the thresholds of a pass, and the class of each code bit.
+
+        Plans are built once per mask, configure() forgets them.
+        """
+        plan = self._plans.get(mask)
+        if plan is None:
+            thresholds, classes = [], bytearray()
+            for cls in range(1, len(Detector.NAMES)):
+                if mask & (1 << cls):
+                    thresholds.extend(self.thresholds[cls])
+                    classes.extend(bytes((cls,)) * len(self.thresholds[cls]))
+            plan = (thresholds, classes)
+            self._plans[mask] = plan
+        return plan
+
+    def min_pixels(self, mask: int) -> int:
+        """Returns the smallest pixels threshold of the classes of a mask."""
+        pixels = 0xFFFF
+        for cls in range(1, len(Detector.NAMES)):
+            if mask & (1 << cls) and self._pixels[cls] < pixels:
+                pixels = self._pixels[cls]
+        return pixels
+
+    def roi(self, mask: int, width: int, height: int):
+        """Returns the union of the regions of the classes of a mask.
+
+        Returns:
+            the region to search, None for the whole frame
+        """
+        x0, y0, x1, y1 = width, height, 0, 0
+        roi = self._roi
+        scale = self._scale
+        for cls in range(1, len(Detector.NAMES)):
+            if not mask & (1 << cls):
+                continue
+            region = self.rois[cls]
+            if region is None:
+                return None
+            x0 = min(x0, int(region[0] * scale))
+            y0 = min(y0, int(region[1] * scale))
+            x1 = max(x1, int((region[0] + region[2]) * scale))
+            y1 = max(y1, int((region[1] + region[3]) * scale))
+        roi[0], roi[1] = max(0, x0), max(0, y0)
+        roi[2], roi[3] = min(width, x1) - roi[0], min(height, y1) - roi[1]
+        return roi
+
+    def add(self, cls: int, blob) -> None:
+        """Sorts a blob of a class found in this frame."""
+        if blob.pixels() < self._pixels[cls]:
+            return
+        region = self.rois[cls]
+        if region is not None:
+            scale = self._scale
+            cx, cy = blob.cx() / scale, blob.cy() / scale
+            if not (
+                region[0] <= cx < region[0] + region[2]
+                and region[1] <= cy < region[1] + region[3]
+            ):
+                return
+        detections = self.detections
+        if Detector.MERGED[cls]:
+            detections.extend(cls, blob)
+        elif not detections.found(cls) or blob.pixels() > detections.get(
+            cls, Detections.PIXELS
+        ):
+            detections.set(cls, blob)
@@ -1,13 +1,55 @@
-from pyb import I2C
-import uasyncio as asyncio
 import ustruct as struct
 
+from bus import I2CBus
 from utils import Timer
 import ulogging as logging
 
 logger = logging.Logger(__name__)
 
 
+class Frame:
+    """A preallocated I2C frame for one command of a motor slot.
+
+    Layout: HEADER (2 bytes), payload size (int32), payload [slot, CMD, args],
+    LRC of the payload and END. Everything but the arguments and the LRC is
+    written once, so encoding a command doesn't allocate any memory.
+
+    Args:
+        slot: motor's slot (0 or 1)
+        cmd: the command (one of Motor.COMMANDS)
+        fmt: format of the arguments (e.g. "<f"), empty if there is none
+    """
+
+    ARGS = 8  # offset of the arguments in the frame
+
+    def __init__(self, slot: int, cmd: int, fmt: str = ""):
+        size = struct.calcsize(fmt) if fmt else 0
+        self.fmt = fmt
+        self.nargs = len(fmt) - 1 if fmt else 0
+        self.buffer = bytearray(Frame.ARGS + size + 2)
+        self.buffer[0] = Motor.HEADER[0]
+        self.buffer[1] = Motor.HEADER[1]
+        struct.pack_into("<l", self.buffer, 2, size + 2)
+        self.buffer[6] = slot
+        self.buffer[7] = cmd
+        self.buffer[-1] = Motor.END
+        self.payload = memoryview(self.buffer)[6:-2]
+        self.encode()
+
+    def encode(self, arg1=0, arg2=0) -> bytearray:
+        """Packs the arguments in place and updates the LRC.
+
+        Returns:
+            buffer: the frame, ready to be sent
+        """
+        if self.nargs == 1:
+            struct.pack_into(self.fmt, self.buffer, Frame.ARGS, arg1)
+        elif self.nargs == 2:
+            struct.pack_into(self.fmt, self.buffer, Frame.ARGS, arg1, arg2)
+        self.buffer[-2] = Motor._lrc_calc(self.payload)
+        return self.buffer
+
+
 class Motor:
     """A class to represent a motor and offers an API to control it.
 
@@ -16,16 +58,30 @@ class Motor:
         - https://github.com/Makeblock-official/Makeblock-Libraries/blob/master/src/MeEncoderMotor.cpp
     """
 
-    HEADER = [0xA5, 0x01]
+    HEADER = (0xA5, 0x01)
     END = 0x5A
     CMD_MOVE_SPD = 0x05
     CMD_MOVE_SPD_TIME = 0x08
     CMD_RESET = 0x07
     CMD_MOVE_AGL = 0x11
+    CMD_GET_SPEED = 0x10
+    CMD_GET_POS = 0x12
+    # Format of the arguments of each command (the driver is little-endian)
+    COMMANDS = {
+        CMD_MOVE_SPD: "<f",  # speed
+        CMD_RESET: "",
+        CMD_MOVE_AGL: "<lf",  # angle, speed
+        CMD_MOVE_SPD_TIME: "<ff",  # speed, time
+        CMD_GET_SPEED: "",  # answers the speed (RPM, float)
+        CMD_GET_POS: "",  # answers the angle (degrees, float) since the last reset
+    }
 
     def __init__(self, pin: int, addr: int, slot: int):
         """Initialize I2C communication to motor.
 
+        Motors of the same pin share the same I2CBus, each one has its own
+        channel so that its last command replaces its pending one.
+
         Args:
             pin: I2C bus' pin (2 or 4)
             addr: slave's address
@@ -33,39 +89,119 @@ class Motor:
         """
         self.__slot = slot - 1
         self.__addr = addr
-        self.__i2c = I2C(pin)
-        self.__i2c.init(I2C.MASTER)
+        self.__bus = I2CBus(pin)
+        self.__channel = self.__bus.channel(addr)
         self.__speed = 0
+        self.__frames = {
+            cmd: Frame(self.__slot, cmd, fmt) for cmd, fmt in Motor.COMMANDS.items()
+        }
         self._stopper = Timer(callback=self.stop)
+        # Answers of the encoder requests (position, speed), filled in-place
+        self._answers = bytearray(8)
+        self._position_answer = memoryview(self._answers)[0:4]
+        self._speed_answer = memoryview(self._answers)[4:8]
+        self._requests = (
+            self.__frames[Motor.CMD_GET_POS].buffer,
+            self.__frames[Motor.CMD_GET_SPEED].buffer,
+        )
+        self._buffers = (self._position_answer, self._speed_answer)
 
     @property
     def speed(self):
         return self.__speed
 
-    async def __send_data(self, data: list):
-        """Creates a trame from the data and send it to motor via I2C.
+    @property
+    def position(self) -> float:
+        """The angle (degrees) of the wheel at the last read, since the last reset."""
+        return struct.unpack_from("<f", self._answers, 0)[0]
+
+    @property
+    def measured_speed(self) -> float:
+        """The speed (RPM) of the wheel at the last read of the encoder."""
+        return struct.unpack_from("<f", self._answers, 4)[0]
+
+    @property
+    def address(self) -> int:
+        return self.__addr
+
+    @property
+    def slot(self) -> int:
+        """The motor's slot on the driver (0 or 1)."""
+        return self.__slot
+
+    @property
+    def bus(self) -> I2CBus:
+        return self.__bus
+
+    @property
+    def channel(self) -> int:
+        """The motor's write channel on its bus."""
+        return self.__channel
+
+    @property
+    def ready(self) -> bool:
+        """True if the motor driver answers on the bus."""
+        return self.__bus.i2c.is_ready(self.__addr)
+
+    def _speed_frame(self, speed: float):
+        """Encodes a speed command, without sending it.
 
         Args:
-            data: [slot, CMD, args]: data to send
+            speed: rotation speed (RPM), limited to [-200, +200]
+
+        Returns:
+            trame: the frame to send, None if the speed doesn't change
         """
-        lrc = self._lrc_calc(data)
-        data_size = self._to_bytes("l", len(data))
-        trame = Motor.HEADER + data_size + data + [lrc, Motor.END]
-        self.__i2c.send(bytearray(trame), self.__addr)
-        await asyncio.sleep_ms(20)  # A few wait time is needed for the motor.
+        # Sets time limits to [-200 , +200]
+        if speed < -200:
+            speed = -200
+        elif speed > 200:
+            speed = 200
+        if speed == self.__speed:
+            return None
+        self.__speed = speed
+        return self.__frames[Motor.CMD_MOVE_SPD].encode(speed)
+
+    def _reset_frame(self) -> bytearray:
+        """Returns the reset command, the motor is considered stopped."""
+        self.__speed = 0
+        return self.__frames[Motor.CMD_RESET].buffer
+
+    def _stop_frame(self) -> bytearray:
+        """Returns a null speed command: unlike a reset, the position is kept."""
+        self.__speed = 0
+        return self.__frames[Motor.CMD_MOVE_SPD].encode(0)
 
-    def __recv_data(self, length: int) -> bytearray:
-        """Receives data from I2C slave's address
+    def __send_data(self, trame: bytearray):
+        """Queues an encoded frame, it is sent to motor via I2C by the bus.
 
         Args:
-            length number of bytes to receive
+            trame: the frame returned by Frame.encode()
+        """
+        self.__bus.submit(self.__channel, trame)
+
+    async def __recv_data(self, trames, buffers) -> bool:
+        """Sends requests and receives the answers from I2C slave's address
+
+        The requests are sent as one batch by the bus (see I2CBus.request).
+
+        Args:
+            trames: the request frames
+            buffers: the buffer of each answer, filled in-place
 
         Returns:
-            buffer: data received in bytes
+            False if the driver didn't answer
         """
-        buffer = bytearray(length)
-        self.__i2c.recv(buffer, self.__addr)
-        return buffer
+        return await self.__bus.request(self.__addr, trames, buffers)
+
+    async def read(self) -> bool:
+        """Reads the position and the speed of the encoder in one batch.
+
+        Returns:
+            False if the driver didn't answer, position and measured_speed
+            keep their previous values
+        """
+        return await self.__recv_data(self._requests, self._buffers)
 
     def scan(self) -> list:
         """Scan slaves connected to the current I2C pin.
@@ -73,7 +209,7 @@ class Motor:
         Returns:
             list_of_slaves: addresses of slaves that respond
         """
-        list_of_slaves = self.__i2c.scan()
+        list_of_slaves = self.__bus.i2c.scan()
         return list_of_slaves
 
     async def run(self, speed: float, time=None) -> None:
@@ -83,20 +219,12 @@ class Motor:
             speed: rotation speed (RPM) in [-200, +200]
             time: in seconds, runs for a specified time
         """
-        if self.__i2c.is_ready(self.__addr):
-            # Sets time limits to [-200 , +200] and convert it in bytes
-            if speed < -200:
-                speed = -200
-            elif speed > 200:
-                speed = 200
-            if speed != self.__speed:
-                speed_bytes = self._to_bytes("f", speed)
-                data = [self.__slot, Motor.CMD_MOVE_SPD] + speed_bytes
-                self.__speed = speed
-                await self.__send_data(data)
+        if self.ready:
+            trame = self._speed_frame(speed)
+            if trame:
+                self.__send_data(trame)
             if time:
-                self._stopper.cancel()
-                self._stopper.start(timeout=time)
+                self._stopper.start(timeout=time)  # reschedules a pending stop
         else:
             raise RuntimeError("Motor {} cannot be run.".format(self.__slot))
 
@@ -118,35 +246,18 @@ class Motor:
 
     async def stop(self):
         """Reset motor position to 0 and reinitialize data received."""
-        data = [self.__slot, Motor.CMD_RESET]
-        await self.__send_data(data)
-        self.__speed = 0
+        self.__send_data(self._reset_frame())
 
     @staticmethod
     def _lrc_calc(data) -> int:
         """Calculate the Longitudinal Redondancy Check (LRC)
 
+        Iterates by index, so that a memoryview can be given without allocating.
+
         Returns:
             lrc: the value of LRC
         """
         lrc = 0x00
-        for byte in data:
-            lrc ^= byte
+        for i in range(len(data)):
+            lrc ^= data[i]
         return lrc
-
-    @staticmethod
-    def _to_bytes(fmt: str, data) -> list:
-        """Convert and pack data with a given format
-
-        The list of available formats can be found here:
-        https://docs.python.org/3/library/struct.html
-
-        Args:
-            fmt: string used to pack the data from a given format.
-            data: data to be converted to bytes.
-
-        Returns:
-            data_bytes: a list of each element of data converted to bytes.
-        """
-        data_bytes = list(struct.pack(fmt, data))
-        return data_bytes
@@ -0,0 +1,76 @@
+import math
+
+import utime as time
+
+
+class Odometry:
+    """A class that estimates the pose of the robot from its wheel encoders.
+
+    The pose is dead reckoned from the angles of both wheels: x to the right
+    and y forward (mm) from where the first sample was taken, heading in
+    degrees, clockwise. The distance travelled and the angle turned are also
+    accumulated, move_to() and rotate() of the robot set their target on them.
+
+    The motors are mounted mirrored (see Robot.run): moving forward turns the
+    left wheel forward and the right one backward.
+
+    Attributes:
+        x, y: position of the robot (mm)
+        heading: orientation of the robot (degrees, clockwise)
+        travelled: forward distance (mm) since the start, negative backward
+        turned: clockwise angle (degrees) since the start
+        forward: forward speed (mm/s) between the last two samples
+        spin: clockwise rotation speed (degrees/s) between the last two samples
+        samples: number of samples received
+    """
+
+    def __init__(self, wheel: int = 80, track: int = 270):
+        """
+        Args:
+            wheel: diameter (mm) of the wheels
+            track: distance (mm) between the wheels
+        """
+        self.mm_per_degree = wheel * math.pi / 360
+        self.track = track
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the pose, the next sample is the new origin."""
+        self.x = self.y = self.heading = 0.0
+        self.travelled = self.turned = 0.0
+        self.forward = self.spin = 0.0
+        self.samples = 0
+        self._left = self._right = 0.0
+        self._last_ms = 0
+
+    def update(self, left: float, right: float, now_ms: int = None) -> None:
+        """Advances the pose with a sample of the encoders.
+
+        Args:
+            left, right: angles (degrees) of the left and right wheels
+            now_ms: time of the sample (ticks_ms)
+        """
+        now_ms = time.ticks_ms() if now_ms is None else now_ms
+        if self.samples:
+            dleft = (left - self._left) * self.mm_per_degree
+            dright = (self._right - right) * self.mm_per_degree  # mirrored
+            distance = (dleft + dright) / 2
+            angle = math.degrees((dleft - dright) / self.track)
+            # Moves along the mean heading of the interval
+            rad = math.radians(self.heading + angle / 2)
+            self.x += distance * math.sin(rad)
+            self.y += distance * math.cos(rad)
+            self.heading = (self.heading + angle + 180) % 360 - 180
+            self.travelled += distance
+            self.turned += angle
+            dt = time.ticks_diff(now_ms, self._last_ms) / 1000
+            if dt > 0:
+                self.forward = distance / dt
+                self.spin = angle / dt
+        self._left, self._right = left, right
+        self._last_ms = now_ms
+        self.samples += 1
+
+    def age(self) -> int:
+        """Returns the age (ms) of the last sample."""
+        return time.ticks_diff(time.ticks_ms(), self._last_ms)
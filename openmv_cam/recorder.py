@@ -0,0 +1,154 @@
+import array
+
+import ustruct as struct
+import utime as time
+
+import ulogging as logging
+
+logger = logging.Logger(__name__)
+
+
+class Recorder:
+    """A class that records a match: frames, sensors and motor commands.
+
+    The file is a sequence of chunks, each one made of a header (tag, ticks_ms,
+    frame number, payload length) and of its payload. The ticks of a frame
+    are the ones of its capture, the time of the tracker's measure:
+        FRAM: width, height (<HH) and the RGB565 pixels of a downsampled frame
+        SENS: the 12 bytes answered by the Arduino (see Sensor.recv)
+        MOTR: left speed, right speed (RPM) and time in ms, 0 if none (<ffi)
+        STOP: nothing, the motors were stopped
+        BALL: angle (degrees) and distance (mm) of the ball measured in a
+            frame (<fi), at the ticks of the frame: the tracker's inputs
+    close() appends an INDX chunk (tag and offset of every chunk) and a
+    trailer (b"RIDX", offset of the index). A file that wasn't closed has no
+    index, it is rebuilt by reading the chunks (see host/replay.py).
+
+    Conventionnal usage:
+    recorder = Recorder("match.rec")
+    await robot.main(recorder=recorder)  # attaches it to the robot
+    recorder.close()
+
+    Args:
+        path: the file to write, replaced if it exists
+        scale: downsampling of the frames (0.25: a QVGA frame is 80x60)
+        every: records one frame out of every
+        frames: if False, frames aren't recorded (sensors and motors only)
+    """
+
+    MAGIC = b"RREC\x01"
+    HEADER = "<4sIII"  # tag, ticks_ms, frame number, payload length
+    HEADER_SIZE = 16
+    TAGS = (b"FRAM", b"SENS", b"MOTR", b"STOP", b"INDX", b"BALL")
+    FRAME, SENSORS, MOTORS, STOP, INDEX, BALL = 0, 1, 2, 3, 4, 5
+
+    def __init__(self, path: str, scale: float = 0.25, every: int = 1, frames=True):
+        self.path = path
+        self.scale = scale
+        self.every = every
+        self.record_frames = frames
+        self.frames = 0  # frames seen, recorded or not
+        self.chunks = 0
+        self._file = open(path, "wb")
+        self._file.write(Recorder.MAGIC)
+        self._offset = len(Recorder.MAGIC)
+        self._header = bytearray(Recorder.HEADER_SIZE)
+        self._size = bytearray(4)
+        self._motors = bytearray(12)
+        self._ball = bytearray(8)
+        self._tags = array.array("B")
+        self._offsets = array.array("I")
+
+    def attach(self, robot) -> None:
+        """Records the sensors read and the commands sent by a robot."""
+        robot.recorder = self
+        robot.sensor.recorder = self
+
+    def _chunk(self, tag: int, length: int, ticks: int = None) -> bool:
+        """Writes the header of a chunk, the caller writes its payload.
+
+        Args:
+            ticks: ticks_ms() of the chunk, now if None
+
+        Returns:
+            False if the file is closed
+        """
+        if self._file is None:
+            return False
+        struct.pack_into(
+            Recorder.HEADER,
+            self._header,
+            0,
+            Recorder.TAGS[tag],
+            time.ticks_ms() if ticks is None else ticks,
+            self.frames,
+            length,
+        )
+        self._file.write(self._header)
+        self._tags.append(tag)
+        self._offsets.append(self._offset)
+        self._offset += Recorder.HEADER_SIZE + length
+        self.chunks += 1
+        return True
+
+    def frame(self, img, ticks: int = None) -> None:
+        """Records a downsampled copy of a snapshot (one out of every).
+
+        Args:
+            img: the snapshot
+            ticks: ticks_ms() of its capture, now if None
+        """
+        self.frames += 1
+        if not self.record_frames or (self.frames - 1) % self.every:
+            return
+        small = img.copy(x_scale=self.scale, y_scale=self.scale)
+        pixels = small.bytearray()
+        if self._chunk(Recorder.FRAME, 4 + len(pixels), ticks):
+            struct.pack_into("<HH", self._size, 0, small.width(), small.height())
+            self._file.write(self._size)
+            self._file.write(pixels)
+
+    def sensors(self, buffer) -> None:
+        """Records the raw answer of the Arduino."""
+        if self._chunk(Recorder.SENSORS, len(buffer)):
+            self._file.write(buffer)
+
+    def motors(self, lspeed: float, rspeed: float, time_s=None) -> None:
+        """Records a command of both motors."""
+        if self._chunk(Recorder.MOTORS, len(self._motors)):
+            struct.pack_into(
+                "<ffi",
+                self._motors,
+                0,
+                lspeed,
+                rspeed,
+                int(time_s * 1000) if time_s else 0,
+            )
+            self._file.write(self._motors)
+
+    def ball(self, angle: float, distance: int, ticks: int) -> None:
+        """Records a measure of the ball, at the ticks_ms() of its frame."""
+        if self._chunk(Recorder.BALL, len(self._ball), ticks):
+            struct.pack_into("<fi", self._ball, 0, angle, distance)
+            self._file.write(self._ball)
+
+    def stop(self) -> None:
+        """Records that the motors were stopped."""
+        self._chunk(Recorder.STOP, 0)
+
+    def close(self) -> None:
+        """Writes the index and closes the file."""
+        if self._file is None:
+            return
+        index = self._offset
+        count = len(self._tags)
+        self._chunk(Recorder.INDEX, 4 + 5 * count)
+        self._file.write(struct.pack("<I", count))
+        entry = bytearray(5)
+        for i in range(count):
+            struct.pack_into("<BI", entry, 0, self._tags[i], self._offsets[i])
+            self._file.write(entry)
+        self._file.write(b"RIDX" + struct.pack("<I", index))
+        self._file.close()
+        self._file = None
+        logger.info("{} chunks recorded in {}", count, self.path)
@@ -1,31 +1,119 @@
 # http://docs.micropython.org/en/latest/library/pyb.html
-import uasyncio as asyncio
 import math
+import pyb
+import uasyncio as asyncio
+import utime as time
 
 import ulogging as logging
 from motors import Motor
+from odometry import Odometry
+from safety import LineGuard
+from scheduler import Scheduler
 from sensors import Camera, Sensor
+from tracing import tracer
+from utils import Timer
 
 logger = logging.Logger(__name__)
+# Per frame records, written only if a handler is given (see boot.py)
+telemetry = logging.Logger("telemetry")
+
+
+class Decision:
+    """What to send to the motors for a frame (see Robot.decide and Robot.act).
+
+    Attributes:
+        kind: NONE (nothing to send), RUN, ROTATE, MOVE or SEARCH
+        lspeed, rspeed: the speeds (RPM) of a RUN
+        amount: the angle (degrees) of a ROTATE, the distance (mm) of a MOVE
+        angle: the angle of the ball, None if it wasn't seen
+        blob: the ball's blob, None if it wasn't seen
+    """
+
+    NONE, RUN, ROTATE, MOVE, SEARCH = range(5)
+
+    def __init__(self):
+        self.kind = Decision.NONE
+        self.lspeed = self.rspeed = 0.0
+        self.amount = 0.0
+        self.angle = None
+        self.blob = None
 
 
 class Robot:
     """A class that represents the robot and offers shortcuts functions
     to runs two motors.
 
+    Both motors are commanded together (see run()): their frames are written
+    one right after the other and they share the same stop deadline.
+
+    With TRACKING, main() follows the ball with a BallTracker and sends one
+    command per frame that blends the turn and the forward speed. Otherwise
+    it rotates towards the ball, then moves the measured distance.
+
+    Once started, a task reads the encoders of both wheels in one batch and
+    updates the odometry. rotate() and move_to() start a timer for the time
+    the move should take, then each sample reschedules it from the measured
+    progress and speed: the robot stops when the wheels have actually
+    travelled the distance or turned the angle, whatever the friction.
+
+    A LineGuard watches the line sensors: while it retreats from a line,
+    the robot is preempted and its commands are ignored.
+
+    main() decides (decide()) then commands the motors (act()) once per
+    frame, one step after the other. With FRAMEBUFFERS over 1, the sensor
+    captures the next frames meanwhile (DMA): a snapshot doesn't wait for
+    the readout of its frame. After the loop slept until its period, the
+    frame waiting in the buffers is dropped (see Camera.drop_frame), its
+    age would add to the latency of the command.
+
+    The camera is reset first, so that it settles while the rest is built.
+    With PARALLEL_BOOT, bring_up() then probes the motor driver and the
+    Arduino while the camera settles. Otherwise the camera settles for its
+    whole SETTLE_MS once they have answered, one step after the other.
+
     Args:
         rmotor (Motor): The right-side motor
         lmotor (Motor): The left-side motor
+        odometry (Odometry): the pose of the robot, from the encoders
+        guard (LineGuard): keeps the robot inside the field
+        recorder (Recorder): if set, records the commands of the motors
+        odometry_errors: number of failed reads of the encoders
     """
 
     WHEEL_DIAMETER = 80  # in millimeters
     ROT_DIAMETER = 270  # distance (mm) between two wheels
+    PERIOD = 40  # period (ms) of the main loop, 25 FPS
+    TRACKING = True  # intercepts the ball instead of rotating then moving
+    DUMP_EVERY = 250  # iterations between two timing reports (scheduler in debug mode)
+    ODOMETRY_RATE = 25  # reads of the encoders per second
+    MOVE, ROTATE = 1, 2  # kinds of goal of the closed loop
+    ROTATE_SPEED = 100  # RPM, to turn towards the ball (without TRACKING)
+    MOVE_SPEED = 150  # RPM, to move to the ball (without TRACKING)
+    SEARCH_SPEED = 100  # RPM, to turn on the spot while the ball is lost
+    DEADBAND = 5  # degrees, the ball is ahead under this angle (without TRACKING)
+    PARALLEL_BOOT = True  # probes the I2C devices while the camera settles
+    PROBE_TIMEOUT = 2000  # ms, for the motor driver and the Arduino at startup
+    FRAMEBUFFERS = 1  # of the sensor, 3 captures while a frame is processed
 
     def __init__(self):
+        self.camera = Camera()
         self.lmotor = Motor(4, 0x09, 1)
         self.rmotor = Motor(4, 0x09, 2)
-        self.camera = Camera()
         self.sensor = Sensor()
+        self.odometry = Odometry(Robot.WHEEL_DIAMETER, Robot.ROT_DIAMETER)
+        self.odometry_errors = 0
+        self.guard = LineGuard(self)
+        self._stopper = Timer(callback=self.stop)
+        self.recorder = None
+        self._goal_kind = 0  # MOVE or ROTATE, 0 if no move is closed-loop
+        self._goal = 0.0  # odometry.travelled or odometry.turned to reach
+        self._goal_sign = 1
+        self._reader = None
+
+    @property
+    def preempted(self) -> bool:
+        """True while the guard retreats from a line."""
+        return self.guard.active
 
     @property
     def moving(self):
@@ -44,11 +132,56 @@ class Robot:
         time = turns * 60 / abs(speed)
         return time
 
+    async def run(self, lspeed: float, rspeed: float, time=None) -> None:
+        """Runs both motors at once, for an optional time.
+
+        The motors are mounted mirrored: the same speed on both turns the robot.
+        Nothing is sent while the robot is preempted.
+
+        Args:
+            lspeed: the left motor speed [-200; 200] in RPM
+            rspeed: the right motor speed [-200; 200] in RPM
+            time: in seconds, both motors are stopped after this time
+        """
+        if self.preempted:
+            return
+        lmotor, rmotor = self.lmotor, self.rmotor
+        if not (lmotor.ready and rmotor.ready):
+            raise RuntimeError("Motors cannot be run.")
+        self._goal_kind = 0
+        lmotor.bus.submit_pair(
+            rmotor.channel,
+            rmotor._speed_frame(rspeed),
+            lmotor.channel,
+            lmotor._speed_frame(lspeed),
+        )
+        # Only the shared deadline can stop the motors
+        lmotor._stopper.cancel()
+        rmotor._stopper.cancel()
+        if time:
+            self._stopper.start(timeout=time)  # reschedules a pending stop
+        else:
+            self._stopper.cancel()
+        if self.recorder:
+            self.recorder.motors(lspeed, rspeed, time)
+
     async def stop(self, *_) -> None:
-        """Stop all motors and timer"""
+        """Stop all motors and timer
+
+        The motors are given a null speed rather than reset, so that their
+        encoders keep counting for the odometry.
+        """
         logger.debug("Stopping motors...")
-        await self.rmotor.stop()
-        await self.lmotor.stop()
+        self._stopper.cancel()
+        self._goal_kind = 0
+        self.lmotor.bus.submit_pair(
+            self.rmotor.channel,
+            self.rmotor._stop_frame(),
+            self.lmotor.channel,
+            self.lmotor._stop_frame(),
+        )
+        if self.recorder:
+            self.recorder.stop()
 
     async def rotate(self, speed: float, angle: float) -> None:
         """Turns itself in clockwise.
@@ -64,9 +197,9 @@ class Robot:
         section_dist = (angle % 360) / 360 * math.pi * Robot.ROT_DIAMETER
         # 0.8 is a correction factor (turn is limited by frictions on the surface)
         time = self.time_for_distance(section_dist, speed)
-        await self.rmotor.run(speed, time)
-        await self.lmotor.run(speed, time)
-        # await asyncio.sleep_ms(round(time * 1000))
+        await self.run(speed, speed, time)
+        if time and not self.preempted:
+            self._set_goal(Robot.ROTATE, self.odometry.turned, angle, speed)
 
     async def move_to(self, distance: float, speed: float) -> None:
         """Move to the object position at a given speed.
@@ -76,28 +209,229 @@ class Robot:
            speed: the speed [-200; 200] in RPM
         """
         time = self.time_for_distance(distance, speed)
-        await self.rmotor.run(-speed, time)
-        await self.lmotor.run(speed, time)
+        await self.run(speed, -speed, time)
+        if time and not self.preempted:
+            self._set_goal(Robot.MOVE, self.odometry.travelled, distance, speed)
 
+    def _set_goal(self, kind: int, start: float, amount: float, speed: float) -> None:
+        """Closes the loop of a move on the odometry (see _close_loop)."""
+        self._goal_kind = kind
+        self._goal_sign = 1 if speed >= 0 else -1
+        self._goal = start + amount * self._goal_sign
 
-async def main() -> None:
-    """The main function, interact with sensors and Robot class"""
-    robot = Robot()
-    logger.info("Robot is ready")
+    async def _close_loop(self) -> None:
+        """Stops the move once reached, or reschedules its stop."""
+        odometry = self.odometry
+        if self._goal_kind == Robot.MOVE:
+            done, rate = odometry.travelled, odometry.forward
+        else:
+            done, rate = odometry.turned, odometry.spin
+        remaining = (self._goal - done) * self._goal_sign
+        rate *= self._goal_sign
+        if remaining <= 0:
+            await self.stop()
+        elif rate > 0:  # the wheels turn the right way, else keep the timer
+            self._stopper.start(timeout=remaining / rate)
 
-    while True:
-        ball_blob = robot.camera.ball_blob()
+    def decide(self, tracker, blob, decision: Decision, now_ms: int) -> None:
+        """Fills a decision from the ball's blob of a frame.
+
+        The measure of the ball (angle and distance) is recorded with the
+        ticks of the frame, so that a replay can give the same inputs.
+
+        Args:
+            tracker: a BallTracker with TRACKING, else None
+            blob: the ball's blob, None if it wasn't seen
+            decision: the record to fill, reused from frame to frame
+            now_ms: ticks_ms() of the frame (Camera.captured_ms), the time
+                of the tracker's measures
+        """
+        camera = self.camera
+        decision.kind = Decision.NONE
+        decision.angle = None
+        decision.blob = blob
+        distance = 0
+        if blob:
+            decision.angle = camera.get_angle(blob)
+            distance = camera.distance_to(blob)
+            if self.recorder:
+                self.recorder.ball(decision.angle, distance, now_ms)
+        if Robot.TRACKING:
+            if blob:
+                tracker.update(decision.angle, distance, now_ms)
+            else:
+                tracker.miss(now_ms)
+            command = tracker.command()
+            if command is None:
+                # The ball is lost: turns on the spot until it is seen again
+                decision.kind = Decision.SEARCH
+            else:
+                decision.kind = Decision.RUN
+                decision.lspeed, decision.rspeed = command
         # if the ball was detected
-        if ball_blob:
-            angle = robot.camera.get_angle(ball_blob)
-            if abs(angle) >= 5:
-                await robot.rotate(speed=100, angle=angle)
-            if not robot.moving:
-                dist = robot.camera.distance_to(ball_blob)
-                await robot.move_to(dist, speed=150)
-        elif not robot.moving:
-            await robot.rmotor.run(100)
-            await robot.lmotor.run(100)
+        elif blob:
+            if abs(decision.angle) >= Robot.DEADBAND:
+                decision.kind = Decision.ROTATE
+                decision.amount = decision.angle
+            elif not self.moving:
+                decision.kind = Decision.MOVE
+                decision.amount = distance
+        elif not self.moving:
+            decision.kind = Decision.SEARCH
             # TODO: fix: ball can be stuck to robot
 
-        await asyncio.sleep_ms(40)  # 25 FPS, this time is needed to run tasks
+    async def act(self, decision: Decision) -> None:
+        """Sends a decision to the motors."""
+        kind = decision.kind
+        if kind == Decision.RUN:
+            await self.run(decision.lspeed, decision.rspeed)
+        elif kind == Decision.ROTATE:
+            await self.rotate(speed=Robot.ROTATE_SPEED, angle=decision.amount)
+        elif kind == Decision.MOVE:
+            await self.move_to(decision.amount, speed=Robot.MOVE_SPEED)
+        elif kind == Decision.SEARCH:
+            await self.run(Robot.SEARCH_SPEED, Robot.SEARCH_SPEED)
+
+    def log_decision(self, decision: Decision) -> None:
+        """Writes the telemetry record of a frame, if enabled."""
+        if telemetry.enabled_for(0):
+            blob = decision.blob
+            telemetry.debug(
+                "angle {} distance {} speeds {} {}",
+                decision.angle,
+                self.camera.distance_to(blob) if blob else None,
+                self.lmotor.speed,
+                self.rmotor.speed,
+            )
+
+    async def bring_up(self, boot=None) -> None:
+        """Probes the I2C devices and waits for the camera to settle.
+
+        The Arduino may boot slower than the camera: it is probed until it
+        answers, and its first sample is read. Missing devices are logged,
+        the robot starts anyway.
+
+        Args:
+            boot: a startup.BootTimer, the phases are recorded in it and its
+                deferred jobs are run while the camera settles
+        """
+        start = time.ticks_us()
+        warm_up = None
+        if Robot.PARALLEL_BOOT:
+            warm_up = asyncio.create_task(self.camera.warm_up())
+        if boot:
+            boot.run_deferred()
+        lmotor = self.lmotor
+        if not await lmotor.bus.probe(lmotor.address, Robot.PROBE_TIMEOUT):
+            logger.warning("The motor driver doesn't answer")
+        if not await self.sensor.probe(Robot.PROBE_TIMEOUT):
+            logger.warning("The Arduino doesn't answer")
+        if boot:
+            boot.span("probe", start)
+        settle = time.ticks_us()
+        if warm_up is None:
+            await self.camera.warm_up(Camera.SETTLE_MS)
+        else:
+            await warm_up
+        if boot:
+            boot.span("settle", start if warm_up else settle)
+            boot.mark("bring-up")
+
+    def start(self, rate: int = ODOMETRY_RATE) -> None:
+        """Starts reading the encoders in background, and the guard.
+
+        Args:
+            rate: number of reads of the encoders per second
+        """
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._odometry_loop(1000 // rate))
+        self.guard.start()
+
+    async def _odometry_loop(self, period: int) -> None:
+        lmotor, rmotor = self.lmotor, self.rmotor
+        # Both positions in one batch, so that they are read together
+        trames = (lmotor._requests[0], rmotor._requests[0])
+        buffers = (lmotor._position_answer, rmotor._position_answer)
+        deadline = time.ticks_ms()
+        while True:
+            if await lmotor.bus.request(lmotor.address, trames, buffers):
+                self.odometry.update(lmotor.position, rmotor.position)
+                if self._goal_kind:
+                    await self._close_loop()
+            else:
+                self.odometry_errors += 1
+            deadline = time.ticks_add(deadline, period)
+            wait = time.ticks_diff(deadline, time.ticks_ms())
+            if wait < 0:  # late: don't try to catch up
+                deadline, wait = time.ticks_ms(), 0
+            await asyncio.sleep_ms(wait)
+
+
+async def main(
+    robot: Robot = None, recorder=None, stream=None, boot=None, scheduler=None
+) -> None:
+    """The main function, interact with sensors and Robot class
+
+    Args:
+        robot: the Robot to control, created if None
+        recorder: a Recorder of the frames, sensors and motor commands
+        stream: a TelemetryStream, sent a frame per iteration
+        boot: a startup.BootTimer, its report is logged after the first
+            decision
+        scheduler: paces the loop and times it, created if None
+    """
+    if robot is None:
+        robot = Robot()
+        if boot:
+            boot.mark("robot")
+    if recorder:
+        recorder.attach(robot)
+    await robot.bring_up(boot)
+    robot.sensor.start()
+    robot.start()
+    if scheduler is None:
+        scheduler = Scheduler(Robot.PERIOD)
+    tracker = None
+    if Robot.TRACKING:
+        from tracking import BallTracker
+
+        tracker = BallTracker(Robot.ROT_DIAMETER)
+    debug = pyb.USB_VCP().debug_mode_enabled()
+    logger.info("Robot is ready")
+    robot.camera.set_framebuffers(Robot.FRAMEBUFFERS)
+    decision = Decision()
+    waited = False
+    while True:
+        scheduler.start()
+        if waited:
+            robot.camera.drop_frame()
+        ball_blob = robot.camera.ball_blob()
+        if recorder:
+            recorder.frame(robot.camera.image, robot.camera.captured_ms)
+        scheduler.add(Scheduler.CAPTURE, robot.camera.frame_us - robot.camera.detect_us)
+        scheduler.mark(Scheduler.DETECT)
+
+        robot.decide(tracker, ball_blob, decision, robot.camera.captured_ms)
+        scheduler.mark(Scheduler.DECIDE)
+        if boot:
+            boot.mark("first decision")
+
+        await robot.act(decision)
+        if decision.kind != Decision.NONE:
+            scheduler.command(robot.camera.captured_us)
+        scheduler.mark(Scheduler.ACTUATE)
+
+        if stream:
+            stream.record(robot, scheduler, ball_blob)
+        if boot:
+            boot.finish(logger)
+            boot = None
+        robot.log_decision(decision)
+
+        if scheduler.iterations % Robot.DUMP_EVERY == Robot.DUMP_EVERY - 1:
+            if debug:
+                scheduler.dump()
+            if tracer.enabled:
+                tracer.dump()
+        # Sleeps until the next period, this time is needed to run tasks
+        waited = await scheduler.wait() > 0
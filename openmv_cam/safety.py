@@ -0,0 +1,220 @@
+import array
+
+import micropython
+import pyb
+import uasyncio as asyncio
+import utime as time
+
+from bus import I2CBus
+from motors import Frame, Motor
+from sensors import Sensor
+from tracing import tracer
+import ulogging as logging
+
+logger = logging.Logger(__name__)
+
+LINE_REACTION = tracer.span("line_reaction")
+
+
+class LineGuard:
+    """A class that keeps the robot inside the field.
+
+    A hardware timer samples the line sensors RATE times per second, much
+    faster than the camera loop: its interrupt schedules _check(), which runs
+    as soon as the current bytecode ends, even in the middle of an iteration
+    of the main loop (only a C function like a snapshot or find_blobs delays
+    it). When a sensor sees the line, _check() writes the retreat on the
+    motors' bus right away, ahead of the queued frames, and holds the bus so
+    that they are dropped. Then a task preempts the robot: its move and its
+    stop timers are cancelled and its commands are ignored until the retreat
+    ends, the motors are stopped.
+
+    With the protocol v2 of the Arduino, only the line sensors are read
+    (Sensor.LINES), the answers with a wrong CRC are counted in errors.
+
+    The robot backs away from a line seen at the front, moves forward from
+    one seen at the rear, and turns its side away from it. It stops if the
+    line is seen at both ends.
+
+    The reaction latency is measured from the interrupt that sampled the
+    line to the retreat written on the bus. The line is checked at most one
+    period plus the longest C function of the main loop after it was
+    crossed: a snapshot that reads a frame out of the sensor (about 12 ms at
+    QVGA with one framebuffer) skips samples. The retreat then waits at most
+    for the frame being written and the gap of the driver (see send_now).
+
+    Conventionnal usage:
+    guard = LineGuard(robot)
+    guard.start()  # in the running loop
+
+    Args:
+        robot: the Robot to preempt
+
+    Attributes:
+        thresholds: value over which each line sensor sees the line
+        active: True while retreating
+        seen: the sensors that saw the line in the last sample (bit i for
+            the sensor i, see Sensor.line)
+        lspeed, rspeed: speeds of the last retreat
+        triggers: number of retreats
+        samples, errors: reads of the line sensors, and failed or rejected ones
+        overruns: samples skipped because the previous one hadn't run yet
+            (the main loop was in a C function)
+        latency_last_us, latency_max_us, latency_total_us: reaction latencies
+    """
+
+    RATE = 250  # samples per second
+    TIMER = 4  # the hardware timer that paces the samples
+    THRESHOLD = 500  # a line sensor (0-1023) sees the white line above it
+    RETREAT_MS = 300
+    RETREAT_SPEED = 140  # RPM, with the turn it makes the full speed (200)
+    RETREAT_TURN = 60  # RPM, turns the side that saw the line away from it
+    FRONT, REAR = 0b0011, 0b1100  # bits of the sensors in seen
+    LEFT, RIGHT = 0b0101, 0b1010
+
+    def __init__(self, robot):
+        self.robot = robot
+        self.thresholds = array.array("H", [LineGuard.THRESHOLD] * 4)
+        self.active = False
+        self.seen = 0
+        self.lspeed = self.rspeed = 0
+        self.triggers = 0
+        self.samples = 0
+        self.errors = 0
+        self.overruns = 0
+        self.latency_last_us = 0
+        self.latency_max_us = 0
+        self.latency_total_us = 0
+        self._i2c = I2CBus(Sensor.PIN).i2c
+        self._sensor = robot.sensor  # its version of the protocol
+        self._buffer = bytearray(Sensor.size(Sensor.LINES))
+        self._v1 = bytearray(2 * Sensor.FIELDS)
+        self._bus = robot.lmotor.bus
+        # Frames of their own: the retreat doesn't touch the motors' frames
+        self._lframe = Frame(robot.lmotor.slot, Motor.CMD_MOVE_SPD, "<f")
+        self._rframe = Frame(robot.rmotor.slot, Motor.CMD_MOVE_SPD, "<f")
+        self._until = 0
+        self._irq_us = 0
+        self._scheduled = False
+        self._check_ref = self._check  # bound once, the interrupt can't allocate
+        self._flag = asyncio.ThreadSafeFlag()
+        self._timer = None
+        self._task = None
+
+    def start(self, rate: int = RATE) -> None:
+        """Starts sampling the line sensors.
+
+        Args:
+            rate: number of samples per second
+        """
+        if self._timer is None:
+            self._task = asyncio.create_task(self._preempt_loop())
+            self._timer = pyb.Timer(LineGuard.TIMER, freq=rate, callback=self._irq)
+
+    def stop(self) -> None:
+        """Stops sampling the line sensors."""
+        if self._timer is not None:
+            self._timer.deinit()
+            self._task.cancel()
+            self._timer = self._task = None
+
+    def latency_mean_us(self) -> float:
+        return self.latency_total_us / self.triggers if self.triggers else 0.0
+
+    def _irq(self, timer) -> None:
+        """Interrupt handler of the timer: it must not allocate."""
+        if self._scheduled:  # the latency counts from the first one
+            self.overruns += 1
+            return
+        self._irq_us = time.ticks_us()
+        self._scheduled = True
+        try:
+            micropython.schedule(self._check_ref, 0)
+        except RuntimeError:  # the queue is full
+            self._scheduled = False
+            self.overruns += 1
+
+    def _check(self, _) -> None:
+        """Samples the line sensors, retreats if one of them sees the line."""
+        self._scheduled = False
+        v1 = self._sensor.version == 1
+        try:
+            if v1:  # the lines follow the distances
+                buffer, offset = self._v1, 4
+                self._i2c.recv(buffer, Sensor.SLAVE_ADDRESS)
+            else:
+                buffer, offset = self._buffer, Sensor.HEADER
+                self._i2c.mem_read(buffer, Sensor.SLAVE_ADDRESS, Sensor.LINES)
+        except OSError:
+            self.errors += 1
+            return
+        if not (v1 or Sensor.valid(buffer, Sensor.LINES)):
+            self.errors += 1
+            return
+        self.samples += 1
+        seen = 0
+        for i in range(4):
+            value = buffer[offset + 2 * i] << 8 | buffer[offset + 1 + 2 * i]
+            if value > self.thresholds[i]:
+                seen |= 1 << i
+        # A retreat is only changed if the line is seen by other sensors
+        if seen and (seen != self.seen or not self.active):
+            self._retreat(seen)
+        self.seen = seen
+
+    def _retreat(self, seen: int) -> None:
+        forward = turn = 0
+        front, rear = seen & LineGuard.FRONT, seen & LineGuard.REAR
+        if not (front and rear):
+            forward = -LineGuard.RETREAT_SPEED if front else LineGuard.RETREAT_SPEED
+            left, right = seen & LineGuard.LEFT, seen & LineGuard.RIGHT
+            if left and not right:
+                turn = LineGuard.RETREAT_TURN
+            elif right and not left:
+                turn = -LineGuard.RETREAT_TURN
+            if rear:  # turning the rear away turns the other way around
+                turn = -turn
+        # The motors are mounted mirrored (see Robot.run)
+        self.lspeed, self.rspeed = forward + turn, turn - forward
+        bus = self._bus
+        bus.held = True
+        addr = self.robot.lmotor.address
+        bus.send_now(addr, self._rframe.encode(self.rspeed))
+        bus.send_now(addr, self._lframe.encode(self.lspeed))
+        latency = time.ticks_diff(time.ticks_us(), self._irq_us)
+        self.latency_last_us = latency
+        self.latency_total_us += latency
+        if latency > self.latency_max_us:
+            self.latency_max_us = latency
+        self.triggers += 1
+        self._until = time.ticks_add(time.ticks_ms(), LineGuard.RETREAT_MS)
+        self.active = True
+        self._flag.set()
+
+    async def _preempt_loop(self) -> None:
+        """Preempts the robot during each retreat, then stops it."""
+        robot = self.robot
+        while True:
+            await self._flag.wait()
+            self.active = True
+            robot._stopper.cancel()
+            robot.lmotor._stopper.cancel()
+            robot.rmotor._stopper.cancel()
+            robot._goal_kind = 0
+            tracer.add(LINE_REACTION, self.latency_last_us)
+            if robot.recorder:
+                robot.recorder.motors(
+                    self.lspeed, self.rspeed, LineGuard.RETREAT_MS / 1000
+                )
+            logger.warning(
+                "Line seen ({:#06b}), retreat written in {} us",
+                self.seen,
+                self.latency_last_us,
+            )
+            wait = time.ticks_diff(self._until, time.ticks_ms())
+            while wait > 0:  # a new retreat pushes the end further
+                await asyncio.sleep_ms(wait)
+                wait = time.ticks_diff(self._until, time.ticks_ms())
+            self._bus.held = False
+            self.active = False
+            await robot.stop()
@@ -0,0 +1,183 @@
+import array
+
+import uasyncio as asyncio
+import utime as time
+
+import ulogging as logging
+
+logger = logging.Logger(__name__)
+
+
+class Scheduler:
+    """A class that paces a control loop against a target period.
+
+    Each iteration sleeps only for what remains of its period, instead of a
+    fixed time after the work. The time of each stage of the iteration and
+    the busy time of the iterations (histogram) are recorded, and the
+    latency from the capture of each frame to its motor command (command()).
+
+    Conventionnal usage:
+    scheduler = Scheduler(period=40)
+    while True:
+        scheduler.start()
+        ...  # capture
+        scheduler.mark(Scheduler.CAPTURE)
+        ...
+        await scheduler.wait()
+
+    Attributes:
+        period: the target period in milliseconds
+        iterations: number of iterations done
+        overruns: number of iterations longer than the period
+        jitter_max_ms: the latest an iteration started after its deadline
+        last_us: the time of each stage in the last iteration (us)
+        histogram: number of iterations by busy time (BUCKET_MS wide buckets,
+            the last one counts all the longer iterations)
+        commands: number of frames commanded (see command())
+        latencies: capture-to-command latency (us) of the last LATENCIES
+            frames, in a ring indexed by commands
+        latency_last_us, latency_max_us, latency_total_us: the same, of the
+            last frame, the longest one and their sum
+    """
+
+    STAGES = ("capture", "detect", "decide", "actuate")
+    CAPTURE, DETECT, DECIDE, ACTUATE = range(4)
+    BUCKET_MS = 5
+    BUCKETS = 16
+    LATENCIES = 256  # capture-to-command latencies kept
+
+    def __init__(self, period: int = 40):
+        """Initialize the scheduler.
+
+        Args:
+            period: the target period in milliseconds
+        """
+        self.period = period
+        self.iterations = 0
+        self.overruns = 0
+        self.jitter_max_ms = 0
+        self.histogram = array.array("H", [0] * Scheduler.BUCKETS)
+        self._stage_total_us = array.array("I", [0] * len(Scheduler.STAGES))
+        self._stage_max_us = array.array("I", [0] * len(Scheduler.STAGES))
+        self.last_us = array.array("I", [0] * len(Scheduler.STAGES))
+        self.commands = 0
+        self.latencies = array.array("I", [0] * Scheduler.LATENCIES)
+        self.latency_last_us = 0
+        self.latency_max_us = 0
+        self.latency_total_us = 0
+        self._deadline = time.ticks_ms()
+        self._start = self._mark = time.ticks_us()
+        self._added = 0  # time added to stages since the last mark
+
+    def start(self) -> None:
+        """Marks the beginning of an iteration."""
+        late = time.ticks_diff(time.ticks_ms(), self._deadline)
+        if late > self.jitter_max_ms:
+            self.jitter_max_ms = late
+        self._start = self._mark = time.ticks_us()
+        self._added = 0
+
+    def add(self, stage: int, duration: int) -> None:
+        """Records the duration of a stage measured elsewhere.
+
+        It is deducted from the next mark().
+
+        Args:
+            stage: one of CAPTURE, DETECT, DECIDE or ACTUATE
+            duration: in microseconds
+        """
+        self._stage_total_us[stage] += duration
+        self.last_us[stage] = duration
+        if duration > self._stage_max_us[stage]:
+            self._stage_max_us[stage] = duration
+        self._added += duration
+
+    def mark(self, stage: int) -> None:
+        """Records the end of a stage, started at the previous mark.
+
+        Args:
+            stage: one of CAPTURE, DETECT, DECIDE or ACTUATE
+        """
+        now = time.ticks_us()
+        duration = time.ticks_diff(now, self._mark) - self._added
+        self._mark = now
+        self._added = 0
+        self.add(stage, duration if duration > 0 else 0)
+        self._added = 0  # add() counted this duration too
+
+    def command(self, captured: int) -> None:
+        """Records the latency of a frame, once its motor command is sent.
+
+        Args:
+            captured: ticks_us() when the frame was in hand
+        """
+        latency = time.ticks_diff(time.ticks_us(), captured)
+        self.latencies[self.commands % Scheduler.LATENCIES] = latency
+        self.commands += 1
+        self.latency_last_us = latency
+        self.latency_total_us += latency
+        if latency > self.latency_max_us:
+            self.latency_max_us = latency
+
+    async def wait(self) -> int:
+        """Ends the iteration, sleeps until the next deadline.
+
+        A late iteration doesn't try to catch up: the next period starts now.
+
+        Returns:
+            the time slept (ms)
+        """
+        busy = time.ticks_diff(time.ticks_us(), self._start) // 1000
+        bucket = busy // Scheduler.BUCKET_MS
+        self.histogram[bucket if bucket < Scheduler.BUCKETS else -1] += 1
+        self.iterations += 1
+        now = time.ticks_ms()
+        self._deadline = time.ticks_add(self._deadline, self.period)
+        wait = time.ticks_diff(self._deadline, now)
+        if busy > self.period or wait < 0:
+            self.overruns += 1
+            self._deadline = time.ticks_add(now, self.period)
+            wait = 0
+        # Always yields, background tasks (I2C writes, timers) need to run
+        await asyncio.sleep_ms(wait)
+        return wait
+
+    def stage_mean_us(self, stage: int) -> int:
+        return self._stage_total_us[stage] // self.iterations if self.iterations else 0
+
+    def latency_mean_us(self) -> int:
+        return self.latency_total_us // self.commands if self.commands else 0
+
+    def dump(self, level: str = "INFO") -> None:
+        """Logs the stages times and the histogram of the iterations."""
+        logger.log(
+            level,
+            "{} iterations of {} ms, {} overruns, jitter max {} ms",
+            self.iterations,
+            self.period,
+            self.overruns,
+            self.jitter_max_ms,
+        )
+        for stage, name in enumerate(Scheduler.STAGES):
+            logger.log(
+                level,
+                "{:>8}: mean {} us, max {} us",
+                name,
+                self.stage_mean_us(stage),
+                self._stage_max_us[stage],
+            )
+        logger.log(
+            level,
+            "capture to command: mean {} us, max {} us",
+            self.latency_mean_us(),
+            self.latency_max_us,
+        )
+        for bucket, count in enumerate(self.histogram):
+            if count:
+                low = bucket * Scheduler.BUCKET_MS
+                high = (
+                    "+"
+                    if bucket == Scheduler.BUCKETS - 1
+                    else "-{}".format(low + Scheduler.BUCKET_MS)
+                )
+                logger.log(level, "{:>3}{:<4} ms: {}", low, high, count)
@@ -1,27 +1,134 @@
-import ustruct as struct
+import array
+
+import ujson as json
+import uasyncio as asyncio
+import utime as time
 import sensor
 import pyb
 
+from bus import I2CBus
+from detection import Detector
+from utils import Ring
+from tracing import tracer
 import ulogging as logging
 
 logger = logging.Logger(__name__)
 
+SNAPSHOT = tracer.span("snapshot")
+FIND_BLOBS = tracer.span("find_blobs")
+SENSOR_RECV = tracer.span("sensor_recv")
+
+
+def _crc_table(poly: int) -> bytearray:
+    table = bytearray(256)
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table[byte] = crc
+    return table
+
+
+CRC8 = _crc_table(0x07)
+
+
+def crc8(buffer, end: int) -> int:
+    """Returns the CRC-8 (polynomial 0x07) of buffer[:end], without allocating."""
+    crc = 0
+    for i in range(end):
+        crc = CRC8[crc ^ buffer[i]]
+    return crc
+
 
 class Sensor:
     """A class that represent the Arduino-controlled sensors
 
     Offers an interface for ultrasonics sensors and line sensors (IR).
+    Once started, a task polls the Arduino at a given rate and keeps the
+    last samples in a ring, so that the latest values can be read without
+    waiting for the I2C bus.
+
+    The Arduino measures the distances in its loop and answers the last
+    ones. With the protocol v2 (arduino/sensor.ino), the camera writes a
+    mask of the fields to read as the register of the request, and the
+    answer is: VERSION, the mask, a sequence number of the measures of the
+    distances (uint16), their age (uint16, ms), the fields of the mask
+    (uint16 each, in the order of their bits) and a CRC-8 of all that.
+    Answers with a wrong CRC, version or mask are rejected. A sample whose
+    distances weren't measured again since the previous one is a duplicate,
+    they are stale if they are older than STALE_MS: both are counted, the
+    line sensors of the sample are read on request and still fresh.
+
+    An Arduino running the protocol v1 answers the six fields right away,
+    without header nor CRC: it is detected by the first answer, then read
+    like before.
+
+    Args:
+        history: number of samples kept
+
+    Attributes:
+        samples: a Ring of (front_dist, back_dist, 4 line sensors) samples
+        version: of the protocol of the Arduino, 0 until its first answer
+        seq: sequence number of the distances of the last sample (v2)
+        age_ms: age of the distances of the last sample, when read (v2)
+        errors: number of failed requests
+        invalid: number of answers rejected (CRC, version or mask)
+        duplicates: number of samples with the distances of the previous one
+        stale: number of samples with distances older than STALE_MS
+        recorder: if set, a Recorder given every answer of the Arduino
     """
 
     PIN = 2
     SLAVE_ADDRESS = 0x10
+    FIELDS = 6  # front and back distances, then the four line sensors
+    RATE = 50  # default polling rate in Hz
+    VERSION = 0x82  # first byte of a v2 answer, never a v1 one (distance < 512)
+    HEADER = 6  # version, mask, seq, age
+    FRONT, BACK, LINES, ALL = 0x01, 0x02, 0x3C, 0x3F  # bits of the fields
+    STALE_MS = 200  # both distances are measured about every 60 ms
 
-    def __init__(self):
-        self.__i2c = pyb.I2C(self.PIN)
-        self.__i2c.init(pyb.I2C.MASTER)
+    def __init__(self, history: int = 32):
+        self.__bus = I2CBus(self.PIN)
+        # Filled in-place by each request, the fields are in the same order
+        # (big-endian uint16) in a v1 answer and after the header of a v2 one
+        self._buffer = bytearray(Sensor.size(Sensor.ALL))
+        view = memoryview(self._buffer)
+        self._v1 = view[: 2 * Sensor.FIELDS]
+        self._fields = view[Sensor.HEADER : Sensor.HEADER + 2 * Sensor.FIELDS]
+        self.samples = Ring(history, Sensor.FIELDS)
+        self.version = 0
+        self.seq = -1
+        self.age_ms = 0
+        self.errors = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.stale = 0
+        self.recorder = None
+        self._poller = None
 
     def __repr__(self) -> str:
-        return "Sensor(pin={}, address={})".format(self.PIN, self.SLAVE_ADDRESS)
+        return "Sensor(pin={}, address={}, version={})".format(
+            self.PIN, self.SLAVE_ADDRESS, self.version
+        )
+
+    @staticmethod
+    def size(mask: int) -> int:
+        """Returns the size of a v2 answer to a mask of fields."""
+        size = Sensor.HEADER + 1
+        while mask:
+            size += 2 * (mask & 1)
+            mask >>= 1
+        return size
+
+    @staticmethod
+    def valid(buffer, mask: int) -> bool:
+        """True if buffer is a v2 answer to the mask, with the right CRC."""
+        end = len(buffer) - 1
+        return (
+            buffer[0] == Sensor.VERSION
+            and buffer[1] == mask
+            and crc8(buffer, end) == buffer[end]
+        )
 
     def recv(self) -> tuple:
         """Requests the Arduino controller via I2C and unpack data received
@@ -30,14 +137,137 @@ class Sensor:
         Returns:
             (front_dist, back_dist, line_sensors):
             The front and back distance and a list of four line sensors values.
+
+        Raises:
+            OSError: if the Arduino didn't answer, or its answer was rejected
+        """
+        if not self.poll():
+            raise OSError("No valid answer from the Arduino")
+        samples = self.samples
+        return samples.get(0), samples.get(1), [samples.get(2 + i) for i in range(4)]
+
+    def poll(self) -> bool:
+        """Requests the Arduino and pushes the sample in the ring.
+
+        Values are decoded by hand rather than unpacked in a tuple,
+        so that polling doesn't allocate.
+
+        Returns:
+            False if the request failed, or the answer was rejected.
+        """
+        buffer = self._buffer
+        start = tracer.begin()
+        try:
+            if self.version == 1:
+                self.__bus.recv(self._v1, Sensor.SLAVE_ADDRESS)
+            else:
+                self.__bus.read_register(buffer, Sensor.SLAVE_ADDRESS, Sensor.ALL)
+        except OSError:
+            self.errors += 1
+            return False
+        tracer.end(SENSOR_RECV, start)
+        if self.version == 1:
+            if buffer[0] == Sensor.VERSION:  # the Arduino was updated
+                self.version = 0
+                self.invalid += 1
+                return False
+            fields = self._v1
+        elif Sensor.valid(buffer, Sensor.ALL):
+            self.version = 2
+            fields = self._fields
+            seq = buffer[2] << 8 | buffer[3]
+            if seq == self.seq:
+                self.duplicates += 1
+            self.seq = seq
+            self.age_ms = buffer[4] << 8 | buffer[5]
+            if self.age_ms > Sensor.STALE_MS:
+                self.stale += 1
+        elif not self.version:  # a v1 Arduino, its fields come first
+            self.version = 1
+            logger.info("The Arduino answers the protocol v1")
+            fields = self._v1
+        else:
+            self.invalid += 1
+            return False
+        if self.recorder:
+            self.recorder.sensors(fields)
+        values, start = self.samples.values, self.samples.start()
+        for i in range(Sensor.FIELDS):
+            values[start + i] = (fields[2 * i] << 8) | fields[2 * i + 1]
+        self.samples.commit(time.ticks_ms())
+        return True
+
+    async def probe(self, timeout: int) -> bool:
+        """Waits for the Arduino to answer, then reads a first sample.
+
+        The version of its protocol is detected by this sample.
+
+        Args:
+            timeout: in milliseconds, the Arduino may still be booting
+
+        Returns:
+            False if it didn't answer in time, or the first request failed
+        """
+        if not await self.__bus.probe(Sensor.SLAVE_ADDRESS, timeout):
+            return False
+        return self.poll()
+
+    def start(self, rate: int = RATE) -> None:
+        """Starts polling the sensors in background.
+
+        Args:
+            rate: number of requests per second
         """
-        # creates a buffer of 12 bytes (6 * typeof(int))
-        buffer = bytearray(12)
-        # receive data from sensor buffer will be filled in-place
-        self.__i2c.recv(buffer, Sensor.SLAVE_ADDRESS)
-        # https://docs.python.org/3/library/struct.html
-        front_dist, back_dist, *line_sensors = struct.unpack(">6H", buffer)
-        return front_dist, back_dist, line_sensors
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll_loop(1000 // rate))
+
+    def stop(self) -> None:
+        """Stops polling the sensors."""
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    async def _poll_loop(self, period: int) -> None:
+        deadline = time.ticks_ms()
+        while True:
+            self.poll()
+            deadline = time.ticks_add(deadline, period)
+            wait = time.ticks_diff(deadline, time.ticks_ms())
+            if wait < 0:  # late: don't try to catch up
+                deadline, wait = time.ticks_ms(), 0
+            await asyncio.sleep_ms(wait)
+
+    @property
+    def ready(self) -> bool:
+        """True once a sample has been received."""
+        return self.samples.count > 0
+
+    @property
+    def front_dist(self) -> int:
+        """The latest front distance (cm)."""
+        return self.samples.get(0)
+
+    @property
+    def back_dist(self) -> int:
+        """The latest back distance (cm)."""
+        return self.samples.get(1)
+
+    def line(self, index: int, age: int = 0) -> int:
+        """Returns the value of a line sensor.
+
+        Args:
+            index: 0: front left, 1: front right, 2: rear left, 3: rear right
+            age: 0 for the latest sample, 1 for the previous one...
+        """
+        return self.samples.get(2 + index, age)
+
+    def age(self) -> int:
+        """Returns the age (ms) of the latest sample."""
+        return time.ticks_diff(time.ticks_ms(), self.samples.stamp())
+
+    def distances_age(self) -> int:
+        """Returns the age (ms) of the latest distances, measured by the Arduino."""
+        return self.age_ms + self.age()
 
 
 class Camera:
@@ -46,9 +276,56 @@ class Camera:
     More infos:
     https://openmv.io/products/openmv-cam-h7
 
+    Once the ball has been found, the next searches are done in a region of
+    interest (ROI) around its predicted position, sized from the last blob
+    and its velocity. The whole frame is searched again after MAX_MISSES
+    frames without the ball in the ROI.
+
+    The search is coarse to fine: in the ROI, find_blobs skips pixels
+    according to the expected ball size, then the candidate is searched
+    again pixel by pixel in its own rectangle.
+    The frame size adapts too: QQVGA is used while the frame time is over
+    FRAME_BUDGET_US and the ball is close, QVGA when it is far or lost.
+
+    The goals and the obstacles due in a frame are searched by one coarse
+    find_blobs call after the ball's (see detection.Detector): they are
+    sorted by the code bit of the threshold each blob matches.
+
+    The color thresholds and the blob filters are loaded from CONFIG if
+    the file exists, it is written by host/calibrate.py from labeled frames.
+
+    The sensor starts with its auto gain and white balance on, warm_up()
+    freezes them once they have settled: it must be awaited before the
+    colors can be tracked.
+
+    Angles and distances are read in tables computed once per frame size,
+    in fixed-point integers so that a lookup doesn't allocate. The lens
+    correction (DISTORTION) and calibration (DISTANCE_SCALE) are applied
+    when the tables are built, they cost nothing per frame.
+
     Attributes:
-        width: the screen width in pixels
-        height: the screen height in pixels
+        width: the width in pixels of the last frame
+        height: the height in pixels of the last frame
+        thresholds: LAB thresholds of the ball's color
+        pixels_threshold, area_threshold: minimal number of pixels and
+            bounding box area of the ball, in a QVGA frame
+        roundness: minimal roundness of the ball's blob
+        tracking: if False, the whole frame is searched each time
+        adaptive: if False, the frame size doesn't change
+        settled: True once the gain and the white balance are frozen
+        hits, misses, fallbacks: number of searches in the ROI that found
+            the ball, that didn't, and of full-frame searches after a loss
+        switches: number of frame size changes
+        detect_us, detect_us_max: time (us) spent searching the ball in
+            the last frame, and the longest one
+        frame_us: time (us) of the last frame (snapshot and search)
+        captured_us, captured_ms: ticks_us() and ticks_ms() when the last
+            snapshot was in hand
+        image: the last snapshot
+        frames: number of snapshots taken
+        detector: searches the goals and the obstacles
+        detections: what was found in the last frame, by class (ball
+            included), see detection.Detections
     """
 
     # List of thresholds (can be obtained in Open MV) that match the element color
@@ -58,6 +335,21 @@ class Camera:
     HFOV = 70.8  # horizontal field of view in degrees
     VFOV = 55.6
     REAL_SIZE = 7  # in millimeters
+    MAX_MISSES = 3  # searches in the ROI before searching the whole frame
+    ROI_MARGIN = 8  # in pixels, added around the predicted blob
+    PIXELS_THRESHOLD = 50  # minimal blob size in a QVGA frame
+    AREA_THRESHOLD = 50  # minimal bounding box area in a QVGA frame
+    ROUNDNESS = 0.3  # minimal roundness of the ball
+    CONFIG = "camera.json"  # calibration, see host/calibrate.py
+    # Frame sizes, from the fastest to the finest, and their widths
+    FRAME_SIZES = ((sensor.QQVGA, 160), (sensor.QVGA, 320))
+    FRAME_BUDGET_US = 20000  # snapshot and search
+    NEAR_BALL = 40  # ball height (QVGA pixels) above which QQVGA is enough
+    FAR_BALL = 20  # ball height (QVGA pixels) under which QVGA is needed
+    ADAPT_FRAMES = 5  # consecutive frames needed to change the frame size
+    DISTORTION = 0.0  # radial distortion coefficient (k1) of the lens
+    DISTANCE_SCALE = 1.0  # calibration factor of the measured distances
+    SETTLE_MS = 500  # after the reset, for the auto gain and white balance
 
     def __init__(self):
         """Initialize the LED to show state and setup the camera sensor"""
@@ -70,12 +362,105 @@ class Camera:
         sensor.set_hmirror(True)  # Reverse image on horizontal axis
         sensor.set_pixformat(sensor.RGB565)
         sensor.set_framesize(sensor.QVGA)
-        sensor.set_auto_gain(False)  # Must be turned off for color tracking
-        # Must be turned off for color tracking
-        sensor.set_auto_whitebal(False)
+        # Auto gain and white balance converge until warm_up() freezes them
+        self._settle_at = time.ticks_add(time.ticks_ms(), Camera.SETTLE_MS)
+        self.settled = False
+        self._debug = pyb.USB_VCP().debug_mode_enabled()
+        self.width, self.height = sensor.width(), sensor.height()
+        self.thresholds = Camera.THRESHOLDS
+        self.pixels_threshold = Camera.PIXELS_THRESHOLD
+        self.area_threshold = Camera.AREA_THRESHOLD
+        self.roundness = Camera.ROUNDNESS
+        self.detector = Detector()
+        self.detections = self.detector.detections
+        self.load_config(Camera.CONFIG)
+        self.tracking = True
+        self.adaptive = True
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.switches = 0
+        self.detect_us = 0
+        self.detect_us_max = 0
+        self.frame_us = 0
+        self.captured_us = self.captured_ms = 0
+        self.image = None
+        self.frames = 0
+        self._level = len(Camera.FRAME_SIZES) - 1  # index in FRAME_SIZES
+        self._votes = 0  # > 0 for a finer frame size, < 0 for a faster one
+        self._scale_filters(Camera.FRAME_SIZES[self._level][1])
+        # Last ball seen: center, size and velocity (pixels per frame)
+        self._track = False
+        self._cx = self._cy = self._w = self._h = 0
+        self._vx = self._vy = 0
+        self._lost = 0  # consecutive misses in the ROI
+        self._roi = [0, 0, 0, 0]  # x, y, w, h (reused by each search)
+        self._rect = [0, 0, 0, 0]  # refinement area of a candidate
+        # Lookup tables by frame width: (angles, distances)
+        self._tables = {}
+        for _, width in Camera.FRAME_SIZES:
+            self._tables[width] = self._build_tables(width, width * 3 // 4)
+        self._use_tables(self.width, self.height)
 
-    @staticmethod
-    def distance_to(blob) -> float:
+    def load_config(self, path: str) -> bool:
+        """Loads the thresholds and the blob filters from a JSON file.
+
+        Keys: thresholds (a list of LAB tuples), pixels_threshold,
+        area_threshold and roundness, missing ones keep their value. The
+        other classes have their own keys, see Detector.configure().
+
+        Returns:
+            False if the file doesn't exist or can't be read
+        """
+        try:
+            with open(path) as file:
+                config = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if "thresholds" in config:
+            self.thresholds = [tuple(threshold) for threshold in config["thresholds"]]
+        self.pixels_threshold = config.get("pixels_threshold", self.pixels_threshold)
+        self.area_threshold = config.get("area_threshold", self.area_threshold)
+        self.roundness = config.get("roundness", self.roundness)
+        self.detector.configure(config)
+        logger.info("Camera config loaded from {}", path)
+        return True
+
+    def _scale_filters(self, width: int) -> None:
+        """Scales the QVGA blob filters to a frame width."""
+        self._pixels_threshold = self.pixels_threshold * width * width // (320 * 320)
+        self._area_threshold = self.area_threshold * width * width // (320 * 320)
+        self.detector.scale(width)
+
+    def _build_tables(self, width: int, height: int) -> tuple:
+        """Computes the angle of each column and the distance of each height.
+
+        Returns:
+            (angles, distances): angles in hundredths of degree by pixel column,
+            distances in millimeters by blob height in pixels
+        """
+        angles = array.array("h", [0] * width)
+        for x in range(width):
+            # Column position in [-1, 1], corrected for the radial distortion
+            position = (2 * x - width) / width
+            position *= 1 + Camera.DISTORTION * position * position
+            angles[x] = round(100 * Camera.HFOV / 2 * position)
+        distances = array.array("H", [0xFFFF] * (height + 1))
+        for h in range(1, height + 1):
+            obj_width_on_sensor = (Camera.REAL_SIZE * h / 2) / width
+            distance = (
+                Camera.BALL_DIAMETER * Camera.FOCAL_LENGTH
+            ) / obj_width_on_sensor
+            distances[h] = min(0xFFFF, round(distance * Camera.DISTANCE_SCALE))
+        return angles, distances
+
+    def _use_tables(self, width: int, height: int) -> None:
+        """Selects the tables of a frame size, building them if needed."""
+        if width not in self._tables:
+            self._tables[width] = self._build_tables(width, height)
+        self._angles, self._distances = self._tables[width]
+
+    def distance_to(self, blob) -> int:
         """Calculate real distance between camera and object.
 
         Args:
@@ -84,48 +469,273 @@ class Camera:
         Returns:
             The distance in millimeters.
         """
-        obj_width_on_sensor = (Camera.REAL_SIZE * blob.h() / 2) / sensor.width()
-        distance = (Camera.BALL_DIAMETER * Camera.FOCAL_LENGTH) / obj_width_on_sensor
-        return distance
+        return self._distances[blob.h()]
 
-    @staticmethod
-    def get_angle(blob) -> float:
+    def get_angle(self, blob) -> float:
         """Get horizontal relative angle (in degrees) of the blob.
 
+        The angle is interpolated between the columns of the table around
+        the blob's center (cxf), it keeps its sub-pixel precision.
+
         Args:
             blob: a blob object (you can get one with ball_blob())
 
         Returns:
             The angle between [-35.4, +35.4]
         """
-        rel_angle = Camera.HFOV * (blob.cxf() - sensor.width() / 2) / sensor.width()
-        return rel_angle
+        angles = self._angles
+        x = blob.cxf()
+        i = min(max(0, int(x)), len(angles) - 2)
+        return (angles[i] + (angles[i + 1] - angles[i]) * (x - i)) / 100
+
+    async def warm_up(self, settle: int = None) -> None:
+        """Waits for the sensor to settle, then freezes its gain and white balance.
+
+        Both must be turned off for color tracking, once they have converged
+        on the scene: SETTLE_MS after the reset. The wait doesn't block the
+        other tasks.
+
+        Args:
+            settle: time (ms) to wait from now, instead of what remains of
+                SETTLE_MS since the reset
+        """
+        if self.settled:
+            return
+        if settle is None:
+            wait = time.ticks_diff(self._settle_at, time.ticks_ms())
+        else:
+            wait = settle
+        if wait > 0:
+            await asyncio.sleep_ms(wait)
+        sensor.set_auto_gain(False)  # Must be turned off for color tracking
+        # Must be turned off for color tracking
+        sensor.set_auto_whitebal(False)
+        self.settled = True
+
+    def set_framebuffers(self, count: int) -> None:
+        """Sets the number of frame buffers of the sensor.
+
+        With more than one, the sensor captures the next frames (DMA) while
+        the last one is processed: snapshot() returns the latest complete
+        frame without waiting for its readout, or the next one if it was
+        already returned.
+
+        Args:
+            count: 1 (a frame is read out when it is asked) to 4
+        """
+        sensor.set_framebuffers(count)
+
+    def drop_frame(self) -> bool:
+        """Drops the frame waiting in the framebuffers, if any.
+
+        A loop that was idle gets a frame captured meanwhile, as old as the
+        time since the end of its capture: the next snapshot waits for a
+        new frame instead.
+
+        Returns:
+            True if a frame was dropped
+        """
+        if not sensor.get_frame_available():
+            return False
+        sensor.skip_frames(1)
+        return True
 
     def shutdown(self):
         """Shutdown the camera and the LED"""
         sensor.shutdown()
         self._red_led.off()
 
-    @staticmethod
-    def ball_blob():
+    def ball_blob(self):
         """
         Takes a snapshot and find pixels area matching with thresholds .
+        The goals and obstacles due in this frame are searched after the
+        ball, see detections.
         Returns:
             image.blob | None: returns a blob object if visible.
         Additionnal informations can be found here about the blob object:
             https://docs.openmv.io/library/omv.image.html
         """
+        start = time.ticks_us()
         img = sensor.snapshot()
-        # Only blobs with more 50 pixels and area are returned
+        self.captured_us = time.ticks_us()
+        self.captured_ms = time.ticks_ms()
+        self.image = img
+        self.frames += 1
+        detector = self.detector
+        # The blobs are measured in this frame, even if the frame size changes
+        if img.width() != self.width:
+            self._use_tables(img.width(), img.height())
+        self.width, self.height = img.width(), img.height()
+        detect_start = self.captured_us
+        blob = None
+        if self.tracking and self._track:
+            blob = self._find_ball(img, self._predict_roi(img), self._stride())
+            if blob:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._lost += 1
+                if self._lost >= Camera.MAX_MISSES:
+                    self.fallbacks += 1
+                    self._track = False
+        if not blob and not (self.tracking and self._track):
+            blob = self._find_ball(img, None, 2)
+        mask = detector.due(self.frames)
+        if mask:
+            self._find_objects(img, mask)
+        if blob:
+            self._update_track(blob)
+            self.detections.set(Detector.BALL, blob)
+        now = time.ticks_us()
+        self.detect_us = time.ticks_diff(now, detect_start)
+        if self.detect_us > self.detect_us_max:
+            self.detect_us_max = self.detect_us
+        self.frame_us = time.ticks_diff(now, start)
+        if tracer.enabled:
+            tracer.add(SNAPSHOT, self.frame_us - self.detect_us)
+            tracer.add(FIND_BLOBS, self.detect_us)
+        if self.adaptive:
+            self._adapt(blob)
+        return blob
+
+    def _stride(self) -> int:
+        """Returns the coarse stride in the ROI: a quarter of the ball size."""
+        stride = min(self._w, self._h) // 4
+        return 2 if stride < 2 else 8 if stride > 8 else stride
+
+    def _find_ball(self, img, roi, stride: int):
+        """Returns the first round blob in the roi (the whole image if None).
+
+        Args:
+            stride: pixels skipped between two tested pixels, a candidate
+                found with a stride over 2 is searched again pixel by pixel
+        """
+        blob = self._search(img, roi, stride)
+        if blob and stride > 2:
+            rect = self._rect
+            rect[0], rect[1] = max(0, blob.x() - stride), max(0, blob.y() - stride)
+            rect[2] = min(img.width(), blob.x() + blob.w() + stride) - rect[0]
+            rect[3] = min(img.height(), blob.y() + blob.h() + stride) - rect[1]
+            blob = self._search(img, rect, 1) or blob
+        if blob and self._debug:
+            # If the cam is connected to OpenMV IDE
+            if roi:
+                img.draw_rectangle(roi, color=(0, 0, 255))
+            img.draw_rectangle(blob.rect())
+            img.draw_cross(blob.cx(), blob.cy())
+        return blob
+
+    def _search(self, img, roi, stride: int):
+        # Only blobs with enough pixels and area (scaled to the frame) are returned
         for blob in img.find_blobs(
-            Camera.THRESHOLDS, pixels_threshold=50, area_threshold=50
+            self.thresholds,
+            roi=roi,
+            x_stride=stride,
+            y_stride=(stride + 1) // 2,
+            pixels_threshold=self._pixels_threshold,
+            area_threshold=self._area_threshold,
         ):
-            if blob.roundness() < 0.3:
+            if blob.roundness() < self.roundness:
                 continue
-            if pyb.USB_VCP().debug_mode_enabled():
-                # If the cam is connected to OpenMV IDE
-                img.draw_rectangle(blob.rect())
-                img.draw_cross(blob.cx(), blob.cy())
-
             return blob  # we need only one blob
         return None
+
+    def _find_objects(self, img, mask: int) -> None:
+        """Searches the classes of a mask in one coarse pass (see Detector)."""
+        detector = self.detector
+        thresholds, classes = detector.plan(mask)
+        pixels = detector.min_pixels(mask)
+        stride = detector.stride
+        detector.searched(mask)
+        for blob in img.find_blobs(
+            thresholds,
+            roi=detector.roi(mask, img.width(), img.height()),
+            x_stride=stride,
+            y_stride=(stride + 1) // 2,
+            pixels_threshold=pixels,
+            area_threshold=pixels,
+        ):
+            detector.add(classes[Camera._code_index(blob.code())], blob)
+
+    @staticmethod
+    def _code_index(code: int) -> int:
+        """Returns the index of the lowest threshold a blob matches."""
+        index = 0
+        while code > 1 and not code & 1:
+            code >>= 1
+            index += 1
+        return index
+
+    def _predict_roi(self, img) -> list:
+        """Sets the ROI around the position where the ball is expected.
+
+        The ROI is centered on the last position moved by the velocity,
+        twice as large as the last blob plus the distance the ball travels
+        in a frame, and it grows with each consecutive miss.
+        """
+        grow = self._lost + 1
+        half_w = self._w + (abs(self._vx) + Camera.ROI_MARGIN) * grow
+        half_h = self._h + (abs(self._vy) + Camera.ROI_MARGIN) * grow
+        x0 = min(max(0, self._cx + self._vx * grow - half_w), img.width() - 1)
+        y0 = min(max(0, self._cy + self._vy * grow - half_h), img.height() - 1)
+        roi = self._roi
+        roi[0], roi[1] = x0, y0
+        roi[2] = min(img.width(), x0 + 2 * half_w) - x0
+        roi[3] = min(img.height(), y0 + 2 * half_h) - y0
+        return roi
+
+    def _update_track(self, blob) -> None:
+        """Updates the last position and velocity with a new blob."""
+        cx, cy = blob.cx(), blob.cy()
+        if self._track:
+            # Averages the velocity to smooth the detection noise, rounded
+            # toward zero: a floor would keep a leftward velocity at -1
+            self._vx = int((self._vx + cx - self._cx) / 2)
+            self._vy = int((self._vy + cy - self._cy) / 2)
+        else:
+            self._vx = self._vy = 0
+        self._cx, self._cy = cx, cy
+        self._w, self._h = blob.w(), blob.h()
+        self._lost = 0
+        self._track = True
+
+    def _adapt(self, blob) -> None:
+        """Votes for a frame size, and switches after ADAPT_FRAMES votes.
+
+        A close ball is large enough in a QQVGA frame, so it is used when the
+        frame is too slow. A far or lost ball needs the pixels of QVGA.
+        """
+        # Ball height converted in QVGA pixels
+        height = blob.h() * 320 // self.width if blob else 0
+        if height < Camera.FAR_BALL:
+            vote = 1
+        elif height > Camera.NEAR_BALL and self.frame_us > Camera.FRAME_BUDGET_US:
+            vote = -1
+        else:
+            vote = 0
+        if vote == 0 or (vote > 0) != (self._votes > 0):
+            self._votes = vote
+        else:
+            self._votes += vote
+        if self._votes >= Camera.ADAPT_FRAMES:
+            self._set_level(self._level + 1)
+        elif self._votes <= -Camera.ADAPT_FRAMES:
+            self._set_level(self._level - 1)
+
+    def _set_level(self, level: int) -> None:
+        """Changes the frame size, and scales the track to the new frame."""
+        self._votes = 0
+        if not 0 <= level < len(Camera.FRAME_SIZES):
+            return
+        framesize, width = Camera.FRAME_SIZES[level]
+        old_width = Camera.FRAME_SIZES[self._level][1]
+        self._level = level
+        self.switches += 1
+        sensor.set_framesize(framesize)
+        self._scale_filters(width)
+        self._cx = self._cx * width // old_width
+        self._cy = self._cy * width // old_width
+        self._w = self._w * width // old_width
+        self._h = self._h * width // old_width
+        self._vx = self._vx * width // old_width
+        self._vy = self._vy * width // old_width
@@ -0,0 +1,80 @@
+import utime as time
+
+
+class BootTimer:
+    """A class that times the phases of the startup, until the first decision.
+
+    It is created first thing in boot.py, so that the imports are timed too.
+    Sequential phases are marked as they end, from the end of the previous
+    one. Phases that run together (the camera settling while the I2C devices
+    are probed) are recorded as spans, with their own start.
+
+    Jobs that aren't needed before the first frame can be deferred: they
+    are run while the camera settles (see Robot.bring_up).
+
+    Conventionnal usage:
+    boot = BootTimer()
+    import robot
+    boot.mark("imports")
+    ...
+    boot.finish(logger)  # logs the report
+
+    Attributes:
+        start: ticks_us() at the creation of the timer
+        phases: (name, start, end) of each phase, in microseconds since start
+        finished: True once the report has been logged
+    """
+
+    def __init__(self):
+        self.start = time.ticks_us()
+        self.phases = []
+        self.finished = False
+        self._last = 0  # end of the last sequential phase
+        self._deferred = []
+
+    def elapsed_us(self) -> int:
+        """Returns the time (us) since the creation of the timer."""
+        return time.ticks_diff(time.ticks_us(), self.start)
+
+    def mark(self, name: str) -> None:
+        """Ends a sequential phase, started at the end of the previous one."""
+        now = self.elapsed_us()
+        self.phases.append((name, self._last, now))
+        self._last = now
+
+    def span(self, name: str, start: int) -> None:
+        """Records a phase that ends now, started at start (a ticks_us() value).
+
+        The sequential phases are not affected.
+        """
+        self.phases.append(
+            (name, time.ticks_diff(start, self.start), self.elapsed_us())
+        )
+
+    def defer(self, job) -> None:
+        """Adds a function to call later, with no argument."""
+        self._deferred.append(job)
+
+    def run_deferred(self) -> None:
+        """Calls the deferred functions, once."""
+        jobs, self._deferred = self._deferred, []
+        for job in jobs:
+            job()
+
+    def finish(self, logger) -> None:
+        """Runs what is still deferred, then logs the report."""
+        self.run_deferred()
+        self.finished = True
+        self.report(logger)
+
+    def report(self, logger) -> None:
+        """Logs the duration, start and end (ms) of each phase."""
+        logger.info("Boot: first decision after {} ms", self._last // 1000)
+        for name, start, end in self.phases:
+            logger.info(
+                "Boot: {} {} ms ({} -> {} ms)",
+                name,
+                (end - start) // 1000,
+                start // 1000,
+                end // 1000,
+            )
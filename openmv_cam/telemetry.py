@@ -0,0 +1,154 @@
+import ustruct as struct
+import utime as time
+
+from motors import Motor
+
+
+class TelemetryStream:
+    """A class that streams per frame telemetry over the USB VCP.
+
+    Each iteration of the main loop is packed into a fixed-size binary frame
+    (FORMAT): the times of its stages, the ball's blob, angle and distance,
+    the speeds of the motors and the values of the sensors. Frames start
+    with SYNC and end with the LRC of their fields and END, so that a reader
+    can resynchronize on any byte. Decode them with host/viewer.py.
+
+    Frames are packed into a preallocated ring of SLOTS and written without
+    blocking: USB_VCP.write() only takes what fits in its buffer. When the
+    host doesn't read fast enough, the ring fills up and the oldest frame
+    is dropped, the control loop is never stalled. The header of each
+    frame has the number of frames dropped so far (modulo 256). A frame
+    dropped while it was partly written is cut, the reader skips it.
+
+    Conventionnal usage:
+    stream = TelemetryStream(pyb.USB_VCP())
+    stream.record(robot, scheduler, blob)  # once per iteration
+
+    Args:
+        vcp: the USB_VCP to write to
+
+    Attributes:
+        sent: number of frames fully written
+        dropped: number of frames dropped (ring full)
+    """
+
+    SYNC = (0xA5, 0x5A)
+    END = 0x55
+    # seq, ticks_ms, flags, dropped, stages (us), blob x y w h, angle (1/100
+    # degree), distance (mm), speeds (1/10 RPM), front and back, 4 lines
+    FORMAT = "<HIBB4H4HhH2h6H"
+    FIELDS = 2  # offset of the fields in a frame
+    SIZE = 48
+    SLOTS = 8
+    BALL, PREEMPTED, MOVING = 1, 2, 4  # flags
+    NONE = 0xFFFF  # blob of a frame without ball, sensors before a sample
+    _NO_SAMPLE = (NONE,) * 6
+
+    def __init__(self, vcp):
+        self.vcp = vcp
+        self.sent = 0
+        self.dropped = 0
+        self._ring = bytearray(TelemetryStream.SIZE * TelemetryStream.SLOTS)
+        view = memoryview(self._ring)
+        self._frames = []
+        for i in range(TelemetryStream.SLOTS):
+            start = i * TelemetryStream.SIZE
+            frame = view[start : start + TelemetryStream.SIZE]
+            frame[0], frame[1] = TelemetryStream.SYNC
+            frame[-1] = TelemetryStream.END
+            self._frames.append(frame)
+        self._fields = [frame[TelemetryStream.FIELDS : -2] for frame in self._frames]
+        self._head = 0  # next slot to pack
+        self._count = 0  # frames waiting to be written
+        self._offset = 0  # bytes of the oldest frame already written
+        self._seq = 0
+
+    def record(self, robot, scheduler, blob) -> None:
+        """Packs the frame of an iteration, then writes what the VCP takes.
+
+        Args:
+            robot: the Robot, for its camera, sensors and motors
+            scheduler: the Scheduler of the main loop (times of the stages)
+            blob: the ball's blob of the iteration, or None
+        """
+        if self._count == TelemetryStream.SLOTS:  # drops the oldest
+            self._count -= 1
+            self._offset = 0
+            self.dropped += 1
+        slot = self._head
+        self._head = (slot + 1) % TelemetryStream.SLOTS
+        self._count += 1
+        flags = 0
+        x = y = w = h = TelemetryStream.NONE
+        angle = distance = 0
+        camera = robot.camera
+        if blob:
+            flags |= TelemetryStream.BALL
+            x, y, w, h = blob.x(), blob.y(), blob.w(), blob.h()
+            angle = int(camera.get_angle(blob) * 100)
+            distance = camera.distance_to(blob)
+        if robot.preempted:
+            flags |= TelemetryStream.PREEMPTED
+        if robot.moving:
+            flags |= TelemetryStream.MOVING
+        stages = scheduler.last_us
+        # The latest sample of the sensors, NONE before the first one
+        samples = robot.sensor.samples
+        values, i = TelemetryStream._NO_SAMPLE, 0
+        if samples.count:
+            values, i = samples.values, samples.start() - samples.width
+            if i < 0:
+                i += samples.size * samples.width
+        struct.pack_into(
+            TelemetryStream.FORMAT,
+            self._frames[slot],
+            TelemetryStream.FIELDS,
+            self._seq,
+            time.ticks_ms(),
+            flags,
+            self.dropped & 0xFF,
+            stages[0] if stages[0] < 0xFFFF else 0xFFFF,
+            stages[1] if stages[1] < 0xFFFF else 0xFFFF,
+            stages[2] if stages[2] < 0xFFFF else 0xFFFF,
+            stages[3] if stages[3] < 0xFFFF else 0xFFFF,
+            x,
+            y,
+            w,
+            h,
+            angle,
+            distance,
+            self._speed(robot.lmotor.speed),
+            self._speed(robot.rmotor.speed),
+            values[i],
+            values[i + 1],
+            values[i + 2],
+            values[i + 3],
+            values[i + 4],
+            values[i + 5],
+        )
+        self._frames[slot][-2] = Motor._lrc_calc(self._fields[slot])
+        self._seq = (self._seq + 1) & 0xFFFF
+        self.flush()
+
+    def flush(self) -> None:
+        """Writes the waiting frames, as long as the VCP takes them."""
+        while self._count:
+            slot = (self._head - self._count) % TelemetryStream.SLOTS
+            frame = self._frames[slot]
+            if self._offset:
+                frame = frame[self._offset :]
+            written = self.vcp.write(frame)
+            if not written:  # the buffer of the VCP is full
+                return
+            self._offset += written
+            if self._offset < TelemetryStream.SIZE:
+                return
+            self._offset = 0
+            self._count -= 1
+            self.sent += 1
+
+    @staticmethod
+    def _speed(speed: float) -> int:
+        """Returns a speed (RPM) in tenths of RPM, for an int16."""
+        tenths = int(speed * 10)
+        return -0x8000 if tenths < -0x8000 else (tenths if tenths < 0x7FFF else 0x7FFF)
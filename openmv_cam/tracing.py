@@ -0,0 +1,144 @@
+import array
+
+import utime as time
+
+import ulogging as logging
+
+logger = logging.Logger(__name__)
+
+# The global switch: probes cost one attribute test when it is False.
+# Set it (or tracer.enabled) before the robot starts.
+ENABLED = False
+
+
+class Tracer:
+    """A class that collects the time spent in spans of code, and counters.
+
+    Spans and counters are declared once, by name, and then referred to by
+    their id. Each span keeps its number of calls, its total and maximum
+    durations, and a histogram whose buckets double in width: bucket 0 is
+    under 64 us, bucket i covers [32 << i, 64 << i[ us, and the last one
+    everything above. Everything is stored in preallocated arrays, tracing
+    doesn't allocate memory.
+
+    Conventionnal usage:
+    SNAPSHOT = tracer.span("snapshot")  # at import time
+    start = tracer.begin()
+    ...
+    tracer.end(SNAPSHOT, start)
+
+    Attributes:
+        enabled: if False, begin(), end(), add() and count() do nothing
+    """
+
+    CAPACITY = 16  # spans, and counters
+    BUCKETS = 12
+    BUCKET_MIN_US = 64  # upper bound of the first bucket
+
+    def __init__(self):
+        self.enabled = ENABLED
+        self.spans = []
+        self.counters = []
+        self._calls = array.array("I", (0 for _ in range(Tracer.CAPACITY)))
+        self._total_us = array.array("I", (0 for _ in range(Tracer.CAPACITY)))
+        self._max_us = array.array("I", (0 for _ in range(Tracer.CAPACITY)))
+        self._histogram = array.array(
+            "H", (0 for _ in range(Tracer.CAPACITY * Tracer.BUCKETS))
+        )
+        self._counts = array.array("I", (0 for _ in range(Tracer.CAPACITY)))
+
+    def span(self, name: str) -> int:
+        """Returns the id of a span, declaring it if it's new."""
+        return self._declare(self.spans, name)
+
+    def counter(self, name: str) -> int:
+        """Returns the id of a counter, declaring it if it's new."""
+        return self._declare(self.counters, name)
+
+    @staticmethod
+    def _declare(names: list, name: str) -> int:
+        if name in names:
+            return names.index(name)
+        if len(names) >= Tracer.CAPACITY:
+            raise ValueError("Too many spans or counters: {}".format(name))
+        names.append(name)
+        return len(names) - 1
+
+    def begin(self) -> int:
+        """Returns the start time of a span, to give to end()."""
+        return time.ticks_us() if self.enabled else 0
+
+    def end(self, span: int, start: int) -> None:
+        """Records a span that started at start (returned by begin())."""
+        if self.enabled:
+            self.add(span, time.ticks_diff(time.ticks_us(), start))
+
+    def add(self, span: int, us: int) -> None:
+        """Records a span whose duration was measured elsewhere."""
+        if not self.enabled:
+            return
+        self._calls[span] += 1
+        self._total_us[span] += us
+        if us > self._max_us[span]:
+            self._max_us[span] = us
+        bucket, bound = 0, Tracer.BUCKET_MIN_US
+        while us >= bound and bucket < Tracer.BUCKETS - 1:
+            bucket += 1
+            bound <<= 1
+        index = span * Tracer.BUCKETS + bucket
+        if self._histogram[index] < 0xFFFF:
+            self._histogram[index] += 1
+
+    def count(self, counter: int, n: int = 1) -> None:
+        if self.enabled:
+            self._counts[counter] += n
+
+    def calls(self, span: int) -> int:
+        return self._calls[span]
+
+    def mean_us(self, span: int) -> int:
+        calls = self._calls[span]
+        return self._total_us[span] // calls if calls else 0
+
+    def max_us(self, span: int) -> int:
+        return self._max_us[span]
+
+    def histogram(self, span: int):
+        """Returns the buckets of a span (a memoryview, valid until reset)."""
+        start = span * Tracer.BUCKETS
+        return memoryview(self._histogram)[start : start + Tracer.BUCKETS]
+
+    def value(self, counter: int) -> int:
+        return self._counts[counter]
+
+    def reset(self) -> None:
+        for values in (self._calls, self._total_us, self._max_us, self._counts):
+            for i in range(len(values)):
+                values[i] = 0
+        for i in range(len(self._histogram)):
+            self._histogram[i] = 0
+
+    def dump(self, level: str = "INFO") -> None:
+        """Logs every span and counter, since the start or the last reset.
+
+        The lines are parsed by host/traceagg.py, their format must not change:
+        span <name> calls <n> total_us <us> max_us <us> hist <b0>,<b1>,...
+        counter <name> <value>
+        """
+        for span, name in enumerate(self.spans):
+            if self._calls[span]:
+                logger.log(
+                    level,
+                    "span {} calls {} total_us {} max_us {} hist {}",
+                    name,
+                    self._calls[span],
+                    self._total_us[span],
+                    self._max_us[span],
+                    ",".join(str(count) for count in self.histogram(span)),
+                )
+        for counter, name in enumerate(self.counters):
+            logger.log(level, "counter {} {}", name, self._counts[counter])
+
+
+# The instance shared by all the probes
+tracer = Tracer()
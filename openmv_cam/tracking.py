@@ -0,0 +1,171 @@
+import math
+
+import utime as time
+
+from utils import Ring
+
+
+class BallTracker:
+    """A class that follows the ball and steers the robot to intercept it.
+
+    The ball is located relatively to the robot, x to the right and y
+    forward (mm), from the angle and the distance measured in each frame.
+    An alpha-beta filter smooths the position and estimates the velocity,
+    and predicts the ball for up to MAX_COAST frames when it isn't seen.
+    The robot heads where the ball will be when it gets there: one command
+    per frame blends the turn and the forward speed. The motion of the robot
+    (the last command) is taken out of the ball's, so that its velocity
+    is the one on the ground.
+
+    The last measured positions are kept in history, a track that starts
+    again shortly after a loss gets its velocity from them.
+
+    Attributes:
+        x, y: filtered position of the ball (mm)
+        vx, vy: filtered velocity of the ball on the ground (mm/s)
+        tracking: True while the ball is seen or predicted
+        history: a Ring of the measured (x, y) positions
+    """
+
+    ALPHA = 0.5  # weight of a measure in the position
+    BETA = 0.2  # weight of a measure in the velocity
+    MAX_COAST = 5  # frames predicted without seeing the ball
+    RESET_MS = 500  # a track older than this starts again
+    HISTORY = 8
+    MAX_SPEED = 150  # forward speed (RPM) of the robot when the ball is far
+    MIN_SPEED = 40  # when it is close
+    SLOW_DOWN = 300  # distance (mm) under which the robot slows down
+    TURN_GAIN = 2.0  # turn speed (RPM) by degree of heading
+    MAX_TURN = 100
+    MAX_LEAD_S = 1.5  # the ball is predicted at most this far ahead
+    MAX_DISTANCE = 10000  # mm, farther measures are clamped
+    MM_PER_RPM_S = 80 * math.pi / 60  # robot speed (mm/s) for 1 RPM
+
+    def __init__(self, track: int = 270):
+        """
+        Args:
+            track: distance (mm) between the wheels
+        """
+        self.track = track
+        self.x = self.y = 0.0
+        self.vx = self.vy = 0.0
+        self._forward = 0.0  # speed (mm/s) of the robot, from the last command
+        self._spin = 0.0  # clockwise rotation (rad/s) of the robot
+        self.tracking = False
+        self.history = Ring(BallTracker.HISTORY, 2, "h")
+        self._coasted = 0
+        self._last_ms = 0
+
+    def update(self, angle: float, distance: int, now_ms: int = None) -> None:
+        """Corrects the track with a measure of the ball.
+
+        Args:
+            angle: angle of the ball (degrees, positive to the right)
+            distance: distance of the ball (mm)
+            now_ms: time of the measure (ticks_ms)
+        """
+        now_ms = time.ticks_ms() if now_ms is None else now_ms
+        if distance > BallTracker.MAX_DISTANCE:
+            distance = BallTracker.MAX_DISTANCE
+        rad = math.radians(angle)
+        x, y = distance * math.sin(rad), distance * math.cos(rad)
+        dt = time.ticks_diff(now_ms, self._last_ms) / 1000
+        if not self.tracking or dt <= 0 or dt * 1000 > BallTracker.RESET_MS:
+            self._start(x, y, now_ms)
+        else:
+            # Predicts, then corrects with the residual
+            self._advance(dt)
+            rx, ry = x - self.x, y - self.y
+            self.x += BallTracker.ALPHA * rx
+            self.y += BallTracker.ALPHA * ry
+            self.vx += BallTracker.BETA * rx / dt
+            self.vy += BallTracker.BETA * ry / dt
+        self.tracking = True
+        self._coasted = 0
+        self._last_ms = now_ms
+        history = self.history
+        start = history.start()
+        history.values[start] = int(x)
+        history.values[start + 1] = int(y)
+        history.commit(now_ms)
+
+    def _start(self, x: float, y: float, now_ms: int) -> None:
+        """Starts a track, with the velocity of the last measures if recent."""
+        self.x, self.y = x, y
+        self.vx = self.vy = 0.0
+        history = self.history
+        if len(history):
+            dt = time.ticks_diff(now_ms, history.stamp()) / 1000
+            if 0 < dt * 1000 <= BallTracker.RESET_MS:
+                self.vx = (x - history.get(0)) / dt
+                self.vy = (y - history.get(1)) / dt
+
+    def miss(self, now_ms: int = None) -> bool:
+        """Predicts the ball in a frame where it wasn't seen.
+
+        Returns:
+            True if the ball is still tracked
+        """
+        if not self.tracking:
+            return False
+        self._coasted += 1
+        if self._coasted > BallTracker.MAX_COAST:
+            self.tracking = False
+            return False
+        now_ms = time.ticks_ms() if now_ms is None else now_ms
+        self._advance(time.ticks_diff(now_ms, self._last_ms) / 1000)
+        self._last_ms = now_ms
+        return True
+
+    def _advance(self, dt: float) -> None:
+        """Predicts the track dt seconds later: the ball and the robot move."""
+        x = self.x + self.vx * dt
+        y = self.y + (self.vy - self._forward) * dt
+        # The robot turns clockwise: the ball turns the other way around it
+        angle = self._spin * dt
+        cos, sin = math.cos(angle), math.sin(angle)
+        self.x, self.y = x * cos - y * sin, x * sin + y * cos
+        vx, vy = self.vx, self.vy
+        self.vx, self.vy = vx * cos - vy * sin, vx * sin + vy * cos
+
+    def intercept(self) -> tuple:
+        """Returns where to meet the ball: (heading in degrees, distance in mm)."""
+        speed = BallTracker.MAX_SPEED * BallTracker.MM_PER_RPM_S
+        lead = math.sqrt(self.x * self.x + self.y * self.y) / speed
+        for _ in range(2):  # the meeting point moves with the time to reach it
+            if lead > BallTracker.MAX_LEAD_S:
+                lead = BallTracker.MAX_LEAD_S
+            px, py = self.x + self.vx * lead, self.y + self.vy * lead
+            lead = math.sqrt(px * px + py * py) / speed
+        return math.degrees(math.atan2(px, py)), math.sqrt(px * px + py * py)
+
+    def command(self):
+        """Returns the speeds (RPM) of the motors to intercept the ball.
+
+        Returns:
+            (lspeed, rspeed) for Robot.run(), None if the ball isn't tracked
+        """
+        if not self.tracking:
+            self._forward = self._spin = 0.0
+            return None
+        heading, distance = self.intercept()
+        turn = BallTracker.TURN_GAIN * heading
+        if turn > BallTracker.MAX_TURN:
+            turn = BallTracker.MAX_TURN
+        elif turn < -BallTracker.MAX_TURN:
+            turn = -BallTracker.MAX_TURN
+        forward = BallTracker.MAX_SPEED
+        if distance < BallTracker.SLOW_DOWN:
+            forward = (
+                BallTracker.MIN_SPEED
+                + (BallTracker.MAX_SPEED - BallTracker.MIN_SPEED)
+                * distance
+                / BallTracker.SLOW_DOWN
+            )
+        # Turns on the spot when the ball is on the side or behind
+        forward *= max(0.0, math.cos(math.radians(heading)))
+        lspeed, rspeed = round(forward + turn), round(turn - forward)
+        # The motors are mounted mirrored (see Robot.run)
+        self._forward = (lspeed - rspeed) / 2 * BallTracker.MM_PER_RPM_S
+        self._spin = (lspeed + rspeed) * BallTracker.MM_PER_RPM_S / self.track
+        return lspeed, rspeed
@@ -2,15 +2,22 @@
 # https://docs.python.org/3/howto/logging.html
 
 import sys
+import uasyncio as asyncio
+import uos as os
+import ustruct as struct
 import utime as time
 
 _START_TIME = time.time()
 LEVELS = {"DEBUG": 0, "INFO": 1, "WARNING": 2, "ERROR": 3, "CRITICAL": 4}
+NAMES = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+DISABLED = 5  # above every level: nothing is logged
 
 
 class Handler:
     """A class that gives general methods of a handler used for I/O operations."""
 
+    raw = False  # True if the handler gets records through record(), unformatted
+
     def __init__(self):
         self._level = 1  # default to INFO
         self._formatter = "{level} -> {message}"  # default format
@@ -29,6 +36,14 @@ class Handler:
             # if level is a string, get its associated number
             level = LEVELS.get(level)
         self._level = level
+        Logger.invalidate()
+
+    def emit(self, level: int, content: str) -> None:
+        """Writes a formatted record of the given level (an int from 0 to 4)."""
+        self.write(content)
+
+    def flush(self) -> None:
+        """Writes what the handler may keep in memory, nothing by default."""
 
 
 class FileHandler(Handler):
@@ -57,6 +72,263 @@ class FileHandler(Handler):
             logfile.flush()
 
 
+class BufferedFileHandler(FileHandler):
+    """A file handler that writes records by batches.
+
+    Records are appended to a preallocated buffer, which is written to the
+    file by a background task when it is half full and every flush_ms, or
+    at once for a record of flush_level (CRITICAL by default).
+    A record that doesn't fit in the buffer is dropped and counted, the
+    count is written with the next batch. When the file would exceed
+    max_bytes, it is renamed file.1 (file.1 becomes file.2 and so on, up to
+    backups files) and a new one is started.
+
+    Attributes:
+        file: the file path
+        dropped: number of records dropped because the buffer was full
+        flushes: number of batches written
+        rotations: number of times the file was rotated
+    """
+
+    def __init__(
+        self,
+        file: str,
+        size: int = 4096,
+        flush_ms: int = 1000,
+        flush_level: int = 4,
+        max_bytes: int = 65536,
+        backups: int = 2,
+    ):
+        super().__init__(file)
+        self.flush_ms = flush_ms
+        self.flush_level = flush_level
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self.flushes = 0
+        self.rotations = 0
+        self._buffer = bytearray(size)
+        self._used = 0
+        self._reported = 0  # dropped records already written in the file
+        try:
+            self._file_size = os.stat(file)[6]
+        except OSError:
+            self._file_size = 0
+        self._event = asyncio.Event()
+        self._task = None
+
+    def write(self, content: str) -> None:
+        """Appends a line to the buffer, or drops it if the buffer is full."""
+        data = content.encode()
+        end = self._used + len(data) + 1
+        if end > len(self._buffer):
+            self.dropped += 1
+            self._event.set()
+            return
+        self._buffer[self._used : end - 1] = data
+        self._buffer[end - 1] = 0x0A  # newline
+        self._used = end
+
+    def emit(self, level: int, content: str) -> None:
+        self.write(content)
+        self._written(level)
+
+    def _written(self, level: int) -> None:
+        """Flushes now, or wakes up the flushing task, after a record."""
+        if level >= self.flush_level:
+            self.flush()
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+        if self._used * 2 >= len(self._buffer):
+            self._event.set()
+
+    def flush(self) -> None:
+        """Writes the buffer to the file, rotating it if it's too big."""
+        if not self._used and self.dropped == self._reported:
+            return
+        note = b""
+        if self.dropped != self._reported:
+            note = self._dropped_note(self.dropped - self._reported)
+            self._reported = self.dropped
+        size = self._used + len(note)
+        if self._file_size and self._file_size + size > self.max_bytes:
+            self._rotate()
+        with open(self.file, "ab") as logfile:
+            if not self._file_size:
+                preamble = self._preamble()
+                logfile.write(preamble)
+                size += len(preamble)
+            logfile.write(memoryview(self._buffer)[: self._used])
+            if note:
+                logfile.write(note)
+        self._file_size += size
+        self._used = 0
+        self.flushes += 1
+
+    @staticmethod
+    def _preamble() -> bytes:
+        """What a new file starts with."""
+        return b""
+
+    @staticmethod
+    def _dropped_note(count: int) -> bytes:
+        return "WARNING: ulogging -> {} records dropped\n".format(count).encode()
+
+    def _rotate(self) -> None:
+        """Shifts file.N-1 to file.N (the oldest is lost), then file to file.1."""
+        for index in range(self.backups, 0, -1):
+            source = self.file if index == 1 else "{}.{}".format(self.file, index - 1)
+            target = "{}.{}".format(self.file, index)
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+            try:
+                os.rename(source, target)
+            except OSError:
+                pass
+        if not self.backups:
+            try:
+                os.remove(self.file)
+            except OSError:
+                pass
+        self._file_size = 0
+        self.rotations += 1
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for_ms(self._event.wait(), self.flush_ms)
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+            self.flush()
+
+
+class BinaryHandler(BufferedFileHandler):
+    """A buffered file handler that writes binary records, never formatted.
+
+    Logger names and messages are interned: each one is written once in a
+    definition record, then referred to by its id. A record is a header
+    (level, name id, number of args, message id, args' types, ticks_ms)
+    followed by its args: int32, float32, or a short utf-8 string for any
+    other type. Every file starts with MAGIC and the definitions known so
+    far. Decode it with host/logdecode.py.
+
+    Formatting the records costs nothing on the camera, so it suits per
+    frame telemetry. A logger with many numeric args makes compact records:
+    logger.debug("angle {} distance {}", angle, distance)
+    """
+
+    raw = True  # gets the records' args instead of a formatted line
+    MAGIC = b"ULOG\x01"
+    RECORD = "<BBBHHI"  # level, name, nargs, message, types, ticks_ms
+    RECORD_SIZE = 11
+    NAME = 0x80  # definition of a logger name: id (B), length (B), utf-8
+    MESSAGE = 0x81  # definition of a message: id (H), length (H), utf-8
+    DROPPED = 0x82  # records dropped: count (I)
+    MAX_ARGS = 8  # 2 bits of types per arg: 0 int, 1 float, 2 string
+
+    def __init__(self, file: str, **kwargs):
+        super().__init__(file, **kwargs)
+        self._names = {}
+        self._messages = {}
+
+    def record(self, level: int, name: str, message: str, args: tuple) -> None:
+        """Appends a record to the buffer, or drops it if the buffer is full."""
+        name_id = self._intern(name, self._names, BinaryHandler.NAME, "<BBB")
+        message_id = self._intern(
+            message, self._messages, BinaryHandler.MESSAGE, "<BHH"
+        )
+        if name_id < 0 or message_id < 0:
+            self.dropped += 1
+            self._event.set()
+            return
+        buffer, offset = self._buffer, self._used + BinaryHandler.RECORD_SIZE
+        nargs = (
+            len(args) if len(args) < BinaryHandler.MAX_ARGS else BinaryHandler.MAX_ARGS
+        )
+        types = 0
+        for i in range(nargs):
+            arg = args[i]
+            if isinstance(arg, int) and -0x80000000 <= arg <= 0x7FFFFFFF:
+                end = offset + 4
+                if end > len(buffer):
+                    break
+                struct.pack_into("<i", buffer, offset, arg)
+            elif isinstance(arg, float):
+                end = offset + 4
+                if end > len(buffer):
+                    break
+                struct.pack_into("<f", buffer, offset, arg)
+                types |= 1 << (2 * i)
+            else:
+                data = str(arg).encode()[:255]
+                end = offset + 1 + len(data)
+                if end > len(buffer):
+                    break
+                buffer[offset] = len(data)
+                buffer[offset + 1 : end] = data
+                types |= 2 << (2 * i)
+            offset = end
+        else:
+            if offset <= len(buffer):
+                struct.pack_into(
+                    BinaryHandler.RECORD,
+                    buffer,
+                    self._used,
+                    level,
+                    name_id,
+                    nargs,
+                    message_id,
+                    types,
+                    time.ticks_ms(),
+                )
+                self._used = offset
+                self._written(level)
+                return
+        self.dropped += 1
+        self._event.set()
+
+    def _intern(self, text: str, table: dict, kind: int, fmt: str) -> int:
+        """Returns the id of a name or a message, defining it if it's new.
+
+        Returns:
+            id: -1 if the definition doesn't fit in the buffer
+        """
+        if text in table:
+            return table[text]
+        data = self._definition(kind, fmt, len(table), text)
+        end = self._used + len(data)
+        if end > len(self._buffer):
+            return -1
+        self._buffer[self._used : end] = data
+        self._used = end
+        table[text] = len(table)
+        return table[text]
+
+    @staticmethod
+    def _definition(kind: int, fmt: str, ident: int, text: str) -> bytes:
+        data = text.encode()
+        return struct.pack(fmt, kind, ident, len(data)) + data
+
+    def _preamble(self) -> bytes:
+        """MAGIC then every definition, records in the buffer may use them."""
+        parts = [BinaryHandler.MAGIC]
+        for name, ident in self._names.items():
+            parts.append(self._definition(BinaryHandler.NAME, "<BBB", ident, name))
+        for message, ident in self._messages.items():
+            parts.append(
+                self._definition(BinaryHandler.MESSAGE, "<BHH", ident, message)
+            )
+        return b"".join(parts)
+
+    @staticmethod
+    def _dropped_note(count: int) -> bytes:
+        return struct.pack("<BI", BinaryHandler.DROPPED, count)
+
+
 class StreamHandler(Handler):
     """A handler used to write logs in the output console
 
@@ -81,6 +353,13 @@ class Logger:
 
     Conventionnal usage:
     logger = logging.Logger(__name__)
+    logger.debug("angle: {} distance: {}", angle, distance)
+
+    Arguments are only formatted (with str.format, "{}" fields) when a
+    handler accepts the record. The handlers of a logger, root's included,
+    are flattened in a list that is kept until a level, a handler or
+    propagate changes: a rejected record costs one comparison and allocates
+    nothing but the tuple of its arguments.
 
     Attributes:
         name: The logger's name
@@ -89,6 +368,8 @@ class Logger:
 
     # A dict containing all instances of logger, we can get a logger with its name
     LOGGERS = {}
+    # Incremented on every change that can alter the handlers' cache
+    GENERATION = 0
 
     def __new__(cls, name: str):
         """The real constructor,
@@ -103,25 +384,82 @@ class Logger:
         return cls.LOGGERS[name]
 
     def __init__(self, name: str):
-        """Initialize the logger.
+        """Initialize the logger, unless it already exists.
 
         Args:
             name (str): the logger's name
         """
+        if hasattr(self, "name"):
+            return  # __new__ returned an existing logger, keep its handlers
         self.name = name
         self._level = 1  # default to INFO
         self._handlers = []
-        self.propagate = True
+        self._propagate = True
+        self._cache = []  # handlers of the logger then root's ones
+        self._threshold = DISABLED  # lowest level written by a handler
+        self._generation = -1
+        Logger.invalidate()
 
-    def __getattr__(self, name: str):
-        """
-        Used to perform logging with a given level:
-        logger.info(...) will call __getattr__(self, "info")
+    @staticmethod
+    def invalidate() -> None:
+        """Marks the handlers' cache of every logger as outdated."""
+        Logger.GENERATION += 1
+
+    @property
+    def propagate(self) -> bool:
+        return self._propagate
+
+    @propagate.setter
+    def propagate(self, value: bool) -> None:
+        self._propagate = value
+        Logger.invalidate()
+
+    def _refresh(self) -> None:
+        """Flattens the handlers and computes the lowest level written."""
+        cache = list(self._handlers)
+        if self.name != "root" and self._propagate and "root" in self.LOGGERS:
+            cache.extend(self.LOGGERS["root"]._handlers)
+        threshold = DISABLED
+        for handler in cache:
+            if handler.level < threshold:
+                threshold = handler.level
+        self._cache = cache
+        self._threshold = threshold if threshold > self._level else self._level
+        self._generation = Logger.GENERATION
+
+    def enabled_for(self, level: int) -> bool:
+        """True if a record of this level would be written by a handler.
+
+        Useful to skip the computation of arguments in a hot loop.
+
+        Args:
+            level: an int from 0 (DEBUG) to 4 (CRITICAL)
         """
-        if name.upper() in LEVELS:
-            return lambda message: self.log(name.upper(), message)
+        if self._generation != Logger.GENERATION:
+            self._refresh()
+        return level >= self._threshold
+
+    def debug(self, message: str, *args) -> None:
+        if self.enabled_for(0):
+            self._emit(0, message, args)
+
+    def info(self, message: str, *args) -> None:
+        if self.enabled_for(1):
+            self._emit(1, message, args)
 
-    def log(self, level: str, message: str) -> None:
+    def warning(self, message: str, *args) -> None:
+        if self.enabled_for(2):
+            self._emit(2, message, args)
+
+    def error(self, message: str, *args) -> None:
+        if self.enabled_for(3):
+            self._emit(3, message, args)
+
+    def critical(self, message: str, *args) -> None:
+        if self.enabled_for(4):
+            self._emit(4, message, args)
+
+    def log(self, level, message: str, *args) -> None:
         """Write a log line in a file.
 
         Tests if the log's request level is superior to the logger level,
@@ -131,17 +469,32 @@ class Logger:
         Args:
             level: Can be DEBUG, INFO, WARNING, ERROR or CRITICAL, or a int from 0 to 4.
             message: The message to write.
+            args: arguments of the message, formatted only if it is written
         """
-        if self._level <= LEVELS[level]:
-            for handler in self.handlers:
-                content = handler.formatter.format(
-                    level=level,
-                    name=self.name,
-                    time=time.time() - _START_TIME,
-                    message=message,
-                )
-                if handler.level <= LEVELS[level]:
-                    handler.write(content)
+        if isinstance(level, str):
+            level = LEVELS[level]
+        if self.enabled_for(level):
+            self._emit(level, message, args)
+
+    def _emit(self, level: int, message: str, args: tuple) -> None:
+        text = None
+        for handler in self._cache:
+            if handler.level > level:
+                continue
+            if handler.raw:
+                handler.record(level, self.name, message, args)
+                continue
+            if text is None:
+                text = message
+                if args:
+                    text = message.format(*args)
+                elapsed = time.time() - _START_TIME
+            handler.emit(
+                level,
+                handler.formatter.format(
+                    level=NAMES[level], name=self.name, time=elapsed, message=text
+                ),
+            )
 
     @property
     def handlers(self) -> list:
@@ -152,9 +505,9 @@ class Logger:
         Returns:
             A list of all handlers.
         """
-        if self.name != "root" and self.propagate and "root" in self.LOGGERS:
-            return self._handlers + self.LOGGERS["root"].handlers
-        return self._handlers
+        if self._generation != Logger.GENERATION:
+            self._refresh()
+        return self._cache
 
     def set_level(self, level) -> None:
         """Sets the logger's level.
@@ -165,6 +518,7 @@ class Logger:
         if isinstance(level, str):
             level = LEVELS.get(level)
         self._level = level
+        Logger.invalidate()
 
     def add_handler(self, handler: Handler) -> None:
         """Add an Handler instance to the logger.
@@ -173,6 +527,7 @@ class Logger:
             handler: A Handler class (FileHandler or StreamHandler)
         """
         self._handlers.append(handler)
+        Logger.invalidate()
 
     def __repr__(self) -> str:
         return "Logger(name={}, level={})".format(self.name, self._level)
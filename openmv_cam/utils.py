@@ -1,26 +1,260 @@
+import array
+
 import uasyncio as asyncio
+import utime as time
+
+from tracing import tracer
+import ulogging as logging
+
+logger = logging.Logger(__name__)
+
+TIMER = tracer.span("timer")
+
+
+class TimerService:
+    """A single task that fires the callbacks of all the timers.
+
+    Pending timers are kept in a binary min-heap ordered by deadline, indexed
+    by handle so that a timer can be rescheduled or cancelled in place. All
+    the arrays are preallocated: scheduling doesn't allocate any memory.
+    The task sleeps until the earliest deadline, TICK_MS at most, so that a
+    timer scheduled in the meantime is not delayed more than that.
+
+    Conventionnal usage:
+    service = TimerService()  # the same instance is always returned
+    handle = service.register(callback)
+    service.schedule(handle, 500)
+
+    Attributes:
+        fired: number of callbacks called
+        latency_last_ms, latency_max_ms, latency_total_ms:
+            delay between the deadline of a timer and the call of its callback
+    """
+
+    CAPACITY = 16  # maximum number of registered timers
+    TICK_MS = 5
+    INSTANCE = None
+
+    def __new__(cls):
+        """Returns the shared instance, or creates it."""
+        if cls.INSTANCE is None:
+            cls.INSTANCE = super().__new__(cls)
+            cls.INSTANCE._setup()
+        return cls.INSTANCE
+
+    def _setup(self) -> None:
+        self.fired = 0
+        self.latency_last_ms = 0
+        self.latency_max_ms = 0
+        self.latency_total_ms = 0
+        self._callbacks = []
+        self._deadlines = array.array("i", [0] * TimerService.CAPACITY)
+        self._heap = array.array("h", [0] * TimerService.CAPACITY)  # handles
+        self._pos = array.array("h", [-1] * TimerService.CAPACITY)  # heap indexes
+        self._size = 0
+        self._event = asyncio.Event()
+        self._task = None
+
+    @property
+    def live(self) -> int:
+        """The number of pending timers."""
+        return self._size
+
+    def register(self, callback) -> int:
+        """Registers a callback, once for all.
+
+        Args:
+            callback: a coroutine function, called without arguments
+
+        Returns:
+            handle: the id of the timer
+        """
+        if len(self._callbacks) >= TimerService.CAPACITY:
+            raise RuntimeError("Too many timers")
+        self._callbacks.append(callback)
+        return len(self._callbacks) - 1
+
+    def pending(self, handle: int) -> bool:
+        return self._pos[handle] >= 0
+
+    def schedule(self, handle: int, delay: int) -> None:
+        """Schedules (or reschedules) the call of a timer's callback.
+
+        Args:
+            handle: the id returned by register()
+            delay: in milliseconds
+        """
+        self._deadlines[handle] = time.ticks_add(time.ticks_ms(), delay)
+        i = self._pos[handle]
+        if i < 0:
+            i = self._size
+            self._heap[i] = handle
+            self._pos[handle] = i
+            self._size += 1
+            self._up(i)
+        else:
+            self._up(i)
+            self._down(self._pos[handle])
+        self._event.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, handle: int) -> None:
+        """Cancels a timer if it is pending.
+
+        Args:
+            handle: the id returned by register()
+        """
+        i = self._pos[handle]
+        if i < 0:
+            return
+        last = self._size - 1
+        if i != last:
+            self._swap(i, last)
+        self._size -= 1
+        self._pos[handle] = -1
+        if i < self._size:
+            moved = self._heap[i]
+            self._up(i)
+            self._down(self._pos[moved])
+
+    def latency_mean_ms(self) -> float:
+        return self.latency_total_ms / self.fired if self.fired else 0.0
+
+    async def _run(self) -> None:
+        while True:
+            if self._size == 0:
+                self._event.clear()
+                await self._event.wait()
+                continue
+            handle = self._heap[0]
+            wait = time.ticks_diff(self._deadlines[handle], time.ticks_ms())
+            if wait > 0:
+                tick = TimerService.TICK_MS
+                await asyncio.sleep_ms(wait if wait < tick else tick)
+                continue
+            self.cancel(handle)
+            self.fired += 1
+            self.latency_last_ms = -wait
+            self.latency_total_ms -= wait
+            if -wait > self.latency_max_ms:
+                self.latency_max_ms = -wait
+            start = tracer.begin()
+            try:
+                await self._callbacks[handle]()
+            except Exception as error:  # a timer must not stop the others
+                logger.error("Timer {} failed: {}", handle, error)
+            tracer.end(TIMER, start)
+
+    def _less(self, i: int, j: int) -> bool:
+        deadlines, heap = self._deadlines, self._heap
+        return time.ticks_diff(deadlines[heap[i]], deadlines[heap[j]]) < 0
+
+    def _swap(self, i: int, j: int) -> None:
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._pos[heap[i]] = i
+        self._pos[heap[j]] = j
+
+    def _up(self, i: int) -> None:
+        while i > 0:
+            parent = (i - 1) // 2
+            if not self._less(i, parent):
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _down(self, i: int) -> None:
+        while True:
+            child = 2 * i + 1
+            if child >= self._size:
+                break
+            if child + 1 < self._size and self._less(child + 1, child):
+                child += 1
+            if not self._less(child, i):
+                break
+            self._swap(child, i)
+            i = child
 
 
 class Timer:
-    """A class that provides an asynchronous timer, to schedule a function execution."""
+    """A class that provides an asynchronous timer, to schedule a function execution.
+
+    All timers are fired by the shared TimerService, starting or cancelling
+    one doesn't create any task.
+    """
 
     def __init__(self, callback):
-        self._callback = callback
-        self._task = None
+        self._service = TimerService()
+        self._handle = self._service.register(callback)
 
     def start(self, timeout: int) -> None:
         """Starts the timer and schedule the callback call.
 
+        A timer already started is rescheduled.
+
         Args:
             timeout: in seconds, time to wait
         """
-        self._task = asyncio.create_task(self._job(timeout))
-
-    async def _job(self, timeout):
-        await asyncio.sleep_ms(round(timeout * 1000))
-        await self._callback()
+        self._service.schedule(self._handle, round(timeout * 1000))
 
     def cancel(self) -> None:
-        """Cancel the tasks if exists."""
-        if self._task:
-            self._task.cancel()
+        """Cancel the timer if it is pending."""
+        self._service.cancel(self._handle)
+
+    @property
+    def pending(self) -> bool:
+        return self._service.pending(self._handle)
+
+
+class Ring:
+    """A fixed-size ring of timestamped records of 16 bits values.
+
+    Records are written in place, so that pushing one doesn't allocate:
+    write the values from ring.values[ring.start()], then call commit().
+
+    Args:
+        size: number of records kept
+        width: number of values of a record
+        typecode: "H" for unsigned values, "h" for signed ones
+    """
+
+    def __init__(self, size: int, width: int, typecode: str = "H"):
+        self.size = size
+        self.width = width
+        self.values = array.array(typecode, [0] * (size * width))
+        self.stamps = array.array("I", [0] * size)
+        self.count = 0  # number of records committed since the creation
+
+    def __len__(self) -> int:
+        return self.count if self.count < self.size else self.size
+
+    def start(self) -> int:
+        """Returns the index in values of the next record's first value."""
+        return (self.count % self.size) * self.width
+
+    def commit(self, stamp: int) -> None:
+        """Validates the record written after start().
+
+        Args:
+            stamp: its timestamp (ticks)
+        """
+        self.stamps[self.count % self.size] = stamp
+        self.count += 1
+
+    def get(self, field: int, age: int = 0) -> int:
+        """Returns a value of a record.
+
+        Args:
+            field: index of the value in the record
+            age: 0 for the latest record, 1 for the previous one...
+        """
+        if age >= len(self):
+            raise IndexError("Only {} records are available".format(len(self)))
+        return self.values[((self.count - 1 - age) % self.size) * self.width + field]
+
+    def stamp(self, age: int = 0) -> int:
+        """Returns the timestamp of a record (see get())."""
+        if age >= len(self):
+            raise IndexError("Only {} records are available".format(len(self)))
+        return self.stamps[(self.count - 1 - age) % self.size]